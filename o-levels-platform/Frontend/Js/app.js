@@ -8,6 +8,7 @@ const app = {
         subjects: [],
         currentSubject: null,
         resources: {},
+        searchResults: null,
         theme: 'light'
     },
 
@@ -142,6 +143,14 @@ async handleSignup() {
         document.getElementById('global-search').addEventListener('input', (e) => {
             this.handleSearch(e.target.value);
         });
+        document.getElementById('global-search').addEventListener('focus', () => {
+            if (this.state.searchResults) this.renderSearchResults();
+        });
+        document.addEventListener('click', (e) => {
+            if (!e.target.closest('.search-box')) {
+                document.getElementById('search-results')?.classList.remove('active');
+            }
+        });
     },
 
     // Check authentication status
@@ -472,13 +481,88 @@ getDemoSubjects() {
         }
     },
 
-    // Handle global search
+    // Handle global search (debounced, cancelling any in-flight request)
     handleSearch(query) {
-        if (query.length < 2) return;
+        clearTimeout(this.searchTimer);
+        if (this.searchController) this.searchController.abort();
+        if (query.length < 2) {
+            this.state.searchResults = null;
+            this.renderSearchResults();
+            return;
+        }
         
-        // Implement search functionality
-        console.log('Searching for:', query);
-        // This would typically make an API call to search endpoints
+        this.searchTimer = setTimeout(async () => {
+            this.searchController = new AbortController();
+            try {
+                const response = await fetch(`${API_BASE}/search?q=${encodeURIComponent(query)}&limit=10`, {
+                    signal: this.searchController.signal
+                });
+                if (response.ok) {
+                    const data = await response.json();
+                    this.state.searchResults = data;
+                    this.renderSearchResults();
+                }
+            } catch (error) {
+                if (error.name !== 'AbortError') console.error('Search error:', error);
+            }
+        }, 150);
+    },
+
+    // Render the global search dropdown
+    // Titles and snippets with highlights come from the server already escaped;
+    // every other field is escaped here
+    renderSearchResults() {
+        const container = document.getElementById('search-results');
+        if (!container) return;
+
+        const data = this.state.searchResults;
+        if (!data) {
+            container.classList.remove('active');
+            container.innerHTML = '';
+            return;
+        }
+
+        const resources = data.resources || [];
+        const questions = data.questions || [];
+        let html = '';
+
+        if (resources.length > 0) {
+            html += `<div class="search-results-section">Resources</div>`;
+            html += resources.map(resource => `
+                <div class="search-result" onclick="app.downloadResource(${Number(resource.id)})">
+                    <div class="search-result-title">${resource.title_highlight || this.escapeHtml(resource.title)}</div>
+                    <div class="search-result-meta">${this.escapeHtml(resource.subject_name)} &middot; ${this.escapeHtml(resource.resource_type)}</div>
+                    ${resource.snippet ? `<div class="search-result-snippet">${resource.snippet}</div>` : ''}
+                </div>
+            `).join('');
+        }
+
+        if (questions.length > 0) {
+            html += `<div class="search-results-section">Questions</div>`;
+            html += questions.map(question => `
+                <div class="search-result">
+                    <div class="search-result-snippet">${question.snippet || ''}</div>
+                    <div class="search-result-meta">${this.escapeHtml(question.subject_name)} &middot; ${this.escapeHtml(question.topic || question.question_type)} &middot; ${Number(question.marks) || 0} marks</div>
+                </div>
+            `).join('');
+        }
+
+        if (!html) {
+            html = `<div class="search-results-empty">No results for "${this.escapeHtml(data.query)}"</div>`;
+        }
+
+        container.innerHTML = html;
+        container.classList.add('active');
+    },
+
+    // Escape text for insertion into HTML
+    escapeHtml(text) {
+        return String(text ?? '')
+            .replace(/&/g, '&amp;')
+            .replace(/</g, '&lt;')
+            .replace(/>/g, '&gt;')
+            .replace(/"/g, '&quot;')
+            .replace(/'/g, '&#39;');
     },
 
     // Update UI based on user state
@@ -0,0 +1,118 @@
+"""Asynchronous, batched writer for the user_activity table.
+
+Request handlers enqueue activity rows and return immediately; a single
+background thread drains the queue and inserts rows with executemany, so
+activity logging never adds a commit to a request.
+"""
+import atexit
+import os
+import queue
+import threading
+from datetime import datetime, timezone
+from database import get_db
+
+QUEUE_SIZE = 10000  # rows buffered before new entries are dropped
+BATCH_SIZE = 200  # rows written per transaction
+FLUSH_INTERVAL = 1.0  # seconds to wait for more rows before writing a partial batch
+
+class ActivityLogger:
+    """Bounded queue of activity rows with a background batch writer.
+
+    When the queue is full new rows are dropped (and counted) rather than
+    blocking the request thread.
+    """
+
+    def __init__(self, queue_size=QUEUE_SIZE, batch_size=BATCH_SIZE, interval=FLUSH_INTERVAL):
+        self.batch_size = batch_size
+        self.interval = interval
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='activity-writer', daemon=True)
+            self._thread.start()
+
+    def log(self, user_id, activity_type, details=None, ip_address=None):
+        """Queue an activity row; returns False if it was dropped"""
+        self._ensure_thread()
+        # Timestamp now, in the same format as CURRENT_TIMESTAMP, so rows
+        # record when the activity happened rather than when they were written
+        activity_date = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        try:
+            self._queue.put_nowait((user_id, activity_type, details, activity_date, ip_address))
+            return True
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+
+    def _next_batch(self, timeout):
+        batch = []
+        try:
+            batch.append(self._queue.get(timeout=timeout))
+            while len(batch) < self.batch_size:
+                batch.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def _write(self, rows):
+        with self._write_lock:
+            db = get_db()
+            try:
+                db.executemany('''
+                    INSERT INTO user_activity (user_id, activity_type, activity_details, activity_date, ip_address)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', rows)
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                with self._lock:
+                    self.dropped += len(rows)
+                print(f"Activity log write failed, {len(rows)} rows lost: {e}")
+            finally:
+                db.close()
+
+    def _run(self):
+        while not self._stop.is_set() or not self._queue.empty():
+            batch = self._next_batch(self.interval)
+            if batch:
+                self._write(batch)
+
+    def flush(self):
+        """Synchronously write everything currently queued"""
+        while True:
+            batch = self._next_batch(0)
+            if not batch:
+                return
+            self._write(batch)
+
+    def close(self, timeout=5):
+        """Stop the writer thread after it drains the queue"""
+        self._stop.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout)
+        self.flush()
+
+activity_logger = ActivityLogger()
+
+def log_activity(user_id, activity_type, details=None, ip_address=None):
+    """Record a user activity without touching the database on this thread"""
+    return activity_logger.log(user_id, activity_type, details, ip_address)
+
+@atexit.register
+def _close_on_exit():
+    if activity_logger._pid == os.getpid():
+        activity_logger.close()
@@ -9,13 +9,25 @@ from routes.subjects import subjects_bp
 from routes.resources import resources_bp
 from routes.tests import tests_bp
 from routes.users import users_bp
-from database import init_db, get_db
+from routes.search import search_bp
+from routes.reviews import reviews_bp
+from routes.imports import imports_bp
+from routes.uploads import uploads_bp
+from database import init_db, init_app, get_db
+from catalog import subject_catalog
+from conditional import conditional
+from recommendations import recommender, load_resources
+from storage import blob_store, is_sha256, allowed_file, StorageError, UPLOAD_FOLDER
+from worker import queue_inspection
 
 app = Flask(__name__)
 app.secret_key = 'o-levels-platform-secret-key-2024'
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=7)
-app.config['UPLOAD_FOLDER'] = 'uploads'
+app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50MB max file size
+# Let the front proxy stream downloads: '', 'x-accel-redirect' (nginx) or 'x-sendfile' (Apache)
+app.config['DOWNLOAD_OFFLOAD'] = os.environ.get('DOWNLOAD_OFFLOAD', '')
+app.config['X_ACCEL_PREFIX'] = os.environ.get('X_ACCEL_PREFIX', '/protected-uploads/')
 
 # Initialize CORS
 CORS(app, supports_credentials=True, origins=["http://localhost:8000", "http://192.168.0.35:8000"])
@@ -26,121 +38,47 @@ app.register_blueprint(subjects_bp)
 app.register_blueprint(resources_bp)
 app.register_blueprint(tests_bp)
 app.register_blueprint(users_bp)
+app.register_blueprint(search_bp)
+app.register_blueprint(reviews_bp)
+app.register_blueprint(imports_bp)
+app.register_blueprint(uploads_bp)
 
-# Initialize database
+# Initialize database and connection pool
 init_db()
-
-# Sample data for subjects
-SUBJECTS_DATA = {
-    'mathematics': {
-        'id': 1,
-        'name': 'Mathematics',
-        'code': 'MATH',
-        'description': 'Comprehensive mathematics curriculum including algebra, geometry, calculus, and statistics',
-        'color': '#ff6b6b',
-        'icon': 'calculator',
-        'papers': [1, 2],
-        'topics': ['Algebra', 'Geometry', 'Trigonometry', 'Calculus', 'Statistics', 'Probability']
-    },
-    'computer_science': {
-        'id': 2,
-        'name': 'Computer Science',
-        'code': 'COMP',
-        'description': 'Computer programming, algorithms, data structures, and computer fundamentals',
-        'color': '#4ecdc4',
-        'icon': 'laptop-code',
-        'papers': [1, 2],
-        'topics': ['Programming', 'Algorithms', 'Data Structures', 'Databases', 'Computer Architecture']
-    },
-    'chemistry': {
-        'id': 3,
-        'name': 'Chemistry',
-        'code': 'CHEM',
-        'description': 'Study of elements, compounds, chemical reactions, and molecular structures',
-        'color': '#45b7d1',
-        'icon': 'flask',
-        'papers': [1, 2, 3],
-        'topics': ['Organic Chemistry', 'Inorganic Chemistry', 'Physical Chemistry', 'Analytical Chemistry']
-    },
-    'physics': {
-        'id': 4,
-        'name': 'Physics',
-        'code': 'PHYS',
-        'description': 'Fundamental principles of matter, energy, motion, and the laws of the universe',
-        'color': '#ffa726',
-        'icon': 'atom',
-        'papers': [1, 2, 3],
-        'topics': ['Mechanics', 'Electricity', 'Magnetism', 'Thermodynamics', 'Waves', 'Modern Physics']
-    },
-    'english': {
-        'id': 5,
-        'name': 'English',
-        'code': 'ENG',
-        'description': 'Language skills, literature analysis, and communication techniques',
-        'color': '#ba68c8',
-        'icon': 'book-open',
-        'papers': [1, 2],
-        'topics': ['Grammar', 'Comprehension', 'Composition', 'Literature', 'Vocabulary']
-    },
-    'islamiat': {
-        'id': 6,
-        'name': 'Islamiat',
-        'code': 'ISL',
-        'description': 'Islamic studies including history, beliefs, practices, and moral teachings',
-        'color': '#66bb6a',
-        'icon': 'mosque',
-        'papers': [1, 2],
-        'topics': ['Quran', 'Hadith', 'Islamic History', 'Fiqh', 'Islamic Ethics']
-    },
-    'pakistan_studies': {
-        'id': 7,
-        'name': 'Pakistan Studies',
-        'code': 'PST',
-        'description': 'History, culture, geography, and political development of Pakistan',
-        'color': '#78909c',
-        'icon': 'globe-asia',
-        'papers': [1, 2],
-        'topics': ['Pakistan Movement', 'Geography', 'Culture', 'Economy', 'Political System']
-    }
-}
-
-
+init_app(app)
 
 @app.route('/')
 def index():
     """Serve the main application"""
     return render_template('index.html')
 
-@app.route('/api/subjects')
-def get_subjects():
-    """Get all available subjects"""
-    return jsonify({
-        'success': True,
-        'subjects': SUBJECTS_DATA
-    })
-
 @app.route('/api/subjects/<subject_name>')
+@conditional('subjects', 'resources')
 def get_subject_detail(subject_name):
-    """Get detailed information about a specific subject"""
-    subject = SUBJECTS_DATA.get(subject_name)
-    if not subject:
-        return jsonify({'success': False, 'error': 'Subject not found'}), 404
-    
-    # Get resources for this subject
+    """Get detailed information about a specific subject by slug or code"""
     db = get_db()
-    resources = db.execute('''
-        SELECT * FROM resources WHERE subject_id = ? ORDER BY created_at DESC
-    ''', (subject['id'],)).fetchall()
     
-    subject_resources = []
-    for resource in resources:
-        subject_resources.append(dict(resource))
-    
-    return jsonify({
-        'success': True,
-        'subject': subject,
-        'resources': subject_resources
-    })
+    try:
+        subject = subject_catalog.get(db, subject_name)
+        if not subject:
+            return jsonify({'success': False, 'error': 'Subject not found'}), 404
+        
+        # Get resources for this subject
+        resources = db.execute('''
+            SELECT * FROM resources WHERE subject_id = ? ORDER BY created_at DESC
+        ''', (subject['id'],)).fetchall()
+        
+        subject_resources = []
+        for resource in resources:
+            subject_resources.append(dict(resource))
+        
+        return jsonify({
+            'success': True,
+            'subject': subject,
+            'resources': subject_resources
+        })
+    finally:
+        db.close()
 
 @app.route('/api/dashboard/stats')
 @login_required
@@ -165,38 +103,74 @@ def dashboard_stats():
         LIMIT 10
     ''', (user_id,)).fetchall()
     
+    # What to study next
+    recommended = load_resources(db, recommender.recommend(db, user_id, limit=5))
+    
     return jsonify({
         'success': True,
         'progress': [dict(p) for p in progress],
-        'recent_activity': [dict(a) for a in activity]
+        'recent_activity': [dict(a) for a in activity],
+        'recommendations': recommended
     })
 
 @app.route('/api/upload', methods=['POST'])
 @login_required
 def upload_file():
-    """Handle file uploads for resources"""
-    if 'file' not in request.files:
+    """Handle file uploads for resources.
+
+    Accepts a multipart "file" field, or the raw file as the request body
+    (application/octet-stream) named by ?filename=. Send the file's SHA-256
+    as X-Content-SHA256 (or ?sha256=) to skip the transfer when the same
+    content is already stored; it is also checked against what arrives.
+    """
+    if 'file' in request.files:
+        file = request.files['file']
+        filename, stream = file.filename, file.stream
+    elif request.mimetype == 'application/octet-stream':
+        filename = request.args.get('filename') or request.headers.get('X-Filename', '')
+        stream = request.stream
+    else:
         return jsonify({'success': False, 'error': 'No file provided'}), 400
     
-    file = request.files['file']
-    if file.filename == '':
+    if filename == '':
         return jsonify({'success': False, 'error': 'No file selected'}), 400
     
     # Validate file type
-    allowed_extensions = {'pdf', 'doc', 'docx', 'ppt', 'pptx', 'jpg', 'jpeg', 'png', 'mp4', 'avi', 'mov'}
-    if '.' not in file.filename or file.filename.rsplit('.', 1)[1].lower() not in allowed_extensions:
+    if not allowed_file(filename):
         return jsonify({'success': False, 'error': 'File type not allowed'}), 400
     
-    # Save file
-    filename = f"{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}_{file.filename}"
-    file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    file.save(file_path)
+    expected = (request.headers.get('X-Content-SHA256') or request.args.get('sha256') or '').lower() or None
+    if expected and not is_sha256(expected):
+        return jsonify({'success': False, 'error': 'Invalid SHA-256'}), 400
     
-    return jsonify({
-        'success': True,
-        'filename': filename,
-        'message': 'File uploaded successfully'
-    })
+    db = get_db()
+    
+    try:
+        blob = blob_store.find(db, expected) if expected else None
+        created = False
+        if blob is not None:
+            blob_store.touch(db, blob['sha256'])
+        else:
+            blob, created = blob_store.store_stream(db, stream, filename, expected)
+        
+        # Page count, duration and an integrity check come from the worker
+        job_id = queue_inspection(db, blob)
+        
+        return jsonify({
+            'success': True,
+            'filename': os.path.basename(blob['path']),
+            'file_path': blob['path'],
+            'file_size': blob['size'],
+            'sha256': blob['sha256'],
+            'deduplicated': not created,
+            'job_id': job_id,
+            'message': 'File uploaded successfully'
+        })
+        
+    except StorageError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    finally:
+        db.close()
 
 @app.errorhandler(404)
 def not_found(error):
@@ -0,0 +1,142 @@
+"""Test assembly: choose questions whose marks add up to a target exactly.
+
+The marks side is a bounded subset-sum problem. Questions with the same
+marks are interchangeable for the sum, so the solver works on mark values
+and their available counts (binary-split into 1, 2, 4, ... bundles) with
+a bitset DP, which is independent of how many questions are in the bank.
+Only once the number of questions per mark value is fixed are concrete
+questions drawn, from small random samples, favouring topics and question
+types used least so far.
+"""
+import random
+
+# How many random candidates to consider for each question picked
+SAMPLE_FACTOR = 4
+
+# Cap each mark value at SHARE_FACTOR times its even share of the target,
+# so cheap 1-mark questions cannot crowd out everything else
+SHARE_FACTOR = 2
+
+# Presentation order of question types in an assembled test
+TYPE_ORDER = {'mcq': 0, 'short': 1, 'long': 2}
+
+# Largest target accepted; the bitset DP grows with the target
+MAX_TOTAL_MARKS = 500
+
+def group_by_marks(candidates):
+    """Group (id, marks, topic, question_type) tuples by marks"""
+    groups = {}
+    for candidate in candidates:
+        if candidate[1] and candidate[1] > 0:
+            groups.setdefault(candidate[1], []).append(candidate)
+    return groups
+
+def _bundles(marks, available, target):
+    """Binary-split up to target // marks copies of a mark value into bundles"""
+    count = min(available, target // marks)
+    size = 1
+    while count > 0:
+        take = min(size, count)
+        yield marks, take
+        count -= take
+        size *= 2
+
+def solve_mark_counts(counts, target, rng):
+    """Choose how many questions of each mark value to use.
+
+    ``counts`` maps marks -> questions available. Returns (achieved, {marks: n})
+    where achieved is target when reachable, otherwise the closest total
+    below it. Bundle order is shuffled so equal-cost solutions vary by seed.
+    """
+    bundles = [b for marks, available in counts.items() for b in _bundles(marks, available, target)]
+    rng.shuffle(bundles)
+    
+    mask = (1 << (target + 1)) - 1
+    reachable = 1  # bit s set <=> total s is reachable
+    parent = {0: None}  # total -> bundle index that first reached it
+    
+    for index, (marks, take) in enumerate(bundles):
+        weight = marks * take
+        grown = (reachable | (reachable << weight)) & mask
+        new = grown & ~reachable
+        while new:
+            low = new & -new
+            parent[low.bit_length() - 1] = index
+            new ^= low
+        reachable = grown
+        if reachable >> target & 1:
+            break
+    
+    achieved = reachable.bit_length() - 1
+    
+    # Each total was first reached by a bundle later than the one that
+    # reached the remainder, so walking back never reuses a bundle
+    chosen = {}
+    total = achieved
+    while total:
+        marks, take = bundles[parent[total]]
+        chosen[marks] = chosen.get(marks, 0) + take
+        total -= marks * take
+    return achieved, chosen
+
+def _sample(group, count, rng):
+    """Random sample of a group; groups with their own sample() avoid expanding"""
+    if hasattr(group, 'sample'):
+        return group.sample(rng, count)
+    return rng.sample(group, count)
+
+def _pick_balanced(pool, count, topic_used, type_used, rng):
+    """Pick count candidates from a shuffled pool, preferring least-used topics then types.
+
+    Each pick looks at a window at the front of the pool, so the cost is
+    linear in count rather than in count * len(pool).
+    """
+    picked = []
+    pool = list(pool)
+    window = SAMPLE_FACTOR * 2
+    for _ in range(count):
+        best_index, best_key = None, None
+        for index, candidate in enumerate(pool[:window]):
+            key = (topic_used.get(candidate[2], 0), type_used.get(candidate[3], 0), rng.random())
+            if best_key is None or key < best_key:
+                best_index, best_key = index, key
+        candidate = pool.pop(best_index)
+        topic_used[candidate[2]] = topic_used.get(candidate[2], 0) + 1
+        type_used[candidate[3]] = type_used.get(candidate[3], 0) + 1
+        picked.append(candidate)
+    return picked
+
+def assemble(groups, target, seed=None, ranked=False):
+    """Assemble a test from candidates grouped by marks.
+
+    ``groups`` maps marks -> sequence of (id, marks, topic, question_type),
+    such as the lists from group_by_marks() or question index groups.
+    With ``ranked``, each group is ordered best first and questions are
+    picked from its head instead of a random sample.
+    Returns (selected candidates, total marks).
+    """
+    rng = random.Random(seed)
+    counts = {marks: len(group) for marks, group in groups.items() if 0 < marks <= target}
+    if not counts or target <= 0:
+        return [], 0
+    
+    # Prefer a balanced mix of mark values; fall back to any mix that fits
+    share = max(1, target // len(counts))
+    capped = {marks: min(n, max(1, SHARE_FACTOR * share // marks)) for marks, n in counts.items()}
+    achieved, chosen = solve_mark_counts(capped, target, rng)
+    if achieved < target and capped != counts:
+        achieved, chosen = solve_mark_counts(counts, target, rng)
+    
+    topic_used, type_used = {}, {}
+    selected = []
+    mark_values = list(chosen)
+    rng.shuffle(mark_values)
+    for marks in mark_values:
+        group = groups[marks]
+        needed = chosen[marks]
+        size = min(len(group), needed * SAMPLE_FACTOR)
+        pool = list(group[:size]) if ranked else _sample(group, size, rng)
+        selected.extend(_pick_balanced(pool, needed, topic_used, type_used, rng))
+    
+    selected.sort(key=lambda c: (TYPE_ORDER.get(c[3], len(TYPE_ORDER)), c[1], c[0]))
+    return selected, achieved
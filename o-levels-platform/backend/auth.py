@@ -1,7 +1,8 @@
 from flask import Blueprint, request, jsonify, session
 import sqlite3
 from database import get_db
-import bcrypt
+from activity import log_activity
+from passwords import password_hasher, HasherBusy, RETRY_AFTER
 import re
 
 auth_bp = Blueprint('auth', __name__)
@@ -28,12 +29,19 @@ def get_current_user_me():
     })
 
 def hash_password(password):
-    """Hash a password using bcrypt"""
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    """Hash a password using bcrypt (in the hashing pool; may raise HasherBusy)"""
+    return password_hasher.hash(password)
 
 def check_password(password, hashed):
-    """Check if password matches the hash"""
-    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+    """Check if password matches the hash (in the hashing pool; may raise HasherBusy)"""
+    return password_hasher.check(password, hashed)
+
+def busy_response():
+    """503 telling the client to retry when the hashing pool is full"""
+    response = jsonify({'success': False, 'error': 'Server is busy, please try again shortly'})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(RETRY_AFTER)
+    return response
 
 def is_valid_email(email):
     """Validate email format"""
@@ -99,11 +107,7 @@ def register():
         session.permanent = True
         
         # Log activity
-        db.execute('''
-            INSERT INTO user_activity (user_id, activity_type, activity_details)
-            VALUES (?, ?, ?)
-        ''', (user['id'], 'register', 'User registered successfully'))
-        db.commit()
+        log_activity(user['id'], 'register', 'User registered successfully', request.remote_addr)
         
         return jsonify({
             'success': True,
@@ -116,6 +120,8 @@ def register():
             }
         })
         
+    except HasherBusy:
+        return busy_response()
     except Exception as e:
         db.rollback()
         return jsonify({'success': False, 'error': 'Registration failed'}), 500
@@ -150,6 +156,16 @@ def login():
         if not check_password(password, user['password_hash']):
             return jsonify({'success': False, 'error': 'Invalid credentials'}), 401
         
+        # Store a new hash if the configured cost has changed; skipped under
+        # load. Hashed before any UPDATE so the write lock is never held
+        # while bcrypt runs
+        new_hash = None
+        if password_hasher.needs_rehash(user['password_hash']):
+            try:
+                new_hash = hash_password(password)
+            except HasherBusy:
+                pass
+        
         # Set session
         session['user_id'] = user['id']
         session['username'] = user['username']
@@ -159,15 +175,16 @@ def login():
         db.execute('''
             UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE id = ?
         ''', (user['id'],))
-        
-        # Log activity
-        db.execute('''
-            INSERT INTO user_activity (user_id, activity_type, activity_details)
-            VALUES (?, ?, ?)
-        ''', (user['id'], 'login', 'User logged in successfully'))
+        if new_hash:
+            db.execute('''
+                UPDATE users SET password_hash = ? WHERE id = ?
+            ''', (new_hash, user['id']))
         
         db.commit()
         
+        # Log activity
+        log_activity(user['id'], 'login', 'User logged in successfully', request.remote_addr)
+        
         return jsonify({
             'success': True,
             'message': 'Login successful',
@@ -179,6 +196,8 @@ def login():
             }
         })
         
+    except HasherBusy:
+        return busy_response()
     except Exception as e:
         return jsonify({'success': False, 'error': 'Login failed'}), 500
     finally:
@@ -190,18 +209,8 @@ def logout():
     user_id = session.get('user_id')
     
     if user_id:
-        db = get_db()
-        try:
-            # Log activity
-            db.execute('''
-                INSERT INTO user_activity (user_id, activity_type, activity_details)
-                VALUES (?, ?, ?)
-            ''', (user_id, 'logout', 'User logged out'))
-            db.commit()
-        except:
-            pass
-        finally:
-            db.close()
+        # Log activity
+        log_activity(user_id, 'logout', 'User logged out', request.remote_addr)
     
     session.clear()
     return jsonify({'success': True, 'message': 'Logout successful'})
@@ -0,0 +1,338 @@
+"""Streaming bulk import of questions and resources from CSV or NDJSON.
+
+Rows are read one at a time, validated and converted, and inserted with
+executemany in transactions of BATCH_SIZE rows, so memory stays flat
+however large the file is. Every row carries an import_key (given in the
+file, or derived from its content) with a unique index behind it; rows
+whose key is already present are skipped, so re-running an import is
+safe. Invalid rows are reported by line number and do not stop the import.
+Each batch's MinHash signatures are stored in the same transaction as its
+rows, and the likely near-duplicates found are listed in the report.
+
+Run with ``python bulk_import.py questions|resources FILE [--format csv|ndjson]``.
+"""
+import csv
+import hashlib
+import io
+import json
+import sys
+import sqlite3
+from catalog import subject_catalog
+from dedup import SOURCES as DEDUP_SOURCES, index_items
+from question_index import question_index
+
+BATCH_SIZE = 5000
+MAX_REPORTED_ERRORS = 1000
+MAX_REPORTED_DUPLICATES = 1000
+
+QUESTION_TYPES = ('mcq', 'short', 'long')
+RESOURCE_TYPES = ('notes', 'video', 'questions', 'past_paper')
+DIFFICULTIES = ('easy', 'medium', 'hard')
+
+class RowError(ValueError):
+    """A row that cannot be imported"""
+
+def _text(row, field, required=False):
+    value = row.get(field)
+    if value is not None:
+        value = str(value).strip()
+    if not value:
+        if required:
+            raise RowError(f'{field} is required')
+        return None
+    return value
+
+def _integer(row, field, required=False, minimum=None):
+    value = _text(row, field, required)
+    if value is None:
+        return None
+    try:
+        number = int(value)
+    except ValueError:
+        raise RowError(f'{field} must be an integer')
+    if minimum is not None and number < minimum:
+        raise RowError(f'{field} must be at least {minimum}')
+    return number
+
+def _choice(row, field, choices, default=None):
+    value = _text(row, field) or default
+    if value is not None:
+        value = value.lower()
+        if value not in choices:
+            raise RowError(f"{field} must be one of {', '.join(choices)}")
+    return value
+
+def _options(row):
+    """MCQ options as a JSON array string; CSV may give JSON or a|b|c"""
+    value = row.get('options')
+    if value is None or value == '':
+        return None
+    if isinstance(value, str):
+        if value.lstrip().startswith('['):
+            try:
+                value = json.loads(value)
+            except ValueError:
+                raise RowError('options are not valid JSON')
+        else:
+            value = [option.strip() for option in value.split('|')]
+    if not isinstance(value, list) or not all(isinstance(o, (str, int, float)) for o in value):
+        raise RowError('options must be a list')
+    return json.dumps([str(option) for option in value])
+
+def _content_key(kind, *values):
+    """Import key for rows without one, from the fields that identify them"""
+    text = '\x1f'.join([kind] + ['' if value is None else str(value) for value in values])
+    return 'auto:' + hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+class _SubjectResolver:
+    """Map subject ids, codes and slugs in the file to subject ids"""
+
+    def __init__(self, db):
+        self.db = db
+        self._cache = {}
+
+    def __call__(self, row):
+        key = _text(row, 'subject_id') or _text(row, 'subject')
+        if key is None:
+            raise RowError('subject_id is required')
+        if key not in self._cache:
+            subject = subject_catalog.get(self.db, key)
+            self._cache[key] = subject['id'] if subject else None
+        if self._cache[key] is None:
+            raise RowError(f'unknown subject {key}')
+        return self._cache[key]
+
+def question_values(row, subject_id, user_id):
+    question_text = _text(row, 'question_text', required=True)
+    question_type = _choice(row, 'question_type', QUESTION_TYPES)
+    if question_type is None:
+        raise RowError('question_type is required')
+    options = _options(row)
+    if question_type == 'mcq' and not options:
+        raise RowError('options are required for mcq questions')
+    correct_answer = _text(row, 'correct_answer')
+    import_key = _text(row, 'import_key') or _content_key(
+        'questions', subject_id, question_text, question_type, options, correct_answer
+    )
+    return (
+        subject_id, question_text, question_type, options, correct_answer,
+        _integer(row, 'marks', minimum=1) or 1,
+        _choice(row, 'difficulty', DIFFICULTIES, 'medium'),
+        _text(row, 'topic'),
+        _text(row, 'explanation'),
+        user_id,
+        import_key
+    )
+
+def resource_values(row, subject_id, user_id):
+    title = _text(row, 'title', required=True)
+    resource_type = _choice(row, 'resource_type', RESOURCE_TYPES)
+    if resource_type is None:
+        raise RowError('resource_type is required')
+    file_path = _text(row, 'file_path')
+    import_key = _text(row, 'import_key') or _content_key('resources', subject_id, title, resource_type, file_path)
+    return (
+        subject_id, title, _text(row, 'description'), resource_type, file_path,
+        _integer(row, 'file_size', minimum=0),
+        _integer(row, 'duration', minimum=0),
+        _choice(row, 'difficulty', DIFFICULTIES),
+        _integer(row, 'marks', minimum=0),
+        _integer(row, 'paper_number'),
+        _integer(row, 'year'),
+        _text(row, 'topic'),
+        user_id,
+        import_key
+    )
+
+IMPORTERS = {
+    'questions': (question_values, '''
+        INSERT INTO questions (
+            subject_id, question_text, question_type, options, correct_answer,
+            marks, difficulty, topic, explanation, created_by, import_key
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (import_key) DO NOTHING
+    '''),
+    'resources': (resource_values, '''
+        INSERT INTO resources (
+            subject_id, title, description, resource_type, file_path, file_size,
+            duration, difficulty, marks, paper_number, year, topic, uploaded_by, import_key
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (import_key) DO NOTHING
+    ''')
+}
+
+# Per-row insert triggers that imports replace with one set-based statement
+# per batch; indexing a batch into FTS5 with INSERT ... SELECT is several
+# times faster than a trigger firing for every row
+DEFERRED_TRIGGERS = {
+    'questions': {
+        'trg_questions_fts_insert': '''
+            INSERT INTO questions_fts (rowid, question_text, topic, explanation)
+            SELECT id, question_text, topic, explanation FROM questions WHERE id > :first
+        ''',
+        'trg_questions_version_insert': '''
+            UPDATE table_versions SET version = version + :count, updated_at = CURRENT_TIMESTAMP
+            WHERE name = 'questions'
+        '''
+    },
+    'resources': {
+        'trg_resources_fts_insert': '''
+            INSERT INTO resources_fts (rowid, title, description, topic)
+            SELECT id, title, description, topic FROM resources WHERE id > :first
+        ''',
+        'trg_resources_version_insert': '''
+            UPDATE table_versions SET version = version + :count, updated_at = CURRENT_TIMESTAMP
+            WHERE name = 'resources'
+        '''
+    }
+}
+
+def insert_batch(db, kind, rows):
+    """Insert one batch in its own transaction.
+
+    Returns (rows inserted, [(item_id, duplicate item_id, similarity)]).
+    """
+    deferred = DEFERRED_TRIGGERS[kind]
+    # Explicit BEGIN so the trigger DDL is part of the transaction
+    db.execute('BEGIN IMMEDIATE')
+    try:
+        first = db.execute(f'SELECT COALESCE(MAX(id), 0) FROM {kind}').fetchone()[0]
+        placeholders = ','.join(['?'] * len(deferred))
+        triggers = db.execute(f'''
+            SELECT name, sql FROM sqlite_master
+            WHERE type = 'trigger' AND tbl_name = ? AND name IN ({placeholders})
+        ''', [kind] + list(deferred)).fetchall()
+        for name, _ in triggers:
+            db.execute(f'DROP TRIGGER {name}')
+        
+        inserted = db.executemany(IMPORTERS[kind][1], rows).rowcount
+        
+        for name, trigger_sql in triggers:
+            db.execute(deferred[name], {'first': first, 'count': inserted})
+            db.execute(trigger_sql)
+        
+        # Rows skipped by ON CONFLICT keep their ids, so the new ones are above first
+        _, text = DEDUP_SOURCES[kind]
+        new_rows = db.execute(f'SELECT id, {text} FROM {kind} WHERE id > ? ORDER BY id', (first,)).fetchall()
+        duplicates = index_items(db, kind, new_rows)
+        
+        saved = None
+        if kind == 'questions' and inserted:
+            saved = db.execute('''
+                SELECT id, subject_id, difficulty, topic, question_type, marks FROM questions
+                WHERE id > ? ORDER BY id
+            ''', (first,)).fetchall()
+            version = db.execute("SELECT version FROM table_versions WHERE name = 'questions'").fetchone()[0]
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    if saved:
+        question_index.note_saved(saved, version)
+    return inserted, duplicates
+
+def read_rows(stream, file_format):
+    """Yield (line number, row dict or parse error) from a text stream"""
+    if file_format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    elif file_format == 'ndjson':
+        for line_number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_number, RowError(f'invalid JSON: {e}')
+                continue
+            yield line_number, row if isinstance(row, dict) else RowError('row must be a JSON object')
+    else:
+        raise ValueError('format must be csv or ndjson')
+
+def detect_format(filename, default='csv'):
+    name = (filename or '').lower()
+    if name.endswith(('.ndjson', '.jsonl', '.json')):
+        return 'ndjson'
+    if name.endswith('.csv'):
+        return 'csv'
+    return default
+
+def import_rows(db, kind, stream, file_format='csv', user_id=None, batch_size=BATCH_SIZE):
+    """Import a text stream of rows; returns a report dict.
+
+    Each batch is committed on its own, so an interrupted import can be
+    re-run and will skip the rows already loaded.
+    """
+    convert = IMPORTERS[kind][0]
+    resolve_subject = _SubjectResolver(db)
+    report = {
+        'kind': kind, 'rows': 0, 'inserted': 0, 'skipped': 0, 'failed': 0, 'errors': [],
+        'flagged': 0, 'duplicates': []
+    }
+    batch = []
+
+    def flush():
+        if not batch:
+            return
+        inserted, duplicates = insert_batch(db, kind, batch)
+        report['inserted'] += inserted
+        report['skipped'] += len(batch) - inserted
+        report['flagged'] += len(duplicates)
+        room = MAX_REPORTED_DUPLICATES - len(report['duplicates'])
+        report['duplicates'].extend(
+            {'id': item_id, 'duplicate_of': duplicate_of, 'similarity': round(score, 3)}
+            for item_id, duplicate_of, score in duplicates[:max(room, 0)]
+        )
+        batch.clear()
+
+    for line_number, row in read_rows(stream, file_format):
+        report['rows'] += 1
+        try:
+            if isinstance(row, Exception):
+                raise row
+            batch.append(convert(row, resolve_subject(row), user_id))
+        except RowError as e:
+            report['failed'] += 1
+            if len(report['errors']) < MAX_REPORTED_ERRORS:
+                report['errors'].append({'line': line_number, 'error': str(e)})
+            continue
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+
+    if report['inserted'] and kind == 'resources':
+        subject_catalog.invalidate()
+    # insert_batch has updated the question index; the answer key cache
+    # notices the new questions through table_versions and reloads on next use
+    return report
+
+def open_text(binary_stream):
+    """Wrap an uploaded binary stream for row reading"""
+    return io.TextIOWrapper(binary_stream, encoding='utf-8-sig', newline='')
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    file_format = None
+    if '--format' in args:
+        index = args.index('--format')
+        file_format = args[index + 1] if index + 1 < len(args) else None
+        del args[index:index + 2]
+    if len(args) != 2 or args[0] not in IMPORTERS or file_format not in (None, 'csv', 'ndjson'):
+        print('Usage: python bulk_import.py questions|resources FILE [--format csv|ndjson]')
+        sys.exit(1)
+
+    from database import get_db_path
+    conn = sqlite3.connect(get_db_path())
+    conn.row_factory = sqlite3.Row
+    with open(args[1], encoding='utf-8-sig', newline='') as stream:
+        result = import_rows(conn, args[0], stream, file_format or detect_format(args[1]))
+    conn.close()
+
+    print(f"{result['rows']} rows: {result['inserted']} inserted, "
+          f"{result['skipped']} already present, {result['failed']} failed, "
+          f"{result['flagged']} likely duplicate(s)")
+    for error in result['errors']:
+        print(f"  line {error['line']}: {error['error']}")
+    for duplicate in result['duplicates']:
+        print(f"  {args[0]} {duplicate['id']} looks like {duplicate['duplicate_of']} ({duplicate['similarity']})")
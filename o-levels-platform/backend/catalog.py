@@ -0,0 +1,201 @@
+"""In-memory subject catalog.
+
+Subjects, their per-type resource counts and the topics their resources
+cover are loaded once and kept in memory. create_resource bumps the
+cached counts directly, and a short TTL reload picks up changes made by
+other worker processes.
+"""
+import threading
+import time
+
+CATALOG_TTL = 60  # seconds before the cache is reloaded from the database
+
+# Output field for each resource type's count
+COUNT_FIELDS = {
+    'notes': 'notes_count',
+    'video': 'videos_count',
+    'questions': 'questions_count',
+    'past_paper': 'past_papers_count'
+}
+
+# Curriculum metadata not stored in the subjects table, keyed by URL slug
+SUBJECTS_DATA = {
+    'mathematics': {
+        'id': 1,
+        'name': 'Mathematics',
+        'code': 'MATH',
+        'description': 'Comprehensive mathematics curriculum including algebra, geometry, calculus, and statistics',
+        'color': '#ff6b6b',
+        'icon': 'calculator',
+        'papers': [1, 2],
+        'topics': ['Algebra', 'Geometry', 'Trigonometry', 'Calculus', 'Statistics', 'Probability']
+    },
+    'computer_science': {
+        'id': 2,
+        'name': 'Computer Science',
+        'code': 'COMP',
+        'description': 'Computer programming, algorithms, data structures, and computer fundamentals',
+        'color': '#4ecdc4',
+        'icon': 'laptop-code',
+        'papers': [1, 2],
+        'topics': ['Programming', 'Algorithms', 'Data Structures', 'Databases', 'Computer Architecture']
+    },
+    'chemistry': {
+        'id': 3,
+        'name': 'Chemistry',
+        'code': 'CHEM',
+        'description': 'Study of elements, compounds, chemical reactions, and molecular structures',
+        'color': '#45b7d1',
+        'icon': 'flask',
+        'papers': [1, 2, 3],
+        'topics': ['Organic Chemistry', 'Inorganic Chemistry', 'Physical Chemistry', 'Analytical Chemistry']
+    },
+    'physics': {
+        'id': 4,
+        'name': 'Physics',
+        'code': 'PHYS',
+        'description': 'Fundamental principles of matter, energy, motion, and the laws of the universe',
+        'color': '#ffa726',
+        'icon': 'atom',
+        'papers': [1, 2, 3],
+        'topics': ['Mechanics', 'Electricity', 'Magnetism', 'Thermodynamics', 'Waves', 'Modern Physics']
+    },
+    'english': {
+        'id': 5,
+        'name': 'English',
+        'code': 'ENG',
+        'description': 'Language skills, literature analysis, and communication techniques',
+        'color': '#ba68c8',
+        'icon': 'book-open',
+        'papers': [1, 2],
+        'topics': ['Grammar', 'Comprehension', 'Composition', 'Literature', 'Vocabulary']
+    },
+    'islamiat': {
+        'id': 6,
+        'name': 'Islamiat',
+        'code': 'ISL',
+        'description': 'Islamic studies including history, beliefs, practices, and moral teachings',
+        'color': '#66bb6a',
+        'icon': 'mosque',
+        'papers': [1, 2],
+        'topics': ['Quran', 'Hadith', 'Islamic History', 'Fiqh', 'Islamic Ethics']
+    },
+    'pakistan_studies': {
+        'id': 7,
+        'name': 'Pakistan Studies',
+        'code': 'PST',
+        'description': 'History, culture, geography, and political development of Pakistan',
+        'color': '#78909c',
+        'icon': 'globe-asia',
+        'papers': [1, 2],
+        'topics': ['Pakistan Movement', 'Geography', 'Culture', 'Economy', 'Political System']
+    }
+}
+
+class SubjectCatalog:
+    """Cached subjects with per-type resource counts"""
+
+    def __init__(self, ttl=CATALOG_TTL):
+        self.ttl = ttl
+        self._subjects = {}  # id -> subject dict
+        self._order = []  # ids sorted by name
+        self._slugs = {}  # slug or lower-case code -> id
+        self._counts = {}  # id -> {resource_type: count}
+        self._topics = {}  # id -> set of resource topics
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def _load(self, db):
+        subjects = db.execute('SELECT * FROM subjects ORDER BY name').fetchall()
+        counts = db.execute('''
+            SELECT subject_id, resource_type, count FROM resource_counters WHERE count > 0
+        ''').fetchall()
+        topics = db.execute('''
+            SELECT DISTINCT subject_id, topic FROM resources WHERE topic IS NOT NULL
+        ''').fetchall()
+        metadata = {subject['code']: (slug, subject) for slug, subject in SUBJECTS_DATA.items()}
+        
+        by_id, slugs, by_count, by_topic = {}, {}, {}, {}
+        for row in subjects:
+            subject = dict(row)
+            slug, extra = metadata.get(subject['code'], (subject['code'].lower(), {}))
+            subject['slug'] = slug
+            subject['papers'] = extra.get('papers', [])
+            subject['topics'] = extra.get('topics', [])
+            by_id[subject['id']] = subject
+            slugs[slug] = subject['id']
+            slugs[subject['code'].lower()] = subject['id']
+            by_count[subject['id']] = {}
+            by_topic[subject['id']] = set()
+        
+        for row in counts:
+            by_count.setdefault(row['subject_id'], {})[row['resource_type']] = row['count']
+        for row in topics:
+            by_topic.setdefault(row['subject_id'], set()).add(row['topic'])
+        
+        with self._lock:
+            self._subjects = by_id
+            self._order = [row['id'] for row in subjects]
+            self._slugs = slugs
+            self._counts = by_count
+            self._topics = by_topic
+            self._loaded_at = time.monotonic()
+
+    def _ensure_loaded(self, db):
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl:
+            self._load(db)
+
+    def _render(self, subject_id):
+        subject = dict(self._subjects[subject_id])
+        counts = self._counts.get(subject_id, {})
+        subject['resource_count'] = sum(counts.values())
+        for resource_type, field in COUNT_FIELDS.items():
+            subject[field] = counts.get(resource_type, 0)
+        subject['papers'] = list(subject['papers'])
+        subject['topics'] = list(subject['topics'])
+        return subject
+
+    def all(self, db):
+        """Get every subject, ordered by name"""
+        self._ensure_loaded(db)
+        with self._lock:
+            return [self._render(subject_id) for subject_id in self._order]
+
+    def get(self, db, key):
+        """Get one subject by id, slug or code, or None"""
+        self._ensure_loaded(db)
+        with self._lock:
+            if isinstance(key, str) and not key.isdigit():
+                subject_id = self._slugs.get(key.lower())
+            else:
+                subject_id = int(key)
+            if subject_id not in self._subjects:
+                return None
+            return self._render(subject_id)
+
+    def resource_counts(self, db, subject_id):
+        """Get {resource_type: count} for the types a subject has resources of"""
+        self._ensure_loaded(db)
+        with self._lock:
+            return dict(self._counts.get(int(subject_id), {}))
+
+    def resource_topics(self, db, subject_id):
+        """Get the sorted topics a subject's resources cover"""
+        self._ensure_loaded(db)
+        with self._lock:
+            return sorted(self._topics.get(int(subject_id), ()))
+
+    def note_resource_created(self, subject_id, resource_type, topic=None):
+        """Count a newly inserted resource without reloading"""
+        with self._lock:
+            counts = self._counts.setdefault(int(subject_id), {})
+            counts[resource_type] = counts.get(resource_type, 0) + 1
+            if topic is not None:
+                self._topics.setdefault(int(subject_id), set()).add(topic)
+
+    def invalidate(self):
+        """Force a reload on next access"""
+        with self._lock:
+            self._loaded_at = None
+
+subject_catalog = SubjectCatalog()
@@ -0,0 +1,81 @@
+"""Conditional GET support driven by per-table change counters.
+
+Every tracked table has a row in table_versions that triggers bump on each
+write. A view decorated with @conditional('resources', ...) gets an ETag
+built from the request path, the session user and those versions, so a
+matching If-None-Match (or a fresh If-Modified-Since) is answered with 304
+after a single primary-key lookup, before the view's own queries run.
+Responses may carry per-user data, so they are marked private and vary on
+Cookie.
+"""
+import hashlib
+from datetime import datetime, timezone
+from functools import wraps
+from flask import request, make_response
+from database import get_db
+
+def get_table_versions(db, tables):
+    """Get {table: (version, updated_at)} for the given tables"""
+    placeholders = ','.join(['?'] * len(tables))
+    rows = db.execute(f'''
+        SELECT name, version, updated_at FROM table_versions WHERE name IN ({placeholders})
+    ''', tables).fetchall()
+    return {row['name']: (row['version'], row['updated_at']) for row in rows}
+
+def _last_modified(versions):
+    stamps = [updated_at for _, updated_at in versions.values() if updated_at]
+    if not stamps:
+        return None
+    return datetime.strptime(max(stamps), '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+
+def conditional(*tables, before=None):
+    """Decorator adding ETag/Last-Modified validators and 304 short-circuits.
+
+    ``before`` is called with the view's arguments on every request,
+    including ones answered with 304, for side effects such as counting
+    views.
+    """
+    tables = list(tables)
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            from flask import session
+            
+            if before is not None:
+                before(*args, **kwargs)
+            
+            db = get_db()
+            try:
+                versions = get_table_versions(db, tables)
+            finally:
+                db.close()
+            
+            state = '|'.join(f'{name}:{versions.get(name, (0, None))[0]}' for name in tables)
+            user = session.get('user_id')
+            etag = hashlib.sha1(f'{request.full_path}|{user}|{state}'.encode('utf-8')).hexdigest()
+            last_modified = _last_modified(versions)
+            
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains_weak(etag)
+            else:
+                since = request.if_modified_since
+                not_modified = bool(since and last_modified and last_modified <= since)
+            
+            if not_modified:
+                response = make_response('', 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            
+            response.set_etag(etag, weak=True)
+            if last_modified:
+                response.last_modified = last_modified
+            # Cache in the browser only, and revalidate on every use
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            response.vary.add('Cookie')
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,135 @@
+"""Write-behind buffer for resource view and download counts.
+
+Request handlers record increments in memory; a background thread folds
+them into the resources table with one batched UPDATE per flush instead of
+a write transaction per GET.
+"""
+import atexit
+import os
+import threading
+from database import get_db
+
+FLUSH_INTERVAL = 5  # seconds between background flushes
+FLUSH_THRESHOLD = 500  # pending increments that trigger an early flush
+
+class CounterBuffer:
+    """Aggregates per-resource counter increments between flushes"""
+
+    def __init__(self, interval=FLUSH_INTERVAL, threshold=FLUSH_THRESHOLD):
+        self.interval = interval
+        self.threshold = threshold
+        self._pending = {}  # resource_id -> [views, downloads]
+        self._inflight = {}  # batch currently being written
+        self._pending_total = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='counter-flush', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Counter flush failed: {e}")
+
+    def increment(self, resource_id, views=0, downloads=0):
+        """Record counter increments for a resource"""
+        with self._lock:
+            counts = self._pending.setdefault(resource_id, [0, 0])
+            counts[0] += views
+            counts[1] += downloads
+            self._pending_total += views + downloads
+            flush_now = self._pending_total >= self.threshold
+        
+        self._ensure_thread()
+        if flush_now:
+            self._wakeup.set()
+
+    def pending(self, resource_id):
+        """Get (views, downloads) recorded but not yet visible in the database"""
+        with self._lock:
+            views, downloads = self._pending.get(resource_id, (0, 0))
+            inflight = self._inflight.get(resource_id, (0, 0))
+        return views + inflight[0], downloads + inflight[1]
+
+    def merge(self, resource):
+        """Add unflushed increments to a resource dict's stored counts"""
+        views, downloads = self.pending(resource['id'])
+        if views:
+            resource['view_count'] = (resource.get('view_count') or 0) + views
+        if downloads:
+            resource['download_count'] = (resource.get('download_count') or 0) + downloads
+        return resource
+
+    def flush(self):
+        """Write all pending increments in a single transaction"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+                self._pending_total = 0
+                self._inflight = batch
+            
+            if not batch:
+                return 0
+            
+            db = None
+            try:
+                db = get_db()
+                db.executemany('''
+                    UPDATE resources
+                    SET view_count = view_count + ?, download_count = download_count + ?
+                    WHERE id = ?
+                ''', [(views, downloads, resource_id) for resource_id, (views, downloads) in batch.items()])
+                db.commit()
+            except Exception:
+                if db is not None:
+                    db.rollback()
+                # Put the batch back so the increments are retried next flush
+                with self._lock:
+                    for resource_id, (views, downloads) in batch.items():
+                        counts = self._pending.setdefault(resource_id, [0, 0])
+                        counts[0] += views
+                        counts[1] += downloads
+                        self._pending_total += views + downloads
+                    self._inflight = {}
+                raise
+            finally:
+                if db is not None:
+                    db.close()
+            
+            with self._lock:
+                self._inflight = {}
+            return len(batch)
+
+counter_buffer = CounterBuffer()
+
+def record_view(resource_id):
+    """Count a view of a resource"""
+    counter_buffer.increment(resource_id, views=1)
+
+def record_download(resource_id):
+    """Count a download of a resource"""
+    counter_buffer.increment(resource_id, downloads=1)
+
+def merge_counts(resource):
+    """Get a resource dict with view/download counts including buffered increments"""
+    return counter_buffer.merge(resource)
+
+@atexit.register
+def _flush_on_exit():
+    if counter_buffer._pid == os.getpid():
+        counter_buffer.flush()
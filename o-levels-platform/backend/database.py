@@ -1,181 +1,209 @@
 import sqlite3
 import os
+import time
+import atexit
+import threading
 from datetime import datetime
+from flask import g, has_app_context
+
+# Connection pool settings
+POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+POOL_TIMEOUT = 30  # seconds to wait for a free connection
+HEALTH_CHECK_INTERVAL = 60  # seconds idle before a connection is pinged again
+
+# Pragmas applied to every connection before it is first checked out
+CONNECTION_PRAGMAS = [
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('cache_size', -16000),  # negative = KiB, so ~16MB page cache
+    ('mmap_size', 128 * 1024 * 1024),
+    ('busy_timeout', 5000),
+    ('temp_store', 'MEMORY'),
+]
+
+_pool = None
+_pool_lock = threading.Lock()
 
 def get_db_path():
     """Get the database file path"""
     return 'o_levels_platform.db'
 
+class PoolTimeoutError(sqlite3.OperationalError):
+    """Raised when no pooled connection becomes free in time"""
+
+class PooledConnection(sqlite3.Connection):
+    """SQLite connection whose close() hands it back to its pool"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool = None
+        self.lease = None
+        self.last_used = time.monotonic()
+
+    def close(self):
+        """Return the connection to the pool instead of closing it"""
+        if self.pool is not None:
+            self.pool.release(self, self.lease)
+        else:
+            super().close()
+
+class ConnectionPool:
+    """Bounded pool of tuned SQLite connections shared by all threads.
+
+    Idle connections are kept in LIFO order so a thread that releases and
+    re-acquires (the common request pattern) gets the same warm connection
+    and page cache back.
+    """
+
+    def __init__(self, db_path, size=POOL_SIZE, timeout=POOL_TIMEOUT):
+        self.db_path = db_path
+        self.size = size
+        self.timeout = timeout
+        self.pid = os.getpid()
+        self._idle = []
+        self._created = 0
+        self._cond = threading.Condition()
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.db_path,
+            factory=PooledConnection,
+            timeout=POOL_TIMEOUT,
+            check_same_thread=False
+        )
+        conn.row_factory = sqlite3.Row
+        for name, value in CONNECTION_PRAGMAS:
+            conn.execute(f'PRAGMA {name} = {value}')
+        conn.pool = self
+        return conn
+
+    def _is_healthy(self, conn):
+        if time.monotonic() - conn.last_used < HEALTH_CHECK_INTERVAL:
+            return True
+        try:
+            conn.execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _discard(self, conn):
+        conn.pool = None
+        try:
+            sqlite3.Connection.close(conn)
+        except sqlite3.Error:
+            pass
+        with self._cond:
+            self._created -= 1
+            self._cond.notify()
+
+    def acquire(self):
+        """Check out a connection, blocking until one is free"""
+        deadline = time.monotonic() + self.timeout
+        while True:
+            with self._cond:
+                while not self._idle and self._created >= self.size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolTimeoutError('Timed out waiting for a database connection')
+                    self._cond.wait(remaining)
+                if self._idle:
+                    conn = self._idle.pop()
+                else:
+                    conn = None
+                    self._created += 1
+
+            if conn is None:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._created -= 1
+                        self._cond.notify()
+                    raise
+            elif not self._is_healthy(conn):
+                self._discard(conn)
+                continue
+
+            conn.lease = object()
+            return conn
+
+    def release(self, conn, lease):
+        """Return a connection; stale or repeated releases are ignored"""
+        if lease is None or conn.lease is not lease:
+            return
+        conn.lease = None
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+            return
+        conn.last_used = time.monotonic()
+        with self._cond:
+            self._idle.append(conn)
+            self._cond.notify()
+
+    def close_all(self):
+        """Close every idle connection (checkpoints the WAL on the last one)"""
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._created -= len(idle)
+        for conn in idle:
+            conn.pool = None
+            sqlite3.Connection.close(conn)
+
+def get_pool():
+    """Get the process-wide connection pool, creating it after a fork"""
+    global _pool
+    pid = os.getpid()
+    if _pool is None or _pool.pid != pid:
+        with _pool_lock:
+            if _pool is None or _pool.pid != pid:
+                _pool = ConnectionPool(get_db_path())
+    return _pool
+
+@atexit.register
+def _close_pool():
+    if _pool is not None and _pool.pid == os.getpid():
+        _pool.close_all()
+
 def init_db():
-    """Initialize the database with required tables"""
-    db_path = get_db_path()
+    """Initialize the database and apply any pending schema migrations"""
+    from migrations import migrate
     
-    # Check if database exists, if not create it
-    if not os.path.exists(db_path):
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        
-        # Users table
-        cursor.execute('''
-            CREATE TABLE users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username VARCHAR(50) UNIQUE NOT NULL,
-                email VARCHAR(100) UNIQUE NOT NULL,
-                password_hash VARCHAR(255) NOT NULL,
-                full_name VARCHAR(100),
-                grade_level VARCHAR(20),
-                school VARCHAR(100),
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                last_login DATETIME,
-                is_active BOOLEAN DEFAULT 1
-            )
-        ''')
-        
-        # Subjects table
-        cursor.execute('''
-            CREATE TABLE subjects (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name VARCHAR(100) NOT NULL,
-                code VARCHAR(10) UNIQUE NOT NULL,
-                description TEXT,
-                color VARCHAR(7),
-                icon VARCHAR(50),
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Resources table
-        cursor.execute('''
-            CREATE TABLE resources (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                subject_id INTEGER NOT NULL,
-                title VARCHAR(255) NOT NULL,
-                description TEXT,
-                resource_type VARCHAR(50) NOT NULL, -- 'notes', 'video', 'questions', 'past_paper'
-                file_path VARCHAR(500),
-                file_size INTEGER,
-                duration INTEGER, -- for videos in minutes
-                difficulty VARCHAR(20), -- 'easy', 'medium', 'hard'
-                marks INTEGER,
-                paper_number INTEGER,
-                year INTEGER,
-                topic VARCHAR(100),
-                uploaded_by INTEGER,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                download_count INTEGER DEFAULT 0,
-                view_count INTEGER DEFAULT 0,
-                FOREIGN KEY (subject_id) REFERENCES subjects (id),
-                FOREIGN KEY (uploaded_by) REFERENCES users (id)
-            )
-        ''')
-        
-        # User progress table
-        cursor.execute('''
-            CREATE TABLE user_progress (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                subject_id INTEGER NOT NULL,
-                resource_id INTEGER,
-                progress_type VARCHAR(50), -- 'completed', 'in_progress', 'bookmarked'
-                completed BOOLEAN DEFAULT 0,
-                score DECIMAL(5,2),
-                time_spent INTEGER, -- in minutes
-                last_accessed DATETIME DEFAULT CURRENT_TIMESTAMP,
-                notes TEXT,
-                FOREIGN KEY (user_id) REFERENCES users (id),
-                FOREIGN KEY (subject_id) REFERENCES subjects (id),
-                FOREIGN KEY (resource_id) REFERENCES resources (id)
-            )
-        ''')
-        
-        # Tests table
-        cursor.execute('''
-            CREATE TABLE tests (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                title VARCHAR(255) NOT NULL,
-                subject_id INTEGER NOT NULL,
-                paper_number INTEGER,
-                difficulty VARCHAR(20),
-                total_marks INTEGER,
-                time_limit INTEGER, -- in minutes
-                question_types TEXT, -- JSON array of question types
-                custom_questions TEXT, -- JSON array of question IDs
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                is_completed BOOLEAN DEFAULT 0,
-                score DECIMAL(5,2),
-                time_taken INTEGER,
-                FOREIGN KEY (user_id) REFERENCES users (id),
-                FOREIGN KEY (subject_id) REFERENCES subjects (id)
-            )
-        ''')
-        
-        # Questions table
-        cursor.execute('''
-            CREATE TABLE questions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                subject_id INTEGER NOT NULL,
-                question_text TEXT NOT NULL,
-                question_type VARCHAR(50) NOT NULL, -- 'mcq', 'short', 'long'
-                options TEXT, -- JSON array for MCQ options
-                correct_answer TEXT,
-                marks INTEGER,
-                difficulty VARCHAR(20),
-                topic VARCHAR(100),
-                explanation TEXT,
-                created_by INTEGER,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (subject_id) REFERENCES subjects (id),
-                FOREIGN KEY (created_by) REFERENCES users (id)
-            )
-        ''')
-        
-        # User activity table
-        cursor.execute('''
-            CREATE TABLE user_activity (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                activity_type VARCHAR(50) NOT NULL, -- 'login', 'resource_view', 'test_taken', 'progress_update'
-                activity_details TEXT,
-                activity_date DATETIME DEFAULT CURRENT_TIMESTAMP,
-                ip_address VARCHAR(45),
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        ''')
-        
-        # Insert sample subjects
-        sample_subjects = [
-            ('Mathematics', 'MATH', 'Comprehensive mathematics curriculum', '#ff6b6b', 'calculator'),
-            ('Computer Science', 'COMP', 'Programming and computer fundamentals', '#4ecdc4', 'laptop-code'),
-            ('Chemistry', 'CHEM', 'Study of elements and compounds', '#45b7d1', 'flask'),
-            ('Physics', 'PHYS', 'Fundamental principles of matter and energy', '#ffa726', 'atom'),
-            ('English', 'ENG', 'Language skills and literature', '#ba68c8', 'book-open'),
-            ('Islamiat', 'ISL', 'Islamic studies and teachings', '#66bb6a', 'mosque'),
-            ('Pakistan Studies', 'PST', 'History and geography of Pakistan', '#78909c', 'globe-asia')
-        ]
-        
-        cursor.executemany('''
-            INSERT INTO subjects (name, code, description, color, icon) 
-            VALUES (?, ?, ?, ?, ?)
-        ''', sample_subjects)
-        
-        # Insert sample admin user
-        cursor.execute('''
-            INSERT INTO users (username, email, password_hash, full_name, grade_level, school)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', ('admin', 'admin@olevels.com', 'pbkdf2:sha256:260000$abc123$hashedpassword', 'Admin User', 'O-Level', 'Demo School'))
-        
-        conn.commit()
+    conn = sqlite3.connect(get_db_path())
+    try:
+        applied = migrate(conn)
+    finally:
         conn.close()
-        print("Database initialized successfully!")
+    
+    if applied:
+        print(f"Database initialized successfully! (migrations {applied})")
 
 def get_db():
-    """Get database connection"""
-    conn = sqlite3.connect(get_db_path())
-    conn.row_factory = sqlite3.Row
+    """Get a pooled database connection.
+
+    Inside a Flask request every connection handed out is remembered on
+    ``g`` so teardown_db() can return it to the pool even when a handler
+    forgets to close it.
+    """
+    conn = get_pool().acquire()
+    if has_app_context():
+        g.setdefault('_db_leases', []).append((conn, conn.lease))
     return conn
 
 def close_db(conn):
-    """Close database connection"""
+    """Return a database connection to the pool"""
     if conn:
-        conn.close()
\ No newline at end of file
+        conn.close()
+
+def teardown_db(exception=None):
+    """Release any connections still checked out by the current request"""
+    leases = g.pop('_db_leases', [])
+    for conn, lease in leases:
+        if conn.pool is not None:
+            conn.pool.release(conn, lease)
+
+def init_app(app):
+    """Register the pool teardown with a Flask app"""
+    app.teardown_appcontext(teardown_db)
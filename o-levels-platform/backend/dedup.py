@@ -0,0 +1,240 @@
+"""Near-duplicate detection for questions and resources.
+
+Each item's text (question_text; resource title and description) is
+normalized, split into word 3-gram shingles and reduced to a MinHash
+signature of NUM_PERM minimums of random linear hashes, so the share of
+equal positions in two signatures estimates the texts' Jaccard similarity.
+
+Signatures are cut into BANDS bands of ROWS values and each band is hashed
+into a bucket (LSH). Two items land in a common bucket with high
+probability when their similarity is above about (1 / BANDS) ** (1 / ROWS)
+and rarely below it, so finding candidates for a new item is BANDS index
+lookups instead of a scan of the bank. Candidates whose estimated
+similarity reaches DUPLICATE_THRESHOLD are recorded in duplicate_candidates.
+
+index_items() runs in the transaction that inserts a batch (bulk imports
+of questions and resources), index_item() for a single new resource;
+``python dedup.py sweep [kind]`` rebuilds all signatures and rescans every
+bucket offline.
+"""
+import hashlib
+import re
+import sys
+import sqlite3
+import zlib
+import numpy as np
+
+NUM_PERM = 64
+BANDS = 8
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 3  # words
+DUPLICATE_THRESHOLD = 0.8
+MAX_BUCKET_PAIRS = 200  # larger buckets are compared against their first item only
+
+_PRIME = (1 << 31) - 1
+_rng = np.random.default_rng(20240601)
+_A = _rng.integers(1, _PRIME, NUM_PERM, dtype=np.uint64)
+_B = _rng.integers(0, _PRIME, NUM_PERM, dtype=np.uint64)
+
+_WORD = re.compile(r'\w+')
+
+# Text fields hashed per kind
+SOURCES = {
+    'questions': ('questions', "COALESCE(question_text, '')"),
+    'resources': ('resources', "COALESCE(title, '') || ' ' || COALESCE(description, '')")
+}
+
+def shingles(text):
+    """Word n-gram shingles of normalized text (single words for short texts)"""
+    words = _WORD.findall((text or '').casefold())
+    if len(words) < SHINGLE_SIZE:
+        return set(words)
+    return {' '.join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+def signature(text):
+    """MinHash signature as a uint32 array, or None for text without words"""
+    hashed = np.fromiter((zlib.crc32(s.encode()) for s in shingles(text)), dtype=np.uint64)
+    if not len(hashed):
+        return None
+    values = (_A[:, None] * (hashed[None, :] % _PRIME) + _B[:, None]) % _PRIME
+    return values.min(axis=1).astype(np.uint32)
+
+def band_buckets(sig):
+    """(band, bucket) pairs for a signature"""
+    rows = sig.reshape(BANDS, ROWS)
+    return [
+        (band, int.from_bytes(hashlib.blake2b(rows[band].tobytes(), digest_size=8).digest(), 'little', signed=True))
+        for band in range(BANDS)
+    ]
+
+def similarity(sig, other):
+    """Estimated Jaccard similarity of two signatures"""
+    return float(np.mean(sig == other))
+
+def _load_signatures(db, kind, item_ids):
+    signatures = {}
+    item_ids = list(item_ids)
+    for start in range(0, len(item_ids), 500):
+        chunk = item_ids[start:start + 500]
+        placeholders = ','.join(['?'] * len(chunk))
+        for row in db.execute(f'''
+            SELECT item_id, signature FROM minhash_signatures
+            WHERE kind = ? AND item_id IN ({placeholders})
+        ''', [kind] + chunk):
+            signatures[row[0]] = np.frombuffer(row[1], dtype=np.uint32)
+    return signatures
+
+def find_duplicates(db, kind, sig, exclude=None):
+    """[(item_id, similarity)] of stored items likely duplicating a signature"""
+    candidates = set()
+    for band, bucket in band_buckets(sig):
+        candidates.update(row[0] for row in db.execute('''
+            SELECT item_id FROM minhash_bands WHERE kind = ? AND band = ? AND bucket = ?
+        ''', (kind, band, bucket)))
+    candidates.discard(exclude)
+
+    matches = []
+    for item_id, other in _load_signatures(db, kind, candidates).items():
+        score = similarity(sig, other)
+        if score >= DUPLICATE_THRESHOLD:
+            matches.append((item_id, score))
+    matches.sort(key=lambda m: (-m[1], m[0]))
+    return matches
+
+def _store(db, kind, items):
+    """Write signatures and band rows for [(item_id, signature)]"""
+    db.executemany('''
+        INSERT OR REPLACE INTO minhash_signatures (kind, item_id, signature) VALUES (?, ?, ?)
+    ''', [(kind, item_id, sig.tobytes()) for item_id, sig in items])
+    db.executemany('''
+        INSERT OR IGNORE INTO minhash_bands (kind, band, bucket, item_id) VALUES (?, ?, ?, ?)
+    ''', [(kind, band, bucket, item_id) for item_id, sig in items for band, bucket in band_buckets(sig)])
+
+def _record(db, kind, pairs):
+    db.executemany('''
+        INSERT OR REPLACE INTO duplicate_candidates (kind, item_id, duplicate_of, similarity)
+        VALUES (?, ?, ?, ?)
+    ''', [(kind, item_id, duplicate_of, score) for item_id, duplicate_of, score in pairs])
+
+def remove_item(db, kind, item_id):
+    """Drop an item's signature and buckets (caller commits)"""
+    db.execute('DELETE FROM minhash_signatures WHERE kind = ? AND item_id = ?', (kind, item_id))
+    db.execute('DELETE FROM minhash_bands WHERE kind = ? AND item_id = ?', (kind, item_id))
+
+def _bucket_members(db, kind, buckets):
+    """{(band, bucket): [stored item ids]} for the given (band, bucket) pairs"""
+    members = {}
+    for band in range(BANDS):
+        wanted = sorted({bucket for key_band, bucket in buckets if key_band == band})
+        for start in range(0, len(wanted), 500):
+            chunk = wanted[start:start + 500]
+            placeholders = ','.join(['?'] * len(chunk))
+            for bucket, item_id in db.execute(f'''
+                SELECT bucket, item_id FROM minhash_bands
+                WHERE kind = ? AND band = ? AND bucket IN ({placeholders})
+            ''', [kind, band] + chunk):
+                members.setdefault((band, bucket), []).append(item_id)
+    return members
+
+def index_items(db, kind, items):
+    """Store signatures for a batch of new or edited items and flag their likely
+    duplicates among stored items and earlier items of the batch (caller commits).
+
+    ``items`` are (item_id, text). Returns [(item_id, duplicate item_id,
+    similarity)], each item's matches best first.
+    """
+    items = list(items)
+    db.executemany('DELETE FROM minhash_signatures WHERE kind = ? AND item_id = ?',
+                   [(kind, item_id) for item_id, _ in items])
+    db.executemany('DELETE FROM minhash_bands WHERE kind = ? AND item_id = ?',
+                   [(kind, item_id) for item_id, _ in items])
+    signatures = [(item_id, sig) for item_id, text in items for sig in [signature(text)] if sig is not None]
+    if not signatures:
+        return []
+
+    buckets = {item_id: band_buckets(sig) for item_id, sig in signatures}
+    # One lookup per band and chunk of buckets rather than per item
+    stored = _bucket_members(db, kind, {key for keys in buckets.values() for key in keys})
+    known = _load_signatures(db, kind, {item_id for ids in stored.values() for item_id in ids})
+
+    pairs = []
+    earlier = {}  # (band, bucket) -> batch items already seen
+    for item_id, sig in signatures:
+        candidates = set()
+        for key in buckets[item_id]:
+            candidates.update(stored.get(key, ()))
+            candidates.update(earlier.get(key, ()))
+            earlier.setdefault(key, []).append(item_id)
+        candidates.discard(item_id)
+        known[item_id] = sig
+
+        matches = []
+        for other in candidates:
+            score = similarity(sig, known[other])
+            if score >= DUPLICATE_THRESHOLD:
+                matches.append((other, score))
+        matches.sort(key=lambda m: (-m[1], m[0]))
+        pairs.extend((item_id, duplicate_of, score) for duplicate_of, score in matches)
+
+    _store(db, kind, signatures)
+    _record(db, kind, pairs)
+    return pairs
+
+def index_item(db, kind, item_id, text):
+    """Store a new or edited item's signature and flag its likely duplicates (caller commits).
+
+    Returns [(duplicate item_id, similarity)], best first.
+    """
+    return [(duplicate_of, score) for _, duplicate_of, score in index_items(db, kind, [(item_id, text)])]
+
+def sweep(db, kind, batch_size=1000):
+    """Recompute every signature of a kind and rescan all buckets; returns pairs flagged"""
+    table, text = SOURCES[kind]
+    db.execute('DELETE FROM minhash_signatures WHERE kind = ?', (kind,))
+    db.execute('DELETE FROM minhash_bands WHERE kind = ?', (kind,))
+    db.execute('DELETE FROM duplicate_candidates WHERE kind = ?', (kind,))
+
+    cursor = db.execute(f'SELECT id, {text} FROM {table} ORDER BY id')
+    signatures = {}
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        items = [(row[0], sig) for row in rows for sig in [signature(row[1])] if sig is not None]
+        _store(db, kind, items)
+        signatures.update(items)
+
+    # Compare items that share a bucket; each pair once, newer item flagged
+    pairs = {}
+    for row in db.execute('''
+        SELECT GROUP_CONCAT(item_id) FROM minhash_bands
+        WHERE kind = ?
+        GROUP BY band, bucket
+        HAVING COUNT(*) > 1
+    ''', (kind,)):
+        members = sorted(int(item_id) for item_id in row[0].split(','))
+        if len(members) > MAX_BUCKET_PAIRS:
+            candidates = [(members[0], other) for other in members[1:]]
+        else:
+            candidates = [(a, b) for i, a in enumerate(members) for b in members[i + 1:]]
+        for a, b in candidates:
+            if (b, a) not in pairs:
+                score = similarity(signatures[a], signatures[b])
+                if score >= DUPLICATE_THRESHOLD:
+                    pairs[(b, a)] = score
+
+    _record(db, kind, [(item_id, duplicate_of, score) for (item_id, duplicate_of), score in pairs.items()])
+    db.commit()
+    return len(pairs)
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] != 'sweep' or not set(sys.argv[2:]) <= set(SOURCES):
+        print('Usage: python dedup.py sweep [questions|resources]')
+        sys.exit(1)
+
+    from database import get_db_path
+    conn = sqlite3.connect(get_db_path())
+    for kind in sys.argv[2:] or list(SOURCES):
+        flagged = sweep(conn, kind)
+        print(f'{kind}: {flagged} likely duplicate pair(s)')
+    conn.close()
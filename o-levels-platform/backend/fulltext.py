@@ -0,0 +1,133 @@
+"""Full-text search over resources and questions.
+
+Backed by the external-content FTS5 tables created in migration 6
+(resources_fts, questions_fts), which triggers keep in step with the base
+tables. Results are BM25 ranked with highlighted snippets; every term is
+matched as a prefix so partial words work while the user is still typing.
+Snippets are returned as HTML: the stored text is escaped and only the
+<mark> tags around matched terms are markup.
+"""
+import html
+import re
+
+# BM25 column weights: a hit in a title counts more than one in a description
+RESOURCE_WEIGHTS = (10.0, 2.0, 5.0)  # title, description, topic
+QUESTION_WEIGHTS = (4.0, 5.0, 1.0)  # question_text, topic, explanation
+
+HIGHLIGHT_OPEN = '<mark>'
+HIGHLIGHT_CLOSE = '</mark>'
+# Control characters FTS5 inserts around matches, swapped for the tags after escaping
+_OPEN_MARKER = '\x02'
+_CLOSE_MARKER = '\x03'
+SNIPPET_TOKENS = 12
+
+TERM_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+def build_match_query(text):
+    """Turn free text into an FTS5 query of quoted prefix terms, or None"""
+    terms = TERM_PATTERN.findall(text or '')
+    if not terms:
+        return None
+    # Quoting neutralises FTS5 operators (AND, NEAR, column filters) in user input
+    return ' '.join(f'"{term}"*' for term in terms)
+
+def _highlight_html(text):
+    """Escape a highlight()/snippet() result and turn its markers into <mark> tags"""
+    if text is None:
+        return None
+    return html.escape(text).replace(_OPEN_MARKER, HIGHLIGHT_OPEN).replace(_CLOSE_MARKER, HIGHLIGHT_CLOSE)
+
+def _with_highlights(rows, columns):
+    hits = []
+    for row in rows:
+        hit = dict(row)
+        for column in columns:
+            hit[column] = _highlight_html(hit[column])
+        hits.append(hit)
+    return hits
+
+def search_resources(db, match, subject_id=None, resource_type=None, limit=20):
+    """Ranked resource hits for an FTS5 match expression"""
+    query = f'''
+        SELECT r.id, r.title, r.resource_type, r.subject_id, r.topic, r.difficulty,
+               s.name as subject_name,
+               highlight(resources_fts, 0, '{_OPEN_MARKER}', '{_CLOSE_MARKER}') as title_highlight,
+               snippet(resources_fts, 1, '{_OPEN_MARKER}', '{_CLOSE_MARKER}', '...', {SNIPPET_TOKENS}) as snippet,
+               bm25(resources_fts, {', '.join(map(str, RESOURCE_WEIGHTS))}) as rank
+        FROM resources_fts
+        JOIN resources r ON r.id = resources_fts.rowid
+        JOIN subjects s ON s.id = r.subject_id
+        WHERE resources_fts MATCH ?
+    '''
+    params = [match]
+    
+    if subject_id:
+        query += ' AND r.subject_id = ?'
+        params.append(subject_id)
+    
+    if resource_type:
+        query += ' AND r.resource_type = ?'
+        params.append(resource_type)
+    
+    query += ' ORDER BY rank LIMIT ?'
+    params.append(limit)
+    
+    return _with_highlights(db.execute(query, params).fetchall(), ('title_highlight', 'snippet'))
+
+def search_questions(db, match, subject_id=None, question_type=None, limit=20):
+    """Ranked question hits for an FTS5 match expression"""
+    query = f'''
+        SELECT q.id, q.subject_id, q.question_type, q.topic, q.difficulty, q.marks,
+               s.name as subject_name,
+               snippet(questions_fts, 0, '{_OPEN_MARKER}', '{_CLOSE_MARKER}', '...', {SNIPPET_TOKENS}) as snippet,
+               bm25(questions_fts, {', '.join(map(str, QUESTION_WEIGHTS))}) as rank
+        FROM questions_fts
+        JOIN questions q ON q.id = questions_fts.rowid
+        JOIN subjects s ON s.id = q.subject_id
+        WHERE questions_fts MATCH ?
+    '''
+    params = [match]
+    
+    if subject_id:
+        query += ' AND q.subject_id = ?'
+        params.append(subject_id)
+    
+    if question_type:
+        query += ' AND q.question_type = ?'
+        params.append(question_type)
+    
+    query += ' ORDER BY rank LIMIT ?'
+    params.append(limit)
+    
+    return _with_highlights(db.execute(query, params).fetchall(), ('snippet',))
+
+def search_facets(db, match, kind):
+    """Hit counts per subject and per type for a match, ignoring subject/type filters"""
+    if kind == 'resources':
+        table, alias, type_column = 'resources', 'r', 'resource_type'
+    else:
+        table, alias, type_column = 'questions', 'q', 'question_type'
+    
+    rows = db.execute(f'''
+        SELECT {alias}.subject_id, s.name as subject_name, {alias}.{type_column} as type, COUNT(*) as count
+        FROM {table}_fts
+        JOIN {table} {alias} ON {alias}.id = {table}_fts.rowid
+        JOIN subjects s ON s.id = {alias}.subject_id
+        WHERE {table}_fts MATCH ?
+        GROUP BY {alias}.subject_id, {alias}.{type_column}
+    ''', (match,)).fetchall()
+    
+    subjects, types = {}, {}
+    for row in rows:
+        subject = subjects.setdefault(row['subject_id'], {
+            'subject_id': row['subject_id'],
+            'subject_name': row['subject_name'],
+            'count': 0
+        })
+        subject['count'] += row['count']
+        types[row['type']] = types.get(row['type'], 0) + row['count']
+    
+    return {
+        'subjects': sorted(subjects.values(), key=lambda s: -s['count']),
+        'types': [{'type': t, 'count': c} for t, c in sorted(types.items(), key=lambda item: -item[1])]
+    }
@@ -0,0 +1,183 @@
+"""Test grading.
+
+Answer keys are built once per test (question order, marks and the
+normalized correct answer) and cached. Answers are compared after
+normalization: case, surrounding whitespace and trailing sentence
+punctuation are ignored, numbers compare by value (so 5.0 matches 5 but
+-5 does not), and MCQ answers may be given as the option letter or the
+option text.
+Each graded submission is stored in test_submissions with one
+test_answers row per question, so item statistics can be computed later
+without regrading.
+"""
+import json
+import re
+import threading
+from collections import OrderedDict
+from decimal import Decimal, InvalidOperation
+
+ANSWER_KEY_CACHE_SIZE = 512  # tests
+
+_WHITESPACE = re.compile(r'\s+')
+_TRAILING_PUNCTUATION = '.,;:!? '
+_NUMBER = re.compile(r'^[+-]?(\d+\.?\d*|\.\d+)(e[+-]?\d+)?$')
+
+def normalize_text(value):
+    """Case-fold, collapse whitespace, trim trailing sentence punctuation and canonicalize numbers"""
+    if value is None:
+        return None
+    text = _WHITESPACE.sub(' ', str(value)).strip().rstrip(_TRAILING_PUNCTUATION).casefold()
+    if _NUMBER.match(text):
+        try:
+            text = format((Decimal(text) + 0).normalize(), 'f')  # + 0 turns -0 into 0
+        except InvalidOperation:
+            pass
+    return text or None
+
+def _parse_options(options):
+    if not options:
+        return []
+    try:
+        parsed = json.loads(options) if isinstance(options, str) else options
+    except ValueError:
+        return []
+    return [normalize_text(option) for option in parsed] if isinstance(parsed, list) else []
+
+def normalize_answer(value, question_type, options=()):
+    """Normalize an answer for comparison.
+
+    MCQ answers resolve to the chosen option's index when they name an
+    option by letter (a, b, ...) or by its text.
+    """
+    text = normalize_text(value)
+    if text is None or question_type != 'mcq' or not options:
+        return text
+    if len(text) == 1 and 'a' <= text <= 'z' and ord(text) - ord('a') < len(options):
+        return ord(text) - ord('a')
+    if text in options:
+        return options.index(text)
+    return text
+
+def key_entry(row, position=None):
+    """Answer key entry for a questions row"""
+    options = _parse_options(row['options'])
+    return {
+        'question_id': row['id'],
+        'position': position,
+        'question_type': row['question_type'],
+        'options': options,
+        'marks': row['marks'] or 0,
+        'correct_answer': row['correct_answer'],
+        'expected': normalize_answer(row['correct_answer'], row['question_type'], options)
+    }
+
+class AnswerKeyCache:
+    """LRU cache of per-test answer keys, dropped when the questions table changes"""
+
+    def __init__(self, size=ANSWER_KEY_CACHE_SIZE):
+        self.size = size
+        self._keys = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+
+    def questions_version(self, db):
+        row = db.execute("SELECT version FROM table_versions WHERE name = 'questions'").fetchone()
+        return row['version'] if row else 0
+
+    def get(self, db, test_id, version=None):
+        """Answer key for a test as a list of question entries in test order"""
+        if version is None:
+            version = self.questions_version(db)
+        with self._lock:
+            if version != self._version:
+                self._keys.clear()
+                self._version = version
+            key = self._keys.get(test_id)
+            if key is not None:
+                self._keys.move_to_end(test_id)
+                return key
+        
+        rows = db.execute('''
+            SELECT q.id, q.question_type, q.options, q.correct_answer, q.marks, tq.position
+            FROM test_questions tq
+            JOIN questions q ON q.id = tq.question_id
+            WHERE tq.test_id = ?
+            ORDER BY tq.position
+        ''', (test_id,)).fetchall()
+        
+        key = [key_entry(row, row['position']) for row in rows]
+        
+        with self._lock:
+            if version == self._version:
+                self._keys[test_id] = key
+                while len(self._keys) > self.size:
+                    self._keys.popitem(last=False)
+        return key
+
+answer_keys = AnswerKeyCache()
+
+def grade(key, answers):
+    """Grade answers ({question_id: answer}) against an answer key.
+
+    Returns (score, max_score, outcomes) with one outcome dict per question.
+    """
+    score = 0
+    max_score = 0
+    outcomes = []
+    for entry in key:
+        max_score += entry['marks']
+        user_answer = answers.get(str(entry['question_id']))
+        given = normalize_answer(user_answer, entry['question_type'], entry['options'])
+        correct = given is not None and given == entry['expected']
+        awarded = entry['marks'] if correct else 0
+        score += awarded
+        outcomes.append({
+            'question_id': entry['question_id'],
+            'position': entry['position'],
+            'user_answer': user_answer,
+            'correct_answer': entry['correct_answer'],
+            'correct': correct,
+            'score': awarded,
+            'max_score': entry['marks']
+        })
+    return score, max_score, outcomes
+
+def record_submission(db, test_id, user_id, score, max_score, outcomes, time_taken=None):
+    """Store a graded submission and its per-question outcomes (caller commits)"""
+    percentage = (score / max_score) * 100 if max_score > 0 else 0
+    submission_id = db.execute('''
+        INSERT INTO test_submissions (test_id, user_id, score, max_score, percentage, time_taken)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (test_id, user_id, score, max_score, percentage, time_taken)).lastrowid
+    
+    db.executemany('''
+        INSERT INTO test_answers (
+            submission_id, test_id, user_id, question_id, position, answer, is_correct, score, max_score
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', [
+        (
+            submission_id, test_id, user_id, o['question_id'], o['position'],
+            None if o['user_answer'] is None else str(o['user_answer']),
+            1 if o['correct'] else 0, o['score'], o['max_score']
+        )
+        for o in outcomes
+    ])
+    
+    db.execute('''
+        UPDATE tests 
+        SET is_completed = 1, score = ?, time_taken = ?
+        WHERE id = ?
+    ''', (percentage, time_taken, test_id))
+    return submission_id, percentage
+
+def results_by_question(outcomes):
+    """API shape of the outcomes: {question_id: {...}}"""
+    return {
+        str(o['question_id']): {
+            'correct': o['correct'],
+            'score': o['score'],
+            'user_answer': o['user_answer'],
+            'correct_answer': o['correct_answer']
+        }
+        for o in outcomes
+    }
@@ -0,0 +1,169 @@
+"""Item statistics and question difficulty calibration.
+
+Scans the per-question outcomes stored by grading (test_answers) and
+keeps, per question:
+
+- p_value: proportion of responses answered correctly
+- discrimination: p(correct) in the top 27% of submissions minus the
+  bottom 27%, ranked by the submission's percentage score
+- point_biserial: correlation between answering correctly and the
+  submission's percentage score
+
+Only submissions newer than the job_state high-water mark are read.
+They are reduced to sufficient statistics with NumPy (sums, and counts
+per score decile) and added to what question_stats already holds, so
+each run costs time proportional to the new data only.
+
+Run with ``python item_stats.py`` (or ``--full`` to recompute from scratch).
+"""
+import sys
+import sqlite3
+import numpy as np
+
+JOB_NAME = 'item_stats'
+BINS = 10  # score deciles
+GROUP_FRACTION = 0.27  # upper/lower group size for the discrimination index
+CHUNK_SUBMISSIONS = 20000  # submissions read per batch
+
+def _group_p(bin_responses, bin_correct, group_size):
+    """p(correct) among the lowest group_size responses, taking bins low to high"""
+    before = np.cumsum(bin_responses, axis=1) - bin_responses
+    taken = np.clip(group_size[:, None] - before, 0, bin_responses)
+    rate = np.divide(bin_correct, bin_responses, out=np.zeros_like(bin_correct), where=bin_responses > 0)
+    correct = (taken * rate).sum(axis=1)
+    return np.divide(correct, group_size, out=np.full_like(correct, np.nan), where=group_size > 0)
+
+def derive_statistics(responses, correct, sum_total, sum_total_sq, sum_total_correct, bin_responses, bin_correct):
+    """Vectorized p-value, discrimination and point-biserial from sufficient statistics"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        p_value = np.where(responses > 0, correct / responses, np.nan)
+        
+        incorrect = responses - correct
+        mean_correct = sum_total_correct / correct
+        mean_incorrect = (sum_total - sum_total_correct) / incorrect
+        mean = sum_total / responses
+        sd = np.sqrt(np.maximum(sum_total_sq / responses - mean * mean, 0))
+        point_biserial = (mean_correct - mean_incorrect) / sd * np.sqrt(p_value * (1 - p_value))
+        point_biserial = np.where((correct > 0) & (incorrect > 0) & (sd > 0), point_biserial, np.nan)
+        
+        group_size = np.floor(responses * GROUP_FRACTION)
+        lower = _group_p(bin_responses, bin_correct, group_size)
+        upper = _group_p(bin_responses[:, ::-1], bin_correct[:, ::-1], group_size)
+        discrimination = upper - lower
+    
+    return p_value, discrimination, point_biserial
+
+def _nullable(values):
+    return [None if np.isnan(v) else float(v) for v in values]
+
+def _accumulate(db, question_ids, is_correct, totals):
+    """Fold one batch of (question, correct, submission %) outcomes into question_stats"""
+    qids, inverse = np.unique(question_ids, return_inverse=True)
+    count = len(qids)
+    
+    responses = np.bincount(inverse, minlength=count).astype(float)
+    correct = np.bincount(inverse, weights=is_correct, minlength=count)
+    sum_total = np.bincount(inverse, weights=totals, minlength=count)
+    sum_total_sq = np.bincount(inverse, weights=totals * totals, minlength=count)
+    sum_total_correct = np.bincount(inverse, weights=totals * is_correct, minlength=count)
+    
+    bins = np.clip((totals // (100 / BINS)).astype(int), 0, BINS - 1)
+    cell = inverse * BINS + bins
+    bin_responses = np.bincount(cell, minlength=count * BINS).reshape(count, BINS).astype(float)
+    bin_correct = np.bincount(cell, weights=is_correct, minlength=count * BINS).reshape(count, BINS)
+    
+    # Add what is already stored for these questions
+    id_list = [int(q) for q in qids]
+    position = {q: i for i, q in enumerate(id_list)}
+    for start in range(0, count, 500):
+        chunk = id_list[start:start + 500]
+        placeholders = ','.join(['?'] * len(chunk))
+        for row in db.execute(f'''
+            SELECT question_id, responses, correct, sum_total, sum_total_sq, sum_total_correct
+            FROM question_stats WHERE question_id IN ({placeholders})
+        ''', chunk):
+            i = position[row[0]]
+            responses[i] += row[1]
+            correct[i] += row[2]
+            sum_total[i] += row[3]
+            sum_total_sq[i] += row[4]
+            sum_total_correct[i] += row[5]
+        for row in db.execute(f'''
+            SELECT question_id, bin, responses, correct
+            FROM question_stat_bins WHERE question_id IN ({placeholders})
+        ''', chunk):
+            i = position[row[0]]
+            bin_responses[i, row[1]] += row[2]
+            bin_correct[i, row[1]] += row[3]
+    
+    p_value, discrimination, point_biserial = derive_statistics(
+        responses, correct, sum_total, sum_total_sq, sum_total_correct, bin_responses, bin_correct
+    )
+    
+    db.executemany('''
+        INSERT OR REPLACE INTO question_stats (
+            question_id, responses, correct, sum_total, sum_total_sq, sum_total_correct,
+            p_value, discrimination, point_biserial, updated_at
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+    ''', zip(
+        id_list, responses.astype(int).tolist(), correct.astype(int).tolist(),
+        sum_total.tolist(), sum_total_sq.tolist(), sum_total_correct.tolist(),
+        _nullable(p_value), _nullable(discrimination), _nullable(point_biserial)
+    ))
+    
+    nonzero = np.nonzero(bin_responses)
+    db.executemany('''
+        INSERT OR REPLACE INTO question_stat_bins (question_id, bin, responses, correct)
+        VALUES (?, ?, ?, ?)
+    ''', [
+        (id_list[i], int(b), int(bin_responses[i, b]), int(bin_correct[i, b]))
+        for i, b in zip(*nonzero)
+    ])
+    return count
+
+def run(db, full=False):
+    """Fold new submissions into question_stats; returns (submissions, questions) processed"""
+    if full:
+        db.execute('DELETE FROM question_stats')
+        db.execute('DELETE FROM question_stat_bins')
+        db.execute('DELETE FROM job_state WHERE name = ?', (JOB_NAME,))
+        db.commit()
+    
+    row = db.execute('SELECT last_id FROM job_state WHERE name = ?', (JOB_NAME,)).fetchone()
+    last_id = row[0] if row else 0
+    high = db.execute('SELECT COALESCE(MAX(id), 0) FROM test_submissions').fetchone()[0]
+    
+    submissions = 0
+    questions = 0
+    while last_id < high:
+        upper = min(last_id + CHUNK_SUBMISSIONS, high)
+        rows = db.execute('''
+            SELECT ta.question_id, ta.is_correct, s.percentage
+            FROM test_answers ta
+            JOIN test_submissions s ON s.id = ta.submission_id
+            WHERE ta.submission_id > ? AND ta.submission_id <= ?
+        ''', (last_id, upper)).fetchall()
+        
+        if rows:
+            data = np.array(rows, dtype=float)
+            questions += _accumulate(db, data[:, 0].astype(np.int64), data[:, 1], data[:, 2])
+        submissions += db.execute(
+            'SELECT COUNT(*) FROM test_submissions WHERE id > ? AND id <= ?', (last_id, upper)
+        ).fetchone()[0]
+        
+        # Stats and high-water mark move together
+        db.execute('''
+            INSERT INTO job_state (name, last_id) VALUES (?, ?)
+            ON CONFLICT (name) DO UPDATE SET last_id = excluded.last_id, updated_at = CURRENT_TIMESTAMP
+        ''', (JOB_NAME, upper))
+        db.commit()
+        last_id = upper
+    
+    return submissions, questions
+
+if __name__ == '__main__':
+    from database import get_db_path
+    conn = sqlite3.connect(get_db_path())
+    submissions, questions = run(conn, full='--full' in sys.argv[1:])
+    conn.close()
+    print(f'Processed {submissions} submissions, updated {questions} question(s)')
@@ -0,0 +1,110 @@
+"""Durable background job queue in SQLite.
+
+Jobs are rows in the jobs table, so they survive restarts and their status
+can be read by the API. enqueue() runs inside the caller's transaction; a
+job_key makes enqueueing idempotent (one inspection per blob, however many
+times the blob is uploaded). Workers claim queued jobs in a short
+BEGIN IMMEDIATE transaction, so two workers never take the same job, and
+a job whose worker died is handed out again once its lease runs out.
+Failed jobs are retried with exponential backoff up to MAX_ATTEMPTS.
+"""
+import json
+
+MAX_ATTEMPTS = 3
+RETRY_DELAY = 30  # seconds before the first retry, doubled for each later one
+LEASE_SECONDS = 600  # a running job not finished in this time is requeued
+
+def enqueue(db, kind, payload, job_key=None, requeue=False):
+    """Queue a job and return its id (caller commits).
+
+    With a job_key an existing job is reused; requeue=True runs it again if
+    it has already finished, with the new payload.
+    """
+    db.execute('''
+        INSERT INTO jobs (kind, job_key, payload) VALUES (?, ?, ?)
+        ON CONFLICT (kind, job_key) DO UPDATE
+        SET payload = excluded.payload, status = 'queued', attempts = 0, result = NULL,
+            error = NULL, run_after = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+        WHERE ? AND jobs.status IN ('done', 'failed')
+    ''', (kind, job_key, json.dumps(payload), bool(requeue)))
+    if job_key is None:
+        return db.execute('SELECT last_insert_rowid()').fetchone()[0]
+    return db.execute(
+        'SELECT id FROM jobs WHERE kind = ? AND job_key = ?', (kind, job_key)
+    ).fetchone()[0]
+
+def get_job(db, job_id):
+    return db.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+
+def describe(job):
+    """API shape of a job row"""
+    return {
+        'id': job['id'],
+        'kind': job['kind'],
+        'status': job['status'],
+        'attempts': job['attempts'],
+        'result': json.loads(job['result']) if job['result'] else None,
+        'error': job['error'],
+        'created_at': job['created_at'],
+        'updated_at': job['updated_at']
+    }
+
+def claim(db, worker, limit):
+    """Mark up to limit due jobs as running for a worker (commits); returns their rows"""
+    db.execute('BEGIN IMMEDIATE')
+    try:
+        # Requeue jobs whose worker stopped without finishing them
+        db.execute('''
+            UPDATE jobs SET status = 'queued', worker = NULL, updated_at = CURRENT_TIMESTAMP
+            WHERE status = 'running' AND started_at < datetime('now', ?)
+        ''', (f'-{int(LEASE_SECONDS)} seconds',))
+        jobs = db.execute('''
+            UPDATE jobs
+            SET status = 'running', worker = ?, attempts = attempts + 1,
+                started_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+            WHERE id IN (
+                SELECT id FROM jobs
+                WHERE status = 'queued' AND run_after <= CURRENT_TIMESTAMP
+                ORDER BY run_after, id
+                LIMIT ?
+            )
+            RETURNING *
+        ''', (worker, limit)).fetchall()
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return sorted(jobs, key=lambda job: job['id'])
+
+def complete(db, job_id, result):
+    """Record a job's result (caller commits)"""
+    db.execute('''
+        UPDATE jobs
+        SET status = 'done', result = ?, error = NULL, worker = NULL, updated_at = CURRENT_TIMESTAMP
+        WHERE id = ?
+    ''', (json.dumps(result), job_id))
+
+def fail(db, job, error):
+    """Schedule a retry of a failed job, or mark it failed after MAX_ATTEMPTS (caller commits)"""
+    if job['attempts'] < MAX_ATTEMPTS:
+        delay = RETRY_DELAY * 2 ** (job['attempts'] - 1)
+        db.execute('''
+            UPDATE jobs
+            SET status = 'queued', error = ?, worker = NULL,
+                run_after = datetime('now', ?), updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        ''', (error, f'+{int(delay)} seconds', job['id']))
+    else:
+        db.execute('''
+            UPDATE jobs
+            SET status = 'failed', error = ?, worker = NULL, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        ''', (error, job['id']))
+
+def release(db, job_id):
+    """Put a claimed job back in the queue without counting the attempt (caller commits)"""
+    db.execute('''
+        UPDATE jobs
+        SET status = 'queued', attempts = attempts - 1, worker = NULL, updated_at = CURRENT_TIMESTAMP
+        WHERE id = ?
+    ''', (job_id,))
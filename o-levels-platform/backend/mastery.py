@@ -0,0 +1,283 @@
+"""Per-topic ability estimates and adaptive question selection.
+
+Each user has a Rasch (1PL IRT) ability theta per (subject, topic). A
+question's difficulty b comes from its calibrated p-value in
+question_stats once enough responses exist, otherwise from its
+difficulty label. The chance of a correct answer is sigmoid(theta - b).
+
+Estimates are updated incrementally: the current estimate and its
+precision act as a normal prior, and a few Newton steps fold in the
+outcomes of submissions the user made since the last update (vectorized
+over topics with NumPy). Topics a user has not been tested on start from
+a subject-level prior taken from their past test and resource scores.
+
+Adaptive tests pick questions with the most Fisher information,
+p * (1 - p), at the user's current ability in each topic.
+"""
+import threading
+from collections import OrderedDict
+import numpy as np
+from question_index import question_index
+
+# Rasch difficulty for uncalibrated questions, by label
+DIFFICULTY_LOCATIONS = {'easy': -1.0, 'medium': 0.0, 'hard': 1.0}
+
+# Responses needed before a question's p-value replaces its label
+MIN_CALIBRATION_RESPONSES = 30
+
+PRIOR_PRECISION = 1.0  # weight of the starting estimate, in responses
+NEWTON_STEPS = 4
+THETA_LIMIT = 4.0
+
+ADAPTIVE_POOL = 200  # questions considered per difficulty and mark value
+ABILITY_CACHE_SIZE = 1024  # users
+
+def _sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+def _logit(p):
+    p = np.clip(p, 0.02, 0.98)
+    return np.log(p / (1 - p))
+
+def difficulty_locations(labels, p_values, responses):
+    """Rasch difficulty per question from calibration stats, falling back to labels"""
+    labels = np.array([DIFFICULTY_LOCATIONS.get(label, 0.0) for label in labels], dtype=float)
+    p_values = np.array([np.nan if p is None else p for p in p_values], dtype=float)
+    calibrated = (np.array(responses, dtype=float) >= MIN_CALIBRATION_RESPONSES) & ~np.isnan(p_values)
+    return np.where(calibrated, -_logit(np.nan_to_num(p_values, nan=0.5)), labels)
+
+def update_abilities(theta, precision, topic_index, outcomes, difficulties):
+    """Fold responses into (theta, precision) per topic; returns new arrays.
+
+    ``outcomes`` are fractions of marks scored (1/0 for right/wrong).
+    """
+    prior_theta = theta.astype(float)
+    prior_precision = precision.astype(float)
+    theta = prior_theta.copy()
+    count = len(theta)
+    for _ in range(NEWTON_STEPS):
+        p = _sigmoid(theta[topic_index] - difficulties)
+        gradient = np.bincount(topic_index, outcomes - p, count) - prior_precision * (theta - prior_theta)
+        hessian = np.bincount(topic_index, p * (1 - p), count) + prior_precision
+        theta = np.clip(theta + gradient / hessian, -THETA_LIMIT, THETA_LIMIT)
+    p = _sigmoid(theta[topic_index] - difficulties)
+    return theta, prior_precision + np.bincount(topic_index, p * (1 - p), count)
+
+def information(theta, difficulties):
+    """Fisher information of each question at the given abilities"""
+    p = _sigmoid(theta - difficulties)
+    return p * (1 - p)
+
+def question_difficulties(db, question_ids, labels):
+    """Rasch difficulty for each question id, given its difficulty label"""
+    stats = {}
+    ids = list(question_ids)
+    for start in range(0, len(ids), 500):
+        chunk = ids[start:start + 500]
+        placeholders = ','.join(['?'] * len(chunk))
+        for row in db.execute(f'''
+            SELECT question_id, p_value, responses FROM question_stats
+            WHERE question_id IN ({placeholders})
+        ''', chunk):
+            stats[row['question_id']] = (row['p_value'], row['responses'])
+    found = [stats.get(question_id, (None, 0)) for question_id in ids]
+    return difficulty_locations(labels, [f[0] for f in found], [f[1] for f in found])
+
+class _UserAbilities:
+    __slots__ = ('watermark', 'topics', 'priors')
+
+    def __init__(self, watermark, topics):
+        self.watermark = watermark
+        self.topics = topics  # (subject_id, topic) -> (theta, precision, responses)
+        self.priors = {}  # subject_id -> theta for untested topics
+
+class AbilityModel:
+    """Per-user ability estimates, cached and kept in step with submissions"""
+
+    def __init__(self, size=ABILITY_CACHE_SIZE):
+        self.size = size
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _watermark(self, db, user_id):
+        row = db.execute('''
+            SELECT last_submission_id FROM user_ability_state WHERE user_id = ?
+        ''', (user_id,)).fetchone()
+        return row['last_submission_id'] if row else 0
+
+    def _load(self, db, user_id, watermark):
+        rows = db.execute('''
+            SELECT subject_id, topic, theta, precision, responses
+            FROM user_topic_ability WHERE user_id = ?
+        ''', (user_id,)).fetchall()
+        return _UserAbilities(watermark, {
+            (row['subject_id'], row['topic']): (row['theta'], row['precision'], row['responses'])
+            for row in rows
+        })
+
+    def _cached(self, db, user_id):
+        watermark = self._watermark(db, user_id)
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is not None and entry.watermark == watermark:
+                self._users.move_to_end(user_id)
+                return entry
+        entry = self._load(db, user_id, watermark)
+        self._store(user_id, entry)
+        return entry
+
+    def _store(self, user_id, entry):
+        with self._lock:
+            self._users[user_id] = entry
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.size:
+                self._users.popitem(last=False)
+
+    def subject_prior(self, db, user_id, subject_id, entry=None):
+        """Starting ability for untested topics, from past test and resource scores"""
+        if entry is not None and subject_id in entry.priors:
+            return entry.priors[subject_id]
+        row = db.execute('''
+            SELECT
+                (SELECT SUM(score_total) FROM user_subject_progress
+                 WHERE user_id = ? AND subject_id = ?) as progress_total,
+                (SELECT SUM(scored_count) FROM user_subject_progress
+                 WHERE user_id = ? AND subject_id = ?) as progress_count,
+                (SELECT SUM(score) FROM tests
+                 WHERE user_id = ? AND subject_id = ? AND is_completed = 1) as test_total,
+                (SELECT COUNT(score) FROM tests
+                 WHERE user_id = ? AND subject_id = ? AND is_completed = 1) as test_count
+        ''', (user_id, subject_id) * 4).fetchone()
+        total = (row['progress_total'] or 0) + (row['test_total'] or 0)
+        count = (row['progress_count'] or 0) + (row['test_count'] or 0)
+        prior = float(_logit(total / count / 100)) if count else 0.0
+        if entry is not None:
+            entry.priors[subject_id] = prior
+        return prior
+
+    def _fold(self, db, user_id, entry):
+        """Estimates with the user's unprocessed submissions folded in, unsaved.
+
+        Returns (updated ability rows, new watermark), or None if there are no
+        new submissions.
+        """
+        rows = db.execute('''
+            SELECT s.id as submission_id, q.subject_id, q.topic, q.difficulty,
+                   ta.question_id, ta.score, ta.max_score,
+                   qs.p_value, COALESCE(qs.responses, 0) as calibrated_responses
+            FROM test_submissions s
+            JOIN test_answers ta ON ta.submission_id = s.id
+            JOIN questions q ON q.id = ta.question_id
+            LEFT JOIN question_stats qs ON qs.question_id = ta.question_id
+            WHERE s.user_id = ? AND s.id > ?
+        ''', (user_id, entry.watermark)).fetchall()
+        if not rows:
+            return None
+        
+        keys = sorted({(row['subject_id'], row['topic']) for row in rows})
+        position = {key: i for i, key in enumerate(keys)}
+        theta = np.empty(len(keys))
+        precision = np.empty(len(keys))
+        responses = np.zeros(len(keys), dtype=int)
+        for i, key in enumerate(keys):
+            current = entry.topics.get(key)
+            if current is None:
+                theta[i] = self.subject_prior(db, user_id, key[0], entry)
+                precision[i] = PRIOR_PRECISION
+            else:
+                theta[i], precision[i], responses[i] = current
+        
+        topic_index = np.array([position[(row['subject_id'], row['topic'])] for row in rows])
+        outcomes = np.array([
+            row['score'] / row['max_score'] if row['max_score'] else 0.0 for row in rows
+        ])
+        difficulties = difficulty_locations(
+            [row['difficulty'] for row in rows],
+            [row['p_value'] for row in rows],
+            [row['calibrated_responses'] for row in rows]
+        )
+        theta, precision = update_abilities(theta, precision, topic_index, outcomes, difficulties)
+        responses = responses + np.bincount(topic_index, minlength=len(keys))
+        
+        updated = [
+            (user_id, key[0], key[1], float(theta[i]), float(precision[i]), int(responses[i]))
+            for i, key in enumerate(keys)
+        ]
+        return updated, max(row['submission_id'] for row in rows)
+
+    @staticmethod
+    def _merged(entry, updated, watermark):
+        topics = dict(entry.topics)
+        topics.update({(u[1], u[2]): u[3:] for u in updated})
+        return _UserAbilities(watermark, topics)
+
+    def refresh(self, db, user_id):
+        """Fold the user's unprocessed submissions into their estimates (caller commits)"""
+        entry = self._cached(db, user_id)
+        folded = self._fold(db, user_id, entry)
+        if folded is None:
+            return entry
+        updated, watermark = folded
+        db.executemany('''
+            INSERT OR REPLACE INTO user_topic_ability (
+                user_id, subject_id, topic, theta, precision, responses, updated_at
+            ) VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+        ''', updated)
+        db.execute('''
+            INSERT INTO user_ability_state (user_id, last_submission_id) VALUES (?, ?)
+            ON CONFLICT (user_id) DO UPDATE SET
+                last_submission_id = excluded.last_submission_id, updated_at = CURRENT_TIMESTAMP
+        ''', (user_id, watermark))
+        
+        # A rolled back transaction leaves the stored watermark behind the
+        # cached one, so the entry is reloaded on next use
+        entry = self._merged(entry, updated, watermark)
+        self._store(user_id, entry)
+        return entry
+
+    def estimate(self, db, user_id):
+        """Current estimates, unprocessed submissions included, without writing anything"""
+        entry = self._cached(db, user_id)
+        folded = self._fold(db, user_id, entry)
+        if folded is None:
+            return entry
+        return self._merged(entry, *folded)
+
+    def abilities(self, db, user_id, subject_id, persist=True):
+        """({topic: (theta, precision, responses)}, prior theta) for one subject.
+
+        With persist=False new submissions are folded in without saving them.
+        """
+        entry = self.refresh(db, user_id) if persist else self.estimate(db, user_id)
+        topics = {key[1]: value for key, value in entry.topics.items() if key[0] == subject_id}
+        return topics, self.subject_prior(db, user_id, subject_id, entry)
+
+    def candidate_groups(self, db, user_id, subject_id, topics=None, question_types=None, max_marks=None, rng=None):
+        """Candidates across all difficulties, grouped by marks and ordered by information.
+        
+        Feed to assembly.assemble(..., ranked=True).
+        """
+        subject_id = int(subject_id)
+        estimates, prior = self.abilities(db, user_id, subject_id)
+        
+        candidates, labels = [], []
+        for difficulty in DIFFICULTY_LOCATIONS:
+            groups = question_index.candidate_groups(db, subject_id, difficulty, topics, question_types, max_marks)
+            for group in groups.values():
+                pool = group.sample(rng, ADAPTIVE_POOL) if rng is not None else list(group)[:ADAPTIVE_POOL]
+                candidates.extend(pool)
+                labels.extend([difficulty] * len(pool))
+        if not candidates:
+            return {}
+        
+        difficulties = question_difficulties(db, [c[0] for c in candidates], labels)
+        theta = np.array([estimates.get(c[2], (prior,))[0] for c in candidates])
+        scores = information(theta, difficulties)
+        
+        groups = {}
+        for index in np.argsort(-scores, kind='stable'):
+            candidate = candidates[index]
+            groups.setdefault(candidate[1], []).append(candidate)
+        return groups
+
+ability_model = AbilityModel()
@@ -0,0 +1,276 @@
+"""Pure-Python inspection of uploaded files.
+
+inspect() reads just enough of a file to check that it is whole and to pull
+out the metadata resources show: the page count of a PDF (or the page and
+slide counts Office writes into docx/pptx), and the duration of MP4/MOV
+and AVI videos. Nothing here imports a PDF or media library; the parsers
+walk the container structures directly, seeking rather than reading whole
+files, so they are safe to run on large uploads in worker processes.
+"""
+import mmap
+import os
+import re
+import struct
+import zipfile
+import zlib
+
+MAX_OBJECT_STREAM = 16 * 1024 * 1024  # decompressed bytes read per PDF object stream
+
+class MediaError(Exception):
+    """A file whose structure is broken"""
+
+def duration_minutes(seconds):
+    """resources.duration (whole minutes, at least 1) for a length in seconds"""
+    if not seconds:
+        return None
+    return max(1, int(round(seconds / 60)))
+
+# PDF
+
+_PAGES = re.compile(rb'/Type\s*/Pages\b')
+_PAGE = re.compile(rb'/Type\s*/Page\b(?!s)')
+_COUNT = re.compile(rb'/Count\s+(\d+)')
+_OBJECT_STREAM = re.compile(rb'/Type\s*/ObjStm\b')
+_STREAM = re.compile(rb'stream\r?\n')
+
+def _enclosing_dict(data, position, window=4096):
+    """The << ... >> dictionary that contains position, or None"""
+    depth = 0
+    start = None
+    index = position
+    floor = max(0, position - window)
+    while index > floor:
+        index -= 1
+        pair = data[index - 1:index + 1]
+        if pair == b'>>':
+            depth += 1
+            index -= 1
+        elif pair == b'<<':
+            if depth == 0:
+                start = index - 1
+                break
+            depth -= 1
+            index -= 1
+    if start is None:
+        return None
+
+    depth = 0
+    index = start
+    ceiling = min(len(data), start + 4 * window)
+    while index < ceiling - 1:
+        pair = data[index:index + 2]
+        if pair == b'<<':
+            depth += 1
+            index += 2
+        elif pair == b'>>':
+            depth -= 1
+            index += 2
+            if depth == 0:
+                return data[start:index]
+        else:
+            index += 1
+    return None
+
+def _page_tree_count(data):
+    """Largest /Count of a /Pages node in data (the root's), or None"""
+    best = None
+    for match in _PAGES.finditer(data):
+        node = _enclosing_dict(data, match.start())
+        count = _COUNT.search(node) if node else None
+        if count:
+            best = max(best or 0, int(count.group(1)))
+    return best
+
+def _object_streams(data):
+    """Decompressed contents of the FlateDecode object streams in a PDF"""
+    for match in _OBJECT_STREAM.finditer(data):
+        stream = _STREAM.search(data, match.end(), match.end() + 4096)
+        if stream is None:
+            continue
+        inflater = zlib.decompressobj()
+        position = stream.end()
+        pieces, size = [], 0
+        try:
+            # Fed in pieces; the inflater stops at the end of the stream
+            while not inflater.eof and position < len(data) and size < MAX_OBJECT_STREAM:
+                piece = inflater.decompress(data[position:position + 65536])
+                position += 65536
+                pieces.append(piece)
+                size += len(piece)
+        except zlib.error:
+            continue  # not Flate, or encrypted
+        yield b''.join(pieces)
+
+def pdf_info(path):
+    """{'page_count'} of a PDF; raises MediaError if it is not a whole PDF"""
+    if os.path.getsize(path) == 0:
+        raise MediaError('empty file')
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        if data.find(b'%PDF-', 0, 1024) < 0:
+            raise MediaError('missing %PDF header')
+        if data.rfind(b'%%EOF', max(0, len(data) - 2048)) < 0:
+            raise MediaError('missing %%EOF trailer (truncated?)')
+
+        count = _page_tree_count(data)
+        if count is None:
+            # Cross-reference streams keep the page tree in object streams
+            for content in _object_streams(data):
+                found = _page_tree_count(content)
+                if found is not None:
+                    count = max(count or 0, found)
+        if count is None:
+            count = len(_PAGE.findall(data)) or None
+    if not count:
+        raise MediaError('no pages found')
+    return {'page_count': count}
+
+# ISO base media (MP4, MOV)
+
+def _boxes(f, start, end):
+    """Yield (type, payload start, payload end) of the boxes in [start, end)"""
+    position = start
+    while position + 8 <= end:
+        f.seek(position)
+        header = f.read(8)
+        if len(header) < 8:
+            raise MediaError('truncated box header')
+        size, kind = struct.unpack('>I4s', header)
+        payload = position + 8
+        if size == 1:
+            large = f.read(8)
+            if len(large) < 8:
+                raise MediaError('truncated box header')
+            size = struct.unpack('>Q', large)[0]
+            payload += 8
+        elif size == 0:
+            size = end - position
+        if size < payload - position or position + size > end:
+            raise MediaError(f'{kind.decode("latin-1")} box runs past the end of the file (truncated?)')
+        yield kind, payload, position + size
+        position += size
+
+def mp4_info(path):
+    """{'duration_seconds'} from the movie header of an MP4/MOV file"""
+    size = os.path.getsize(path)
+    duration = None
+    with open(path, 'rb') as f:
+        kinds = []
+        for kind, start, end in _boxes(f, 0, size):
+            kinds.append(kind)
+            if kind != b'moov':
+                continue
+            for child, child_start, _ in _boxes(f, start, end):
+                if child != b'mvhd':
+                    continue
+                f.seek(child_start)
+                version = f.read(1)
+                if not version:
+                    raise MediaError('truncated mvhd')
+                if version[0] == 1:
+                    f.seek(child_start + 4 + 16)
+                    timescale, length = struct.unpack('>IQ', f.read(12))
+                else:
+                    f.seek(child_start + 4 + 8)
+                    timescale, length = struct.unpack('>II', f.read(8))
+                if timescale:
+                    duration = length / timescale
+    if b'moov' not in kinds:
+        raise MediaError('no moov box')
+    if b'mdat' not in kinds and b'moof' not in kinds:
+        raise MediaError('no media data')
+    return {'duration_seconds': duration}
+
+# AVI
+
+def avi_info(path):
+    """{'duration_seconds'} from the main AVI header"""
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        header = f.read(12)
+        if len(header) < 12 or header[:4] != b'RIFF' or header[8:12] != b'AVI ':
+            raise MediaError('not a RIFF AVI file')
+        if struct.unpack('<I', header[4:8])[0] + 8 > size:
+            raise MediaError('RIFF size runs past the end of the file (truncated?)')
+        # hdrl LIST comes first; avih is its first chunk
+        chunk = f.read(20)
+        if len(chunk) < 20 or chunk[:4] != b'LIST' or chunk[8:12] != b'hdrl' or chunk[12:16] != b'avih':
+            raise MediaError('missing AVI header')
+        avih = f.read(20)
+        if len(avih) < 20:
+            raise MediaError('truncated AVI header')
+    micro_per_frame, _, _, _, frames = struct.unpack('<5I', avih)
+    return {'duration_seconds': micro_per_frame * frames / 1000000 or None}
+
+# Office
+
+_APP_COUNTS = {'docx': rb'<Pages>(\d+)</Pages>', 'pptx': rb'<Slides>(\d+)</Slides>'}
+
+def office_info(path, extension):
+    """{'page_count'} of a docx/pptx, after checking every member's CRC"""
+    try:
+        with zipfile.ZipFile(path) as archive:
+            bad = archive.testzip()
+            if bad is not None:
+                raise MediaError(f'corrupt member {bad}')
+            names = archive.namelist()
+            count = None
+            if 'docProps/app.xml' in names:
+                found = re.search(_APP_COUNTS[extension], archive.read('docProps/app.xml'))
+                count = int(found.group(1)) if found else None
+            if count is None and extension == 'pptx':
+                count = sum(1 for name in names if re.match(r'ppt/slides/slide\d+\.xml$', name)) or None
+    except (zipfile.BadZipFile, zlib.error, EOFError) as e:
+        raise MediaError(str(e))
+    return {'page_count': count}
+
+# Signature checks for formats with nothing to extract
+
+_SIGNATURES = {
+    'png': (b'\x89PNG\r\n\x1a\n', b'IEND\xaeB`\x82'),
+    'jpg': (b'\xff\xd8', b'\xff\xd9'),
+    'jpeg': (b'\xff\xd8', b'\xff\xd9'),
+    'doc': (b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1', None),
+    'ppt': (b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1', None)
+}
+
+def check_signature(path, extension):
+    head, tail = _SIGNATURES[extension]
+    with open(path, 'rb') as f:
+        if f.read(len(head)) != head:
+            raise MediaError(f'not a {extension} file')
+        if tail:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - 64))
+            if tail not in f.read():
+                raise MediaError('missing end marker (truncated?)')
+    return {}
+
+def inspect(path):
+    """Check a stored file and extract its metadata.
+
+    Returns {'media_type', 'integrity': 'ok'|'corrupt', 'error',
+    'page_count', 'duration_seconds'}; a broken file is a result, not an
+    exception. Raises OSError if the file cannot be read at all.
+    """
+    extension = os.path.splitext(path)[1].lower().lstrip('.')
+    result = {
+        'media_type': extension or None, 'integrity': 'ok', 'error': None,
+        'page_count': None, 'duration_seconds': None
+    }
+    try:
+        if extension == 'pdf':
+            result.update(pdf_info(path))
+        elif extension in ('mp4', 'mov'):
+            result.update(mp4_info(path))
+        elif extension == 'avi':
+            result.update(avi_info(path))
+        elif extension in ('docx', 'pptx'):
+            result.update(office_info(path, extension))
+        elif extension in _SIGNATURES:
+            result.update(check_signature(path, extension))
+        else:
+            result['integrity'] = None  # nothing known to check
+    except (MediaError, struct.error) as e:
+        result['integrity'] = 'corrupt'
+        result['error'] = str(e) or e.__class__.__name__
+    return result
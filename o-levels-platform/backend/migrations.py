@@ -0,0 +1,923 @@
+"""Versioned schema migrations.
+
+Each migration runs once, in version order, inside its own transaction and
+is recorded in the schema_version table, so init_db() can bring both new
+and existing database files up to date.
+"""
+import ast
+import os
+import re
+import sqlite3
+import sys
+
+MIGRATIONS = []
+
+# Small lookup tables that are fine to scan in full
+ALLOWED_SCANS = {'subjects'}
+
+def migration(version, description):
+    """Register a migration step"""
+    def decorator(func):
+        MIGRATIONS.append((version, description, func))
+        return func
+    return decorator
+
+def get_schema_version(conn):
+    """Get the highest applied migration version"""
+    row = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()
+    return row[0] or 0
+
+def migrate(conn):
+    """Apply all pending migrations, returning the versions applied"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.commit()
+    
+    applied = []
+    for version, description, func in sorted(MIGRATIONS, key=lambda m: m[0]):
+        # BEGIN IMMEDIATE serialises concurrent workers starting up together
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if version <= get_schema_version(conn):
+                conn.rollback()
+                continue
+            func(conn.cursor())
+            conn.execute(
+                'INSERT INTO schema_version (version, description) VALUES (?, ?)',
+                (version, description)
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(version)
+    return applied
+
+@migration(1, 'Initial schema')
+def _initial_schema(cursor):
+    # Users table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username VARCHAR(50) UNIQUE NOT NULL,
+            email VARCHAR(100) UNIQUE NOT NULL,
+            password_hash VARCHAR(255) NOT NULL,
+            full_name VARCHAR(100),
+            grade_level VARCHAR(20),
+            school VARCHAR(100),
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            last_login DATETIME,
+            is_active BOOLEAN DEFAULT 1
+        )
+    ''')
+
+    # Subjects table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS subjects (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name VARCHAR(100) NOT NULL,
+            code VARCHAR(10) UNIQUE NOT NULL,
+            description TEXT,
+            color VARCHAR(7),
+            icon VARCHAR(50),
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Resources table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS resources (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            subject_id INTEGER NOT NULL,
+            title VARCHAR(255) NOT NULL,
+            description TEXT,
+            resource_type VARCHAR(50) NOT NULL, -- 'notes', 'video', 'questions', 'past_paper'
+            file_path VARCHAR(500),
+            file_size INTEGER,
+            duration INTEGER, -- for videos in minutes
+            difficulty VARCHAR(20), -- 'easy', 'medium', 'hard'
+            marks INTEGER,
+            paper_number INTEGER,
+            year INTEGER,
+            topic VARCHAR(100),
+            uploaded_by INTEGER,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            download_count INTEGER DEFAULT 0,
+            view_count INTEGER DEFAULT 0,
+            FOREIGN KEY (subject_id) REFERENCES subjects (id),
+            FOREIGN KEY (uploaded_by) REFERENCES users (id)
+        )
+    ''')
+
+    # User progress table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_progress (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            subject_id INTEGER NOT NULL,
+            resource_id INTEGER,
+            progress_type VARCHAR(50), -- 'completed', 'in_progress', 'bookmarked'
+            completed BOOLEAN DEFAULT 0,
+            score DECIMAL(5,2),
+            time_spent INTEGER, -- in minutes
+            last_accessed DATETIME DEFAULT CURRENT_TIMESTAMP,
+            notes TEXT,
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            FOREIGN KEY (subject_id) REFERENCES subjects (id),
+            FOREIGN KEY (resource_id) REFERENCES resources (id)
+        )
+    ''')
+
+    # Tests table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS tests (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            title VARCHAR(255) NOT NULL,
+            subject_id INTEGER NOT NULL,
+            paper_number INTEGER,
+            difficulty VARCHAR(20),
+            total_marks INTEGER,
+            time_limit INTEGER, -- in minutes
+            question_types TEXT, -- JSON array of question types
+            custom_questions TEXT, -- JSON array of question IDs
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            is_completed BOOLEAN DEFAULT 0,
+            score DECIMAL(5,2),
+            time_taken INTEGER,
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            FOREIGN KEY (subject_id) REFERENCES subjects (id)
+        )
+    ''')
+
+    # Questions table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS questions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            subject_id INTEGER NOT NULL,
+            question_text TEXT NOT NULL,
+            question_type VARCHAR(50) NOT NULL, -- 'mcq', 'short', 'long'
+            options TEXT, -- JSON array for MCQ options
+            correct_answer TEXT,
+            marks INTEGER,
+            difficulty VARCHAR(20),
+            topic VARCHAR(100),
+            explanation TEXT,
+            created_by INTEGER,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (subject_id) REFERENCES subjects (id),
+            FOREIGN KEY (created_by) REFERENCES users (id)
+        )
+    ''')
+
+    # User activity table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_activity (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            activity_type VARCHAR(50) NOT NULL, -- 'login', 'resource_view', 'test_taken', 'progress_update'
+            activity_details TEXT,
+            activity_date DATETIME DEFAULT CURRENT_TIMESTAMP,
+            ip_address VARCHAR(45),
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+
+    # Seed reference data on a brand new database
+    if cursor.execute('SELECT COUNT(*) FROM subjects').fetchone()[0]:
+        return
+    
+    # Insert sample subjects
+    sample_subjects = [
+        ('Mathematics', 'MATH', 'Comprehensive mathematics curriculum', '#ff6b6b', 'calculator'),
+        ('Computer Science', 'COMP', 'Programming and computer fundamentals', '#4ecdc4', 'laptop-code'),
+        ('Chemistry', 'CHEM', 'Study of elements and compounds', '#45b7d1', 'flask'),
+        ('Physics', 'PHYS', 'Fundamental principles of matter and energy', '#ffa726', 'atom'),
+        ('English', 'ENG', 'Language skills and literature', '#ba68c8', 'book-open'),
+        ('Islamiat', 'ISL', 'Islamic studies and teachings', '#66bb6a', 'mosque'),
+        ('Pakistan Studies', 'PST', 'History and geography of Pakistan', '#78909c', 'globe-asia')
+    ]
+
+    cursor.executemany('''
+        INSERT INTO subjects (name, code, description, color, icon) 
+        VALUES (?, ?, ?, ?, ?)
+    ''', sample_subjects)
+
+    # Insert sample admin user
+    cursor.execute('''
+        INSERT INTO users (username, email, password_hash, full_name, grade_level, school)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', ('admin', 'admin@olevels.com', 'pbkdf2:sha256:260000$abc123$hashedpassword', 'Admin User', 'O-Level', 'Demo School'))
+
+@migration(2, 'Indexes for hot-path queries')
+def _hot_path_indexes(cursor):
+    # Resource listings filter by subject/type and sort newest first
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_resources_subject_type_created
+        ON resources (subject_id, resource_type, created_at)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_resources_created
+        ON resources (created_at)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_resources_subject_topic
+        ON resources (subject_id, topic)
+    ''')
+    
+    # Progress lookups and joins are always scoped to one user
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_user_progress_user_resource
+        ON user_progress (user_id, resource_id, completed)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_user_activity_user_date
+        ON user_activity (user_id, activity_date)
+    ''')
+    
+    # Test generation filters the question bank by these columns
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_questions_subject_difficulty
+        ON questions (subject_id, difficulty, topic, question_type)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_tests_user
+        ON tests (user_id)
+    ''')
+
+@migration(3, 'Resource counters and keyset pagination index')
+def _resource_counters(cursor):
+    # Per subject/type totals kept current by triggers so listings never
+    # need a COUNT(*) over the resources table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS resource_counters (
+            subject_id INTEGER NOT NULL,
+            resource_type VARCHAR(50) NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (subject_id, resource_type)
+        )
+    ''')
+    cursor.execute('DELETE FROM resource_counters')
+    cursor.execute('''
+        INSERT INTO resource_counters (subject_id, resource_type, count)
+        SELECT subject_id, resource_type, COUNT(*)
+        FROM resources
+        GROUP BY subject_id, resource_type
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_resources_count_insert
+        AFTER INSERT ON resources
+        BEGIN
+            INSERT INTO resource_counters (subject_id, resource_type, count)
+            VALUES (NEW.subject_id, NEW.resource_type, 1)
+            ON CONFLICT (subject_id, resource_type) DO UPDATE SET count = count + 1;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_resources_count_delete
+        AFTER DELETE ON resources
+        BEGIN
+            UPDATE resource_counters SET count = count - 1
+            WHERE subject_id = OLD.subject_id AND resource_type = OLD.resource_type;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_resources_count_update
+        AFTER UPDATE OF subject_id, resource_type ON resources
+        BEGIN
+            UPDATE resource_counters SET count = count - 1
+            WHERE subject_id = OLD.subject_id AND resource_type = OLD.resource_type;
+            INSERT INTO resource_counters (subject_id, resource_type, count)
+            VALUES (NEW.subject_id, NEW.resource_type, 1)
+            ON CONFLICT (subject_id, resource_type) DO UPDATE SET count = count + 1;
+        END
+    ''')
+    
+    # Subject-only listings page by (created_at, id) within one subject
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_resources_subject_created
+        ON resources (subject_id, created_at)
+    ''')
+
+@migration(4, 'Materialized per-user subject progress')
+def _user_subject_progress(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_subject_progress (
+            user_id INTEGER NOT NULL,
+            subject_id INTEGER NOT NULL,
+            resource_type VARCHAR(50) NOT NULL,
+            completed_resources INTEGER NOT NULL DEFAULT 0,
+            scored_count INTEGER NOT NULL DEFAULT 0,
+            score_total REAL NOT NULL DEFAULT 0,
+            time_spent INTEGER NOT NULL DEFAULT 0,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, subject_id, resource_type)
+        )
+    ''')
+    cursor.execute('DELETE FROM user_subject_progress')
+    cursor.execute('''
+        INSERT INTO user_subject_progress (
+            user_id, subject_id, resource_type, completed_resources, scored_count, score_total, time_spent
+        )
+        SELECT up.user_id, r.subject_id, r.resource_type,
+               SUM(CASE WHEN up.completed = 1 THEN 1 ELSE 0 END),
+               COUNT(up.score),
+               COALESCE(SUM(up.score), 0),
+               COALESCE(SUM(up.time_spent), 0)
+        FROM user_progress up
+        JOIN resources r ON r.id = up.resource_id
+        GROUP BY up.user_id, r.subject_id, r.resource_type
+    ''')
+
+# Columns whose changes are not tracked by table_versions: the buffered
+# popularity counters would otherwise invalidate every cached listing
+UNVERSIONED_COLUMNS = {'resources': {'view_count', 'download_count'}}
+
+def _create_version_triggers(cursor, table):
+    """Bump a table's row in table_versions on any insert, update or delete"""
+    cursor.execute(
+        'INSERT OR IGNORE INTO table_versions (name, version) VALUES (?, 1)', (table,)
+    )
+    
+    columns = [row[1] for row in cursor.execute(f'PRAGMA table_info({table})').fetchall()]
+    tracked = [c for c in columns if c not in UNVERSIONED_COLUMNS.get(table, ())]
+    events = {
+        'insert': 'INSERT',
+        'update': f'UPDATE OF {", ".join(tracked)}',
+        'delete': 'DELETE'
+    }
+    for suffix, event in events.items():
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_version_{suffix}
+            AFTER {event} ON {table}
+            BEGIN
+                UPDATE table_versions
+                SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+                WHERE name = '{table}';
+            END
+        ''')
+
+@migration(5, 'Per-table change counters for conditional GET')
+def _table_versions(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS table_versions (
+            name VARCHAR(50) PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 1,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    for table in ('subjects', 'resources', 'tests', 'questions', 'users'):
+        _create_version_triggers(cursor, table)
+
+def _create_fts_index(cursor, table, columns):
+    """Create an external-content FTS5 index over table, kept in sync by triggers"""
+    fts = f'{table}_fts'
+    column_list = ', '.join(columns)
+    new_values = ', '.join(f'new.{c}' for c in columns)
+    old_values = ', '.join(f'old.{c}' for c in columns)
+    
+    # prefix='2 3' keeps short as-you-type prefix queries off the slow path
+    cursor.execute(f'''
+        CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+            {column_list},
+            content='{table}',
+            content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2',
+            prefix='2 3'
+        )
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{fts}_insert AFTER INSERT ON {table}
+        BEGIN
+            INSERT INTO {fts} (rowid, {column_list}) VALUES (new.id, {new_values});
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{fts}_delete AFTER DELETE ON {table}
+        BEGIN
+            INSERT INTO {fts} ({fts}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{fts}_update AFTER UPDATE OF {column_list} ON {table}
+        BEGIN
+            INSERT INTO {fts} ({fts}, rowid, {column_list}) VALUES ('delete', old.id, {old_values});
+            INSERT INTO {fts} (rowid, {column_list}) VALUES (new.id, {new_values});
+        END
+    ''')
+    cursor.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+
+@migration(6, 'Full-text search over resources and questions')
+def _full_text_search(cursor):
+    _create_fts_index(cursor, 'resources', ['title', 'description', 'topic'])
+    _create_fts_index(cursor, 'questions', ['question_text', 'topic', 'explanation'])
+
+@migration(7, 'Covering index for test question selection')
+def _question_selection_index(cursor):
+    # Test assembly reads only id, marks, topic and type, so include marks
+    # to answer the selection from the index alone
+    cursor.execute('DROP INDEX IF EXISTS idx_questions_subject_difficulty')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_questions_selection
+        ON questions (subject_id, difficulty, topic, question_type, marks)
+    ''')
+
+@migration(8, 'Normalized test_questions table')
+def _test_questions(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS test_questions (
+            test_id INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            question_id INTEGER NOT NULL,
+            PRIMARY KEY (test_id, position),
+            FOREIGN KEY (test_id) REFERENCES tests (id),
+            FOREIGN KEY (question_id) REFERENCES questions (id)
+        ) WITHOUT ROWID
+    ''')
+    # Per-question analytics across tests
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_test_questions_question
+        ON test_questions (question_id, test_id)
+    ''')
+    
+    # Backfill from the JSON id lists, keeping their order
+    cursor.execute('''
+        INSERT OR IGNORE INTO test_questions (test_id, position, question_id)
+        SELECT t.id, j.key, j.value
+        FROM tests t, json_each(t.custom_questions) j
+        WHERE json_valid(t.custom_questions) AND json_type(t.custom_questions) = 'array'
+    ''')
+
+@migration(9, 'Test submissions and per-question answers')
+def _test_answers(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS test_submissions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            test_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            score INTEGER,
+            max_score INTEGER,
+            percentage DECIMAL(5,2),
+            time_taken INTEGER,
+            submitted_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (test_id) REFERENCES tests (id),
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_test_submissions_test
+        ON test_submissions (test_id)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_test_submissions_user
+        ON test_submissions (user_id, submitted_at)
+    ''')
+    
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS test_answers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            submission_id INTEGER NOT NULL,
+            test_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            question_id INTEGER NOT NULL,
+            position INTEGER,
+            answer TEXT,
+            is_correct BOOLEAN NOT NULL,
+            score INTEGER NOT NULL,
+            max_score INTEGER NOT NULL,
+            FOREIGN KEY (submission_id) REFERENCES test_submissions (id),
+            FOREIGN KEY (question_id) REFERENCES questions (id)
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_test_answers_submission
+        ON test_answers (submission_id)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_test_answers_question
+        ON test_answers (question_id, is_correct)
+    ''')
+
+@migration(10, 'Item statistics tables')
+def _item_statistics(cursor):
+    # Running sums are kept next to the derived figures so new submissions
+    # can be folded in without rescanning old ones
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS question_stats (
+            question_id INTEGER PRIMARY KEY,
+            responses INTEGER NOT NULL DEFAULT 0,
+            correct INTEGER NOT NULL DEFAULT 0,
+            sum_total REAL NOT NULL DEFAULT 0,
+            sum_total_sq REAL NOT NULL DEFAULT 0,
+            sum_total_correct REAL NOT NULL DEFAULT 0,
+            p_value REAL,
+            discrimination REAL,
+            point_biserial REAL,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (question_id) REFERENCES questions (id)
+        )
+    ''')
+    # Responses per question by the submission's score decile
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS question_stat_bins (
+            question_id INTEGER NOT NULL,
+            bin INTEGER NOT NULL,
+            responses INTEGER NOT NULL DEFAULT 0,
+            correct INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (question_id, bin)
+        ) WITHOUT ROWID
+    ''')
+    # High-water marks for incremental batch jobs
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS job_state (
+            name VARCHAR(50) PRIMARY KEY,
+            last_id INTEGER NOT NULL DEFAULT 0,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+@migration(11, 'Per-topic ability estimates')
+def _user_topic_ability(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_topic_ability (
+            user_id INTEGER NOT NULL,
+            subject_id INTEGER NOT NULL,
+            topic VARCHAR(100) NOT NULL,
+            theta REAL NOT NULL DEFAULT 0,
+            precision REAL NOT NULL DEFAULT 1,
+            responses INTEGER NOT NULL DEFAULT 0,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, subject_id, topic)
+        ) WITHOUT ROWID
+    ''')
+    # Last submission folded into each user's estimates
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_ability_state (
+            user_id INTEGER PRIMARY KEY,
+            last_submission_id INTEGER NOT NULL DEFAULT 0,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+@migration(12, 'Resource co-occurrence for recommendations')
+def _resource_cooccurrence(cursor):
+    # Completions as last folded into the matrix
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS recommendation_completions (
+            user_id INTEGER NOT NULL,
+            resource_id INTEGER NOT NULL,
+            PRIMARY KEY (user_id, resource_id)
+        ) WITHOUT ROWID
+    ''')
+    # Users who completed both resources, stored in both directions; the
+    # diagonal holds how many users completed each resource
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS resource_cooccurrence (
+            resource_id INTEGER NOT NULL,
+            other_id INTEGER NOT NULL,
+            users INTEGER NOT NULL,
+            PRIMARY KEY (resource_id, other_id)
+        ) WITHOUT ROWID
+    ''')
+    # Completion changes not yet folded in, written by triggers
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS completion_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            resource_id INTEGER NOT NULL,
+            delta INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_user_progress_completed_insert
+        AFTER INSERT ON user_progress WHEN NEW.completed = 1
+        BEGIN
+            INSERT INTO completion_events (user_id, resource_id, delta)
+            VALUES (NEW.user_id, NEW.resource_id, 1);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_user_progress_completed_delete
+        AFTER DELETE ON user_progress WHEN OLD.completed = 1
+        BEGIN
+            INSERT INTO completion_events (user_id, resource_id, delta)
+            VALUES (OLD.user_id, OLD.resource_id, -1);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_user_progress_completed_update
+        AFTER UPDATE OF user_id, resource_id, completed ON user_progress
+        WHEN (OLD.completed = 1) <> (NEW.completed = 1)
+          OR (NEW.completed = 1 AND (OLD.user_id <> NEW.user_id OR OLD.resource_id <> NEW.resource_id))
+        BEGIN
+            INSERT INTO completion_events (user_id, resource_id, delta)
+            SELECT OLD.user_id, OLD.resource_id, -1 WHERE OLD.completed = 1;
+            INSERT INTO completion_events (user_id, resource_id, delta)
+            SELECT NEW.user_id, NEW.resource_id, 1 WHERE NEW.completed = 1;
+        END
+    ''')
+    
+    cursor.execute('''
+        INSERT OR IGNORE INTO recommendation_completions (user_id, resource_id)
+        SELECT user_id, resource_id FROM user_progress WHERE completed = 1
+    ''')
+    cursor.execute('''
+        INSERT OR REPLACE INTO resource_cooccurrence (resource_id, other_id, users)
+        SELECT a.resource_id, b.resource_id, COUNT(*)
+        FROM recommendation_completions a
+        JOIN recommendation_completions b ON b.user_id = a.user_id
+        GROUP BY a.resource_id, b.resource_id
+    ''')
+
+@migration(13, 'Spaced-repetition review state')
+def _review_state(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS review_state (
+            user_id INTEGER NOT NULL,
+            question_id INTEGER NOT NULL,
+            repetitions INTEGER NOT NULL DEFAULT 0,
+            interval_days REAL NOT NULL DEFAULT 0,
+            ease REAL NOT NULL DEFAULT 2.5,
+            lapses INTEGER NOT NULL DEFAULT 0,
+            due_at DATETIME NOT NULL,
+            last_reviewed_at DATETIME,
+            PRIMARY KEY (user_id, question_id),
+            FOREIGN KEY (question_id) REFERENCES questions (id)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_review_state_due
+        ON review_state (user_id, due_at)
+    ''')
+
+@migration(14, 'MinHash signatures for duplicate detection')
+def _minhash_signatures(cursor):
+    # Kept apart from questions/resources so computing signatures does not
+    # bump their table versions
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS minhash_signatures (
+            kind VARCHAR(20) NOT NULL, -- 'questions', 'resources'
+            item_id INTEGER NOT NULL,
+            signature BLOB NOT NULL,
+            PRIMARY KEY (kind, item_id)
+        ) WITHOUT ROWID
+    ''')
+    # LSH buckets: items sharing any (band, bucket) are duplicate candidates
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS minhash_bands (
+            kind VARCHAR(20) NOT NULL,
+            band INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,
+            item_id INTEGER NOT NULL,
+            PRIMARY KEY (kind, band, bucket, item_id)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS duplicate_candidates (
+            kind VARCHAR(20) NOT NULL,
+            item_id INTEGER NOT NULL,
+            duplicate_of INTEGER NOT NULL,
+            similarity REAL NOT NULL,
+            detected_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (kind, item_id, duplicate_of)
+        ) WITHOUT ROWID
+    ''')
+
+def _add_column(cursor, table, column, definition):
+    columns = [row[1] for row in cursor.execute(f'PRAGMA table_info({table})').fetchall()]
+    if column not in columns:
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+@migration(15, 'Import keys for idempotent bulk imports')
+def _import_keys(cursor):
+    for table in ('questions', 'resources'):
+        _add_column(cursor, table, 'import_key', 'VARCHAR(100)')
+        cursor.execute(f'''
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_{table}_import_key
+            ON {table} (import_key)
+        ''')
+
+@migration(16, 'Content-addressed upload blobs')
+def _blobs(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS blobs (
+            sha256 CHAR(64) PRIMARY KEY,
+            size INTEGER NOT NULL,
+            path VARCHAR(500) NOT NULL,
+            ref_count INTEGER NOT NULL DEFAULT 0,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        ) WITHOUT ROWID
+    ''')
+    _add_column(cursor, 'resources', 'blob_sha256', 'CHAR(64)')
+    
+    # Reference counts follow the resources pointing at each blob
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_resources_blob_insert
+        AFTER INSERT ON resources WHEN NEW.blob_sha256 IS NOT NULL
+        BEGIN
+            UPDATE blobs SET ref_count = ref_count + 1 WHERE sha256 = NEW.blob_sha256;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_resources_blob_delete
+        AFTER DELETE ON resources WHEN OLD.blob_sha256 IS NOT NULL
+        BEGIN
+            UPDATE blobs SET ref_count = ref_count - 1 WHERE sha256 = OLD.blob_sha256;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_resources_blob_update
+        AFTER UPDATE OF blob_sha256 ON resources
+        WHEN OLD.blob_sha256 IS NOT NEW.blob_sha256
+        BEGIN
+            UPDATE blobs SET ref_count = ref_count - 1 WHERE sha256 = OLD.blob_sha256;
+            UPDATE blobs SET ref_count = ref_count + 1 WHERE sha256 = NEW.blob_sha256;
+        END
+    ''')
+
+@migration(17, 'Resumable upload sessions')
+def _upload_sessions(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS upload_sessions (
+            id CHAR(32) PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            filename VARCHAR(255) NOT NULL,
+            total_size INTEGER NOT NULL,
+            sha256 CHAR(64),
+            temp_path VARCHAR(500) NOT NULL,
+            ranges TEXT NOT NULL DEFAULT '[]', -- JSON [[start, end), ...] received
+            received INTEGER NOT NULL DEFAULT 0,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_upload_sessions_updated
+        ON upload_sessions (updated_at)
+    ''')
+
+@migration(18, 'Background jobs and upload inspection results')
+def _jobs(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind VARCHAR(50) NOT NULL,
+            job_key VARCHAR(100), -- one job per (kind, key) when set
+            payload TEXT NOT NULL DEFAULT '{}',
+            status VARCHAR(20) NOT NULL DEFAULT 'queued', -- 'queued', 'running', 'done', 'failed'
+            attempts INTEGER NOT NULL DEFAULT 0,
+            result TEXT,
+            error TEXT,
+            worker VARCHAR(100),
+            run_after DATETIME DEFAULT CURRENT_TIMESTAMP,
+            started_at DATETIME,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_key ON jobs (kind, job_key)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_jobs_queue ON jobs (status, run_after)
+    ''')
+    
+    _add_column(cursor, 'blobs', 'media_type', 'VARCHAR(20)')
+    _add_column(cursor, 'blobs', 'integrity', 'VARCHAR(20)')  # 'ok', 'corrupt' or NULL if unchecked
+    _add_column(cursor, 'blobs', 'page_count', 'INTEGER')
+    _add_column(cursor, 'blobs', 'duration_seconds', 'REAL')
+    _add_column(cursor, 'blobs', 'inspected_at', 'DATETIME')
+    _add_column(cursor, 'resources', 'page_count', 'INTEGER')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_resources_blob ON resources (blob_sha256)
+    ''')
+
+@migration(19, 'Upload session status')
+def _upload_session_status(cursor):
+    _add_column(cursor, 'upload_sessions', 'status', "VARCHAR(20) NOT NULL DEFAULT 'open'")  # 'open', 'finalizing'
+
+@migration(20, 'Last upload time of blobs')
+def _blob_last_used(cursor):
+    # Re-uploading unreferenced content restarts its garbage collection grace period
+    _add_column(cursor, 'blobs', 'last_used_at', 'DATETIME')
+
+def _sql_from_node(node, built=None):
+    """Turn a string, f-string or concatenation AST node into SQL.
+
+    Interpolations become ? and names resolve to SQL already built up in
+    ``built``; anything else yields None.
+    """
+    built = built or {}
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return node.value
+    if isinstance(node, ast.Name):
+        return built.get(node.id)
+    if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Add):
+        left = _sql_from_node(node.left, built)
+        right = _sql_from_node(node.right, built)
+        if left is None or right is None:
+            return None
+        return left + right
+    if isinstance(node, ast.JoinedStr):
+        parts = []
+        for value in node.values:
+            if isinstance(value, ast.Constant):
+                parts.append(value.value)
+            else:
+                parts.append('?')
+        return ''.join(parts)
+    return None
+
+def collect_queries(path):
+    """Collect the SQL passed to execute() calls in a module.
+
+    Queries assembled in a variable (``query = ...; query += ...``) are
+    collected as they stand at the execute() call with every optional
+    clause before it appended, which is the most selective and therefore
+    the most index-sensitive variant.
+    """
+    with open(path) as f:
+        tree = ast.parse(f.read(), filename=path)
+    
+    queries = []
+    for func in ast.walk(tree):
+        if not isinstance(func, ast.FunctionDef):
+            continue
+        built = {}
+        nodes = sorted(
+            (n for n in ast.walk(func) if hasattr(n, 'lineno')),
+            key=lambda n: (n.lineno, n.col_offset)
+        )
+        for node in nodes:
+            if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+                sql = _sql_from_node(node.value, built)
+                if sql is not None:
+                    built[node.targets[0].id] = sql
+            elif isinstance(node, ast.AugAssign) and isinstance(node.target, ast.Name) and isinstance(node.op, ast.Add):
+                sql = _sql_from_node(node.value, built)
+                if sql is not None and node.target.id in built:
+                    built[node.target.id] += sql
+            elif (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+                    and node.func.attr == 'execute' and node.args):
+                sql = _sql_from_node(node.args[0], built)
+                if sql is not None and sql.strip().upper().startswith(('SELECT', 'UPDATE', 'DELETE')):
+                    queries.append((f'{os.path.basename(path)}:{func.name}:{node.lineno}', sql))
+    return queries
+
+def check_query_plans(conn, paths):
+    """Return (location, plan detail) for every query that scans a table without an index"""
+    problems = []
+    for path in paths:
+        for location, sql in collect_queries(path):
+            params = [None] * sql.count('?')
+            aliases = {
+                alias: table for table, alias in
+                re.findall(r'(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(?!ON|WHERE|LEFT|JOIN|GROUP|ORDER|LIMIT)(\w+))?', sql, re.I)
+            }
+            try:
+                plan = conn.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()
+            except sqlite3.Error as e:
+                problems.append((location, f'could not plan: {e}'))
+                continue
+            for row in plan:
+                detail = row[3]
+                if not detail.startswith('SCAN ') or 'INDEX' in detail:
+                    continue
+                table = detail.split()[1]
+                table = aliases.get(table) or table
+                # Subquery and CTE results are transient, not stored tables
+                if table in ALLOWED_SCANS or table == 'CONSTANT' or table.startswith('('):
+                    continue
+                problems.append((location, detail))
+    return problems
+
+def route_modules():
+    """Paths of the modules whose queries must be index-backed"""
+    base = os.path.dirname(os.path.abspath(__file__))
+    routes_dir = os.path.join(base, 'routes')
+    paths = [os.path.join(base, 'app.py'), os.path.join(base, 'auth.py')]
+    paths += sorted(
+        os.path.join(routes_dir, name) for name in os.listdir(routes_dir)
+        if name.endswith('.py') and name != '__init__.py'
+    )
+    return paths
+
+if __name__ == '__main__':
+    from database import get_db_path
+    conn = sqlite3.connect(get_db_path())
+    applied = migrate(conn)
+    print(f'Schema at version {get_schema_version(conn)} (applied: {applied or "none"})')
+    
+    if len(sys.argv) > 1 and sys.argv[1] == 'check':
+        problems = check_query_plans(conn, route_modules())
+        for location, detail in problems:
+            print(f'{location}: {detail}')
+        print('All queries use an index' if not problems else f'{len(problems)} unindexed scan(s)')
+        conn.close()
+        sys.exit(1 if problems else 0)
+    conn.close()
@@ -0,0 +1,110 @@
+"""bcrypt hashing in a bounded process pool.
+
+bcrypt is deliberately slow (about 250 ms at cost 12), and running it on
+request threads lets a burst of logins occupy every thread the server has.
+Hashes and checks run instead in a small pool of worker processes. At most
+MAX_PENDING calls may be queued or running at once; beyond that a call
+raises HasherBusy straight away, and the caller answers 503 with
+Retry-After rather than stalling every other endpoint behind the queue.
+
+The cost factor comes from BCRYPT_ROUNDS. Hashes made with another cost
+still verify, and needs_rehash() tells login to store a fresh hash.
+"""
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+import bcrypt
+
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', 12))
+HASH_PROCESSES = int(os.environ.get('HASH_PROCESSES', max(1, (os.cpu_count() or 2) // 2)))
+MAX_PENDING = int(os.environ.get('HASH_MAX_PENDING', 32))  # queued plus running hashes
+HASH_TIMEOUT = 10  # seconds a request waits for its result
+RETRY_AFTER = 2  # seconds suggested to clients that are turned away
+
+class HasherBusy(Exception):
+    """The hashing pool is at its queue limit"""
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+
+def _check(password, hashed):
+    try:
+        return bcrypt.checkpw(password, hashed)
+    except ValueError:
+        return False  # not a bcrypt hash
+
+def hash_cost(hashed):
+    """Cost factor of a bcrypt hash ($2b$12$...), or None for anything else"""
+    parts = (hashed or '').split('$')
+    if len(parts) < 4 or not parts[2].isdigit():
+        return None
+    return int(parts[2])
+
+class PasswordHasher:
+    """Process pool for bcrypt with a cap on outstanding calls"""
+
+    def __init__(self, rounds=BCRYPT_ROUNDS, processes=HASH_PROCESSES, max_pending=MAX_PENDING,
+                 timeout=HASH_TIMEOUT):
+        self.rounds = rounds
+        self.processes = processes
+        self.timeout = timeout
+        self.rejected = 0
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pid = None
+
+    def _ensure_pool(self):
+        if self._pool is not None and self._pid == os.getpid():
+            return self._pool
+        with self._lock:
+            if self._pool is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                # Not fork: the web process has other threads running, and a
+                # child forked while one of them holds a lock can deadlock
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.processes, mp_context=multiprocessing.get_context('forkserver')
+                )
+            return self._pool
+
+    def _call(self, function, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise HasherBusy()
+        try:
+            future = self._ensure_pool().submit(function, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        # The slot is held until the pool finishes, even if this request gives up
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(self.timeout)
+        except TimeoutError:
+            raise HasherBusy()
+
+    def hash(self, password):
+        """bcrypt hash of a password at the configured cost"""
+        return self._call(_hash, password.encode('utf-8'), self.rounds).decode('utf-8')
+
+    def check(self, password, hashed):
+        """Whether a password matches a stored hash; False for hashes that are not bcrypt"""
+        if hash_cost(hashed) is None:
+            return False
+        return self._call(_check, password.encode('utf-8'), hashed.encode('utf-8'))
+
+    def needs_rehash(self, hashed):
+        return hash_cost(hashed) != self.rounds
+
+    def close(self):
+        if self._pool is not None and self._pid == os.getpid():
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+password_hasher = PasswordHasher()
+
+@atexit.register
+def _close_on_exit():
+    password_hasher.close()
@@ -0,0 +1,84 @@
+"""Incrementally maintained per-user progress summaries.
+
+user_subject_progress holds one row per (user, subject, resource type)
+with running completion, score and time totals. update_user_progress
+applies the difference between a progress row's old and new values, so
+the progress endpoints read a handful of summary rows instead of joining
+every resource against user_progress. Resource totals come from the
+trigger-maintained resource_counters table.
+"""
+import sys
+import sqlite3
+
+def _contribution(row):
+    """Summary contribution (completed, scored, score, time) of one progress row"""
+    if row is None:
+        return 0, 0, 0.0, 0
+    completed = 1 if row['completed'] == 1 else 0
+    score = row['score']
+    return (
+        completed,
+        0 if score is None else 1,
+        0.0 if score is None else float(score),
+        int(row['time_spent'] or 0)
+    )
+
+def apply_progress_change(db, user_id, subject_id, resource_type, old, new):
+    """Fold the change from one user_progress row state to another into the summary.
+
+    ``old``/``new`` are mappings with completed, score and time_spent keys,
+    or None when the row did not exist. Runs in the caller's transaction.
+    """
+    old_values = _contribution(old)
+    new_values = _contribution(new)
+    completed, scored, score, time_spent = (n - o for n, o in zip(new_values, old_values))
+    
+    if not (completed or scored or score or time_spent):
+        return
+    
+    db.execute('''
+        INSERT INTO user_subject_progress (
+            user_id, subject_id, resource_type, completed_resources, scored_count, score_total, time_spent
+        ) VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (user_id, subject_id, resource_type) DO UPDATE SET
+            completed_resources = completed_resources + excluded.completed_resources,
+            scored_count = scored_count + excluded.scored_count,
+            score_total = score_total + excluded.score_total,
+            time_spent = time_spent + excluded.time_spent,
+            updated_at = CURRENT_TIMESTAMP
+    ''', (user_id, subject_id, resource_type, completed, scored, score, time_spent))
+
+def rebuild_progress_summaries(db):
+    """Recompute every summary row from user_progress"""
+    db.execute('DELETE FROM user_subject_progress')
+    db.execute('''
+        INSERT INTO user_subject_progress (
+            user_id, subject_id, resource_type, completed_resources, scored_count, score_total, time_spent
+        )
+        SELECT up.user_id, r.subject_id, r.resource_type,
+               SUM(CASE WHEN up.completed = 1 THEN 1 ELSE 0 END),
+               COUNT(up.score),
+               COALESCE(SUM(up.score), 0),
+               COALESCE(SUM(up.time_spent), 0)
+        FROM user_progress up
+        JOIN resources r ON r.id = up.resource_id
+        GROUP BY up.user_id, r.subject_id, r.resource_type
+    ''')
+    db.commit()
+    return db.execute('SELECT COUNT(*) FROM user_subject_progress').fetchone()[0]
+
+def average_score(score_total, scored_count):
+    """Average of the scored rows, or None when nothing has been scored"""
+    return score_total / scored_count if scored_count else None
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] != 'rebuild':
+        print('Usage: python progress.py rebuild')
+        sys.exit(1)
+    
+    from database import get_db_path
+    conn = sqlite3.connect(get_db_path())
+    conn.row_factory = sqlite3.Row
+    rows = rebuild_progress_summaries(conn)
+    conn.close()
+    print(f'Rebuilt {rows} progress summary rows')
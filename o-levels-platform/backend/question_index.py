@@ -0,0 +1,202 @@
+"""Resident index of the question bank for test assembly.
+
+Questions are partitioned by (subject_id, difficulty), the two filters
+every test request uses. Each partition stores ids and marks in compact
+arrays and keeps one integer bitmap per topic, question type and mark
+value, so topic/type IN (...) filters are bitmap ORs and ANDs and the
+candidates for each mark value fall out of one more AND. Only ids and
+marks leave the index; full rows are loaded for the chosen questions.
+
+The index tracks the questions row of table_versions. The bulk importer
+reports each committed batch through note_saved(); any other change to
+the table makes the versions disagree and the index reloads on next use.
+"""
+import re
+import threading
+from array import array
+
+# Set bit offsets for every byte value, for fast bitmap -> slot expansion
+_BYTE_BITS = [tuple(bit for bit in range(8) if value >> bit & 1) for value in range(256)]
+_NONZERO_BYTE = re.compile(rb'[^\x00]')
+
+def bitmap_slots(bitmap):
+    """Positions of the set bits in an integer bitmap, ascending"""
+    slots = []
+    if not bitmap:
+        return slots
+    raw = bitmap.to_bytes((bitmap.bit_length() + 7) // 8, 'little')
+    # Let the regex engine skip runs of empty bytes
+    for match in _NONZERO_BYTE.finditer(raw):
+        index = match.start()
+        base = index * 8
+        slots.extend(base + bit for bit in _BYTE_BITS[raw[index]])
+    return slots
+
+class CandidateGroup:
+    """Questions of one mark value matching a filter, as a lazy bitmap.
+
+    Supports len() and sample() without expanding the bitmap, so assembly
+    cost does not grow with the number of matching questions.
+    """
+
+    __slots__ = ('partition', 'bitmap', 'count')
+
+    def __init__(self, partition, bitmap):
+        self.partition = partition
+        self.bitmap = bitmap
+        self.count = bitmap.bit_count()
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for slot in bitmap_slots(self.bitmap):
+            yield self.partition.candidate(slot)
+
+    def sample(self, rng, k):
+        """k distinct random candidates"""
+        k = min(k, self.count)
+        size = self.bitmap.bit_length()
+        # Probing needs about k * size / count tries; expanding costs about count
+        if k * 2 <= self.count and k * size < self.count * self.count:
+            # Probe random slots against the raw bytes
+            raw = self.bitmap.to_bytes((size + 7) // 8, 'little')
+            slots, seen = [], set()
+            while len(slots) < k:
+                slot = rng.randrange(size)
+                if slot not in seen and raw[slot >> 3] >> (slot & 7) & 1:
+                    seen.add(slot)
+                    slots.append(slot)
+        else:
+            slots = rng.sample(bitmap_slots(self.bitmap), k)
+        return [self.partition.candidate(slot) for slot in slots]
+
+class _Partition:
+    """Questions sharing one (subject_id, difficulty)"""
+
+    __slots__ = ('ids', 'marks', 'topics', 'types', 'by_topic', 'by_type', 'by_marks', 'live')
+
+    def __init__(self):
+        self.ids = array('q')
+        self.marks = array('l')
+        self.topics = []  # slot -> topic (interned strings)
+        self.types = []  # slot -> question type
+        self.by_topic = {}
+        self.by_type = {}
+        self.by_marks = {}
+        self.live = 0  # bitmap of slots not superseded by an update
+
+    def add(self, question_id, marks, topic, question_type):
+        slot = len(self.ids)
+        bit = 1 << slot
+        self.ids.append(question_id)
+        self.marks.append(marks or 0)
+        self.topics.append(topic)
+        self.types.append(question_type)
+        self.by_topic[topic] = self.by_topic.get(topic, 0) | bit
+        self.by_type[question_type] = self.by_type.get(question_type, 0) | bit
+        self.by_marks[marks or 0] = self.by_marks.get(marks or 0, 0) | bit
+        self.live |= bit
+        return slot
+
+    def remove(self, slot):
+        self.live &= ~(1 << slot)
+
+    def candidate(self, slot):
+        return self.ids[slot], self.marks[slot], self.topics[slot], self.types[slot]
+
+    def _union(self, bitmaps, keys):
+        if not keys:
+            return self.live
+        mask = 0
+        for key in keys:
+            mask |= bitmaps.get(key, 0)
+        return mask
+
+    def groups(self, topics=None, question_types=None, max_marks=None):
+        """Candidates matching the filters as {marks: CandidateGroup}"""
+        mask = self.live & self._union(self.by_topic, topics) & self._union(self.by_type, question_types)
+        groups = {}
+        if not mask:
+            return groups
+        for marks, bitmap in self.by_marks.items():
+            if marks <= 0 or (max_marks is not None and marks > max_marks):
+                continue
+            matched = mask & bitmap
+            if matched:
+                groups[marks] = CandidateGroup(self, matched)
+        return groups
+
+class QuestionIndex:
+    """In-memory question bank index kept in step with table_versions"""
+
+    def __init__(self):
+        self._partitions = {}
+        self._slot_of = {}  # question id -> (partition key, slot)
+        self._strings = {}
+        self.version = None
+        self._lock = threading.Lock()
+
+    def _intern(self, value):
+        return self._strings.setdefault(value, value)
+
+    def _add(self, row):
+        question_id, subject_id, difficulty, topic, question_type, marks = row
+        previous = self._slot_of.get(question_id)
+        if previous is not None:
+            key, slot = previous
+            self._partitions[key].remove(slot)
+        key = (subject_id, difficulty)
+        partition = self._partitions.get(key)
+        if partition is None:
+            partition = self._partitions[key] = _Partition()
+        slot = partition.add(question_id, marks, self._intern(topic), self._intern(question_type))
+        self._slot_of[question_id] = (key, slot)
+
+    def _current_version(self, db):
+        row = db.execute("SELECT version FROM table_versions WHERE name = 'questions'").fetchone()
+        return row['version'] if row else 0
+
+    def load(self, db):
+        """Rebuild the index from the questions table"""
+        with self._lock:
+            version = self._current_version(db)
+            rows = db.execute('''
+                SELECT id, subject_id, difficulty, topic, question_type, marks FROM questions
+            ''').fetchall()
+            self._partitions, self._slot_of, self._strings = {}, {}, {}
+            for row in rows:
+                self._add(tuple(row))
+            self.version = version
+
+    def ensure_fresh(self, db):
+        """Reload if the questions table changed behind our back"""
+        if self.version is None or self.version != self._current_version(db):
+            self.load(db)
+
+    def note_saved(self, rows, version):
+        """Apply questions inserted or updated by this process (after commit).
+
+        ``rows`` are (id, subject_id, difficulty, topic, question_type, marks)
+        and ``version`` is the questions version the write committed. Each row
+        accounts for one bump; if that does not lead from the index's version
+        to ``version``, something else changed too and the index is left to
+        reload.
+        """
+        with self._lock:
+            if self.version is None or self.version + len(rows) != version:
+                return
+            for row in rows:
+                self._add(tuple(row))
+            self.version = version
+
+    def candidate_groups(self, db, subject_id, difficulty, topics=None, question_types=None, max_marks=None):
+        """Candidates for a test grouped by marks, for assembly.assemble()"""
+        self.ensure_fresh(db)
+        with self._lock:
+            partition = self._partitions.get((int(subject_id), difficulty))
+            if partition is None:
+                return {}
+            return partition.groups(topics, question_types, max_marks)
+
+question_index = QuestionIndex()
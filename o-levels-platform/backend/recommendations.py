@@ -0,0 +1,330 @@
+"""Resource recommendations from completion co-occurrence.
+
+Triggers on user_progress append completion changes to completion_events.
+A background thread folds them into resource_cooccurrence, a sparse
+resource x resource matrix of how many users completed both (the
+diagonal holds each resource's own completion count), and records the
+last folded event in job_state.
+
+Every process keeps the top NEIGHBORS cosine-similar resources of each
+resource in memory, patched from the folded events, and a cache of
+ranked recommendations per user. A user's score for a resource is the
+summed similarity to everything they have completed; completed resources
+are excluded and popular resources fill in for users with little history.
+Requests only read this state: the first one in a process starts the
+thread, which loads the matrix straight away, and until then gets no
+recommendations rather than waiting for the load.
+"""
+import heapq
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from database import get_db
+from counters import merge_counts
+
+REFRESH_INTERVAL = 10  # seconds between background refreshes
+EVENT_BATCH = 1000  # completion events folded per transaction
+EVENT_RETENTION = 10000  # folded events kept so other processes can catch up
+FULL_RELOAD_INTERVAL = 3600  # seconds between full neighbour rebuilds
+NEIGHBORS = 50  # similar resources kept per resource
+POPULAR = 200  # most completed resources kept for cold starts
+USER_CACHE_SIZE = 4096  # users
+DEFAULT_LIMIT = 10
+
+JOB_NAME = 'recommendations'
+
+class _UserRecommendations:
+    __slots__ = ('completed', 'ranked', 'generation')
+
+    def __init__(self, completed, ranked, generation):
+        self.completed = completed
+        self.ranked = ranked  # resource ids, best first
+        self.generation = generation
+
+class Recommender:
+    """Co-occurrence matrix maintenance and cached per-user recommendations"""
+
+    def __init__(self, interval=REFRESH_INTERVAL):
+        self.interval = interval
+        self._neighbors = None  # resource_id -> [(similarity, other_id)] best first
+        self._totals = {}  # resource_id -> users who completed it
+        self._popular = []
+        self._subjects = {}  # resource_id -> subject_id
+        self._users = OrderedDict()
+        self._generation = 0
+        self._seen = 0  # last folded event applied to the in-memory state
+        self._loaded_at = 0
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='recommendations', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        # Refresh first so a new process has neighbours as soon as possible
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Recommendation refresh failed: {e}")
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+
+    def notify(self, user_id):
+        """A user's completions changed (after commit)"""
+        with self._lock:
+            self._users.pop(user_id, None)
+        self._ensure_thread()
+        self._wakeup.set()
+
+    def _watermark(self, db):
+        row = db.execute('SELECT last_id FROM job_state WHERE name = ?', (JOB_NAME,)).fetchone()
+        return row['last_id'] if row else 0
+
+    def _fold(self, db):
+        """Fold pending completion events into the matrix; returns events folded"""
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            last_id = self._watermark(db)
+            events = db.execute('''
+                SELECT id, user_id, resource_id, delta FROM completion_events
+                WHERE id > ? ORDER BY id LIMIT ?
+            ''', (last_id, EVENT_BATCH)).fetchall()
+            if not events:
+                db.rollback()
+                return 0
+            
+            deltas = {}
+            for event in events:
+                user_id, resource_id, delta = event['user_id'], event['resource_id'], event['delta']
+                if delta > 0:
+                    changed = db.execute('''
+                        INSERT OR IGNORE INTO recommendation_completions (user_id, resource_id) VALUES (?, ?)
+                    ''', (user_id, resource_id)).rowcount
+                else:
+                    changed = db.execute('''
+                        DELETE FROM recommendation_completions WHERE user_id = ? AND resource_id = ?
+                    ''', (user_id, resource_id)).rowcount
+                if not changed:
+                    continue
+                
+                deltas[(resource_id, resource_id)] = deltas.get((resource_id, resource_id), 0) + delta
+                for row in db.execute('''
+                    SELECT resource_id FROM recommendation_completions WHERE user_id = ? AND resource_id <> ?
+                ''', (user_id, resource_id)):
+                    other_id = row['resource_id']
+                    deltas[(resource_id, other_id)] = deltas.get((resource_id, other_id), 0) + delta
+                    deltas[(other_id, resource_id)] = deltas.get((other_id, resource_id), 0) + delta
+            
+            db.executemany('''
+                INSERT INTO resource_cooccurrence (resource_id, other_id, users) VALUES (?, ?, ?)
+                ON CONFLICT (resource_id, other_id) DO UPDATE SET users = users + excluded.users
+            ''', [(a, b, delta) for (a, b), delta in deltas.items() if delta])
+            db.executemany('''
+                DELETE FROM resource_cooccurrence WHERE resource_id = ? AND other_id = ? AND users <= 0
+            ''', [(a, b) for (a, b), delta in deltas.items() if delta < 0])
+            
+            last_id = events[-1]['id']
+            db.execute('''
+                INSERT INTO job_state (name, last_id) VALUES (?, ?)
+                ON CONFLICT (name) DO UPDATE SET last_id = excluded.last_id, updated_at = CURRENT_TIMESTAMP
+            ''', (JOB_NAME, last_id))
+            db.execute('DELETE FROM completion_events WHERE id <= ?', (last_id - EVENT_RETENTION,))
+            db.commit()
+            return len(events)
+        except Exception:
+            db.rollback()
+            raise
+
+    @staticmethod
+    def _similar(totals, resource_id, entries):
+        """Top NEIGHBORS (cosine, other_id) from (other_id, shared users) pairs"""
+        total = totals.get(resource_id, 0)
+        if not total:
+            return []
+        scored = (
+            (shared / math.sqrt(total * totals[other_id]), other_id)
+            for other_id, shared in entries if totals.get(other_id)
+        )
+        return heapq.nlargest(NEIGHBORS, scored)
+
+    def _load(self, db, watermark):
+        """Rebuild neighbour lists from the whole matrix"""
+        rows = db.execute('SELECT resource_id, other_id, users FROM resource_cooccurrence').fetchall()
+        totals, pairs = {}, {}
+        for resource_id, other_id, users in rows:
+            if resource_id == other_id:
+                totals[resource_id] = users
+            else:
+                pairs.setdefault(resource_id, []).append((other_id, users))
+        
+        # Built outside the lock so requests are served from the old lists meanwhile
+        neighbors = {resource_id: self._similar(totals, resource_id, entries) for resource_id, entries in pairs.items()}
+        popular = heapq.nlargest(POPULAR, totals, key=totals.get)
+        
+        with self._lock:
+            self._totals = totals
+            self._neighbors = neighbors
+            self._popular = popular
+            self._subjects = {}
+            self._generation += 1
+            self._users.clear()
+            self._seen = watermark
+        self._loaded_at = time.monotonic()
+
+    def _patch(self, db, watermark):
+        """Apply events folded since the last refresh, by any process"""
+        events = db.execute('''
+            SELECT user_id, resource_id FROM completion_events
+            WHERE id > ? AND id <= ?
+        ''', (self._seen, watermark)).fetchall()
+        
+        users = {event['user_id'] for event in events}
+        resources = {event['resource_id'] for event in events}
+        for user_id in users:
+            resources.update(row['resource_id'] for row in db.execute('''
+                SELECT resource_id FROM recommendation_completions WHERE user_id = ?
+            ''', (user_id,)))
+        
+        totals, neighbors = {}, {}
+        for resource_id in resources:
+            entries = []
+            for row in db.execute('''
+                SELECT other_id, users FROM resource_cooccurrence WHERE resource_id = ?
+            ''', (resource_id,)):
+                if row['other_id'] == resource_id:
+                    totals[resource_id] = row['users']
+                else:
+                    entries.append((row['other_id'], row['users']))
+            neighbors[resource_id] = entries
+        
+        with self._lock:
+            for resource_id in resources:
+                if resource_id in totals:
+                    self._totals[resource_id] = totals[resource_id]
+                else:
+                    self._totals.pop(resource_id, None)
+            for resource_id, entries in neighbors.items():
+                self._neighbors[resource_id] = self._similar(self._totals, resource_id, entries)
+            self._popular = heapq.nlargest(POPULAR, self._totals, key=self._totals.get)
+            self._generation += 1
+            for user_id in users:
+                self._users.pop(user_id, None)
+            self._seen = watermark
+
+    def refresh(self):
+        """Fold pending events and bring the in-memory neighbours up to date"""
+        with self._refresh_lock:
+            db = get_db()
+            try:
+                while self._fold(db) == EVENT_BATCH:
+                    pass
+                
+                watermark = self._watermark(db)
+                oldest = db.execute('SELECT MIN(id) FROM completion_events').fetchone()[0]
+                if (self._neighbors is None or time.monotonic() - self._loaded_at > FULL_RELOAD_INTERVAL
+                        or (oldest is not None and self._seen < oldest - 1)):
+                    self._load(db, watermark)
+                elif watermark > self._seen:
+                    self._patch(db, watermark)
+            finally:
+                db.close()
+
+    def _rank(self, completed):
+        scores = {}
+        neighbors = self._neighbors or {}
+        for resource_id in completed:
+            for similarity, other_id in neighbors.get(resource_id, ()):
+                if other_id not in completed:
+                    scores[other_id] = scores.get(other_id, 0) + similarity
+        ranked = sorted(scores, key=scores.get, reverse=True)
+        # Popular resources for users with little history
+        seen = set(ranked)
+        ranked.extend(r for r in self._popular if r not in completed and r not in seen)
+        return ranked
+
+    def _entry(self, db, user_id):
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is not None:
+                self._users.move_to_end(user_id)
+                if entry.generation == self._generation:
+                    return entry
+        
+        if entry is None:
+            completed = {row['resource_id'] for row in db.execute('''
+                SELECT resource_id FROM user_progress WHERE user_id = ? AND completed = 1
+            ''', (user_id,))}
+        else:
+            completed = entry.completed
+        with self._lock:
+            entry = _UserRecommendations(completed, self._rank(completed), self._generation)
+            self._users[user_id] = entry
+            while len(self._users) > USER_CACHE_SIZE:
+                self._users.popitem(last=False)
+        return entry
+
+    def _subjects_of(self, db, resource_ids):
+        # Dropped on every full reload, so it holds at most the resources ranked since
+        subjects = self._subjects
+        missing = [r for r in resource_ids if r not in subjects]
+        for start in range(0, len(missing), 500):
+            chunk = missing[start:start + 500]
+            placeholders = ','.join(['?'] * len(chunk))
+            for row in db.execute(f'''
+                SELECT id, subject_id FROM resources WHERE id IN ({placeholders})
+            ''', chunk):
+                subjects[row['id']] = row['subject_id']
+        return subjects
+
+    def recommend(self, db, user_id, subject_id=None, limit=DEFAULT_LIMIT):
+        """Top resource ids to study next for a user, optionally within one subject.
+
+        Never folds or loads on the calling thread; before the first load
+        finishes the ranking is empty.
+        """
+        self._ensure_thread()
+        if self._neighbors is None:
+            return []
+        
+        ranked = self._entry(db, user_id).ranked
+        if subject_id is None:
+            return ranked[:limit]
+        
+        subjects = self._subjects_of(db, ranked)
+        picked = []
+        for resource_id in ranked:
+            if subjects.get(resource_id) == subject_id:
+                picked.append(resource_id)
+                if len(picked) == limit:
+                    break
+        return picked
+
+recommender = Recommender()
+
+def load_resources(db, resource_ids):
+    """Resource rows for recommended ids, in the same order"""
+    if not resource_ids:
+        return []
+    placeholders = ','.join(['?'] * len(resource_ids))
+    rows = db.execute(f'''
+        SELECT r.*, s.name as subject_name, s.code as subject_code
+        FROM resources r
+        JOIN subjects s ON r.subject_id = s.id
+        WHERE r.id IN ({placeholders})
+    ''', resource_ids).fetchall()
+    by_id = {row['id']: merge_counts(dict(row)) for row in rows}
+    return [by_id[resource_id] for resource_id in resource_ids if resource_id in by_id]
+
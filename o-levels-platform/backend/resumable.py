@@ -0,0 +1,202 @@
+"""Resumable chunked uploads.
+
+A client opens a session with the file's name and size (and optionally its
+SHA-256), then sends chunks in any order, each with its byte offset. Chunks
+are written in place into a sparse temp file of the final size, and the
+byte ranges received are tracked in upload_sessions, so a dropped
+connection only costs the chunk in flight: the client asks which ranges
+are missing and sends those. Finalizing checks every byte has arrived,
+hashes the file from disk in chunks, compares the SHA-256 the client gave
+(at the start or at finalize; it is required) and moves the file into
+blob storage without copying it.
+
+Chunk writes hold a shared flock on the temp file and finalize takes it
+exclusively after marking the session 'finalizing', so no chunk can land
+in the file after it has been hashed.
+"""
+import fcntl
+import hashlib
+import json
+import os
+import secrets
+from storage import blob_store, file_sha256, StorageError, CHUNK_SIZE
+
+MAX_UPLOAD_SIZE = 4 * 1024 * 1024 * 1024  # 4 GB
+MAX_CHUNK_SIZE = 32 * 1024 * 1024  # stays under MAX_CONTENT_LENGTH
+RECOMMENDED_CHUNK_SIZE = 8 * 1024 * 1024
+SESSION_EXPIRY_HOURS = 48
+
+def merge_range(ranges, start, end):
+    """Add [start, end) to sorted, non-overlapping ranges"""
+    merged = []
+    for low, high in sorted(ranges + [[start, end]]):
+        if merged and low <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], high)
+        else:
+            merged.append([low, high])
+    return merged
+
+def missing_ranges(ranges, total_size):
+    """Gaps in the received ranges as [start, end) pairs"""
+    missing, position = [], 0
+    for low, high in ranges:
+        if low > position:
+            missing.append([position, low])
+        position = max(position, high)
+    if position < total_size:
+        missing.append([position, total_size])
+    return missing
+
+def describe(session):
+    """API shape of a session row"""
+    ranges = json.loads(session['ranges'])
+    return {
+        'upload_id': session['id'],
+        'filename': session['filename'],
+        'total_size': session['total_size'],
+        'status': session['status'],
+        'received': session['received'],
+        'ranges': ranges,
+        'missing': missing_ranges(ranges, session['total_size']),
+        'complete': session['received'] >= session['total_size']
+    }
+
+def create_session(db, user_id, filename, total_size, sha256=None):
+    """Open an upload session with a sparse temp file of the final size (commits)"""
+    upload_id = secrets.token_hex(16)
+    temp_path = os.path.join(blob_store.temp_dir(), f'{upload_id}.upload')
+    with open(temp_path, 'wb') as f:
+        f.truncate(total_size)
+    try:
+        db.execute('''
+            INSERT INTO upload_sessions (id, user_id, filename, total_size, sha256, temp_path)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (upload_id, user_id, filename, total_size, sha256, temp_path))
+        db.commit()
+    except Exception:
+        os.remove(temp_path)
+        raise
+    return get_session(db, upload_id)
+
+def get_session(db, upload_id):
+    return db.execute('SELECT * FROM upload_sessions WHERE id = ?', (upload_id,)).fetchone()
+
+def write_chunk(db, session, offset, stream, length, chunk_sha256=None):
+    """Write a chunk at offset and record its range (commits); returns the updated session.
+
+    The data is written before the range is recorded, so a chunk that fails
+    part way (or fails its checksum) is simply not counted and can be resent.
+    """
+    if offset < 0 or length <= 0 or offset + length > session['total_size']:
+        raise StorageError('Chunk is outside the file')
+    if length > MAX_CHUNK_SIZE:
+        raise StorageError('Chunk is too large')
+
+    try:
+        fd = os.open(session['temp_path'], os.O_WRONLY)
+    except FileNotFoundError:
+        raise StorageError('Upload is no longer accepting chunks')
+    try:
+        # Shared with other chunks; finalize takes it exclusively. Checked
+        # under the lock, since finalize may have moved the file by now
+        fcntl.flock(fd, fcntl.LOCK_SH)
+        current = get_session(db, session['id'])
+        if current is None or current['status'] != 'open':
+            raise StorageError('Upload is no longer accepting chunks')
+
+        digest = hashlib.sha256() if chunk_sha256 else None
+        written = 0
+        while written < length:
+            data = stream.read(min(CHUNK_SIZE, length - written))
+            if not data:
+                break
+            os.pwrite(fd, data, offset + written)
+            if digest is not None:
+                digest.update(data)
+            written += len(data)
+
+        if written != length:
+            raise StorageError('Chunk ended early')
+        if digest is not None and digest.hexdigest() != chunk_sha256.lower():
+            raise StorageError('Chunk SHA-256 does not match')
+
+        # Parallel chunks of one upload update the ranges one at a time
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            current = get_session(db, session['id'])
+            ranges = merge_range(json.loads(current['ranges']), offset, offset + length)
+            db.execute('''
+                UPDATE upload_sessions
+                SET ranges = ?, received = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', (json.dumps(ranges), sum(high - low for low, high in ranges), session['id']))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+    finally:
+        os.close(fd)
+    return get_session(db, session['id'])
+
+def _set_status(db, session_id, status, expected):
+    """Move a session between states atomically; False if it was not in the expected state"""
+    db.execute('BEGIN IMMEDIATE')
+    try:
+        updated = db.execute('''
+            UPDATE upload_sessions SET status = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND status = ?
+        ''', (status, session_id, expected)).rowcount
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return updated == 1
+
+def finalize(db, session, sha256=None):
+    """Verify a complete upload and move it into blob storage; returns (blob, created)"""
+    expected = (sha256 or session['sha256'] or '').lower() or None
+    if not expected:
+        raise StorageError('sha256 is required to finalize an upload')
+    session_id = session['id']
+    if not _set_status(db, session_id, 'finalizing', 'open'):
+        raise StorageError('Upload is already being finalized')
+
+    try:
+        fd = os.open(session['temp_path'], os.O_RDONLY)
+        try:
+            # Wait out chunks still being written; new ones see 'finalizing'
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            session = get_session(db, session_id)
+            if session is None:
+                raise StorageError('Upload not found')
+            if session['received'] < session['total_size']:
+                raise StorageError('Upload is incomplete')
+            actual = file_sha256(session['temp_path'])
+            if actual != expected:
+                raise StorageError('SHA-256 of the upload does not match')
+
+            db.execute('DELETE FROM upload_sessions WHERE id = ?', (session['id'],))
+            db.commit()
+            # Still under the lock, so a waiting chunk finds the session gone
+            return blob_store.adopt(db, session['temp_path'], actual, session['total_size'], session['filename'])
+        finally:
+            os.close(fd)
+    except BaseException:
+        _set_status(db, session_id, 'open', 'finalizing')
+        raise
+
+def abort(db, session):
+    """Drop a session and its temp file (commits)"""
+    db.execute('DELETE FROM upload_sessions WHERE id = ?', (session['id'],))
+    db.commit()
+    if os.path.exists(session['temp_path']):
+        os.remove(session['temp_path'])
+
+def expire_sessions(db, hours=SESSION_EXPIRY_HOURS):
+    """Abort sessions with no chunk received for the given hours"""
+    sessions = db.execute('''
+        SELECT * FROM upload_sessions WHERE updated_at < datetime('now', ?)
+    ''', (f'-{int(hours)} hours',)).fetchall()
+    for session in sessions:
+        abort(db, session)
+    return len(sessions)
@@ -0,0 +1,117 @@
+"""Spaced-repetition review scheduling (SM-2).
+
+review_state holds one row per (user, question) being reviewed, with the
+SM-2 repetition count, interval and ease factor and the next due time.
+Questions enter the schedule when answered wrongly in a test; every later
+answer to a scheduled question, in a test or a review, reschedules it.
+The (user_id, due_at) index makes the next due items one range scan.
+"""
+import datetime
+
+INITIAL_EASE = 2.5
+MIN_EASE = 1.3
+PASSING_QUALITY = 3
+
+# SM-2 quality (0-5) for graded outcomes
+QUALITY_CORRECT = 4
+QUALITY_WRONG = 1
+QUALITY_BLANK = 0
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'  # as CURRENT_TIMESTAMP
+
+def utc_now():
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None, microsecond=0)
+
+def format_timestamp(moment):
+    return moment.strftime(TIMESTAMP_FORMAT)
+
+def outcome_quality(outcome):
+    """SM-2 quality for a grading outcome"""
+    if outcome['correct']:
+        return QUALITY_CORRECT
+    if outcome.get('user_answer') in (None, ''):
+        return QUALITY_BLANK
+    return QUALITY_WRONG
+
+def next_state(state, quality, now):
+    """Apply one SM-2 review; state is a dict or None for a new item"""
+    if state is None:
+        state = {'repetitions': 0, 'interval_days': 0, 'ease': INITIAL_EASE, 'lapses': 0}
+    repetitions = state['repetitions']
+    interval = state['interval_days']
+    lapses = state['lapses']
+
+    if quality >= PASSING_QUALITY:
+        if repetitions == 0:
+            interval = 1
+        elif repetitions == 1:
+            interval = 6
+        else:
+            interval = interval * state['ease']
+        repetitions += 1
+    else:
+        repetitions = 0
+        interval = 1
+        lapses += 1
+
+    ease = state['ease'] + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02)
+    return {
+        'repetitions': repetitions,
+        'interval_days': interval,
+        'ease': max(MIN_EASE, ease),
+        'lapses': lapses,
+        'due_at': format_timestamp(now + datetime.timedelta(days=interval)),
+        'last_reviewed_at': format_timestamp(now)
+    }
+
+def load_states(db, user_id, question_ids):
+    """Current review state of the given questions for a user"""
+    states = {}
+    question_ids = list(question_ids)
+    for start in range(0, len(question_ids), 500):
+        chunk = question_ids[start:start + 500]
+        placeholders = ','.join(['?'] * len(chunk))
+        for row in db.execute(f'''
+            SELECT question_id, repetitions, interval_days, ease, lapses, due_at
+            FROM review_state
+            WHERE user_id = ? AND question_id IN ({placeholders})
+        ''', [user_id] + chunk):
+            states[row['question_id']] = dict(row)
+    return states
+
+def save_states(db, user_id, states):
+    """Write {question_id: state} in one executemany (caller commits)"""
+    db.executemany('''
+        INSERT OR REPLACE INTO review_state (
+            user_id, question_id, repetitions, interval_days, ease, lapses, due_at, last_reviewed_at
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', [
+        (
+            user_id, question_id, state['repetitions'], state['interval_days'], state['ease'],
+            state['lapses'], state['due_at'], state['last_reviewed_at']
+        )
+        for question_id, state in states.items()
+    ])
+
+def schedule_outcomes(db, user_id, outcomes, now=None):
+    """Reschedule reviews after a graded test (caller commits).
+
+    Wrong answers start a review schedule; answers to questions already
+    scheduled advance it. Returns the number of states written.
+    """
+    if user_id is None or not outcomes:
+        return 0
+    now = now or utc_now()
+    states = load_states(db, user_id, {o['question_id'] for o in outcomes})
+
+    updated = {}
+    for outcome in outcomes:
+        question_id = outcome['question_id']
+        if question_id not in states and outcome['correct']:
+            continue
+        updated[question_id] = next_state(
+            updated.get(question_id, states.get(question_id)), outcome_quality(outcome), now
+        )
+
+    save_states(db, user_id, updated)
+    return len(updated)
@@ -0,0 +1,43 @@
+from flask import Blueprint, request, jsonify
+from database import get_db
+from auth import login_required
+from bulk_import import IMPORTERS, import_rows, detect_format, open_text
+
+imports_bp = Blueprint('imports', __name__)
+
+@imports_bp.route('/api/import/<kind>', methods=['POST'])
+@login_required
+def bulk_import(kind):
+    """Bulk import questions or resources from an uploaded CSV/NDJSON file.
+
+    Send the file as multipart field "file", or as the raw request body with
+    ?format=csv|ndjson.
+    """
+    from flask import session
+    
+    if kind not in IMPORTERS:
+        return jsonify({'success': False, 'error': 'kind must be questions or resources'}), 400
+    
+    upload = request.files.get('file')
+    if upload is not None:
+        stream = upload.stream
+        file_format = request.args.get('format') or detect_format(upload.filename)
+    else:
+        stream = request.stream
+        default = 'ndjson' if request.mimetype == 'application/x-ndjson' else 'csv'
+        file_format = request.args.get('format') or default
+    
+    if file_format not in ('csv', 'ndjson'):
+        return jsonify({'success': False, 'error': 'format must be csv or ndjson'}), 400
+    
+    db = get_db()
+    
+    try:
+        report = import_rows(db, kind, open_text(stream), file_format, session.get('user_id'))
+        return jsonify({'success': True, **report})
+        
+    except Exception as e:
+        db.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        db.close()
@@ -1,19 +1,78 @@
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, request, jsonify, send_file, make_response, current_app
 import os
+import json
+import base64
+import hashlib
+import mimetypes
+from urllib.parse import quote
+from werkzeug.utils import secure_filename
 from database import get_db
 from auth import login_required
+from counters import record_view, record_download, merge_counts
+from catalog import subject_catalog
+from conditional import conditional
+from dedup import index_item
+from storage import blob_store, is_sha256
+from media import duration_minutes
 
 resources_bp = Blueprint('resources', __name__)
 
+def encode_cursor(created_at, resource_id):
+    """Encode a (created_at, id) position as an opaque page token"""
+    raw = json.dumps([created_at, resource_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(token):
+    """Decode a page token, raising ValueError if it is malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        created_at, resource_id = json.loads(raw)
+    except Exception:
+        raise ValueError('Invalid cursor')
+    if not isinstance(resource_id, int):
+        raise ValueError('Invalid cursor')
+    return created_at, resource_id
+
+def counted_total(db, subject_id=None, resource_type=None):
+    """Read a resource total from the trigger-maintained counters"""
+    query = 'SELECT COALESCE(SUM(count), 0) as total FROM resource_counters WHERE 1=1'
+    params = []
+    
+    if subject_id:
+        query += ' AND subject_id = ?'
+        params.append(subject_id)
+    
+    if resource_type:
+        query += ' AND resource_type = ?'
+        params.append(resource_type)
+    
+    return db.execute(query, params).fetchone()['total']
+
 @resources_bp.route('/api/resources', methods=['GET'])
+@conditional('resources', 'subjects')
 def get_resources():
-    """Get resources with filtering and pagination"""
+    """Get resources with filtering and pagination.
+
+    Passing ``cursor`` (empty for the first page) switches to keyset
+    pagination: pages are anchored on the last (created_at, id) seen, so
+    deep pages cost the same as the first and concurrent inserts never
+    shift rows between pages. Totals come from resource_counters when only
+    subject/type filters are used; otherwise pass ``include_total=1``.
+    """
     subject_id = request.args.get('subject_id')
     resource_type = request.args.get('type')
     topic = request.args.get('topic')
     difficulty = request.args.get('difficulty')
+    cursor = request.args.get('cursor')
+    include_total = request.args.get('include_total', '').lower() in ('1', 'true', 'yes')
     page = int(request.args.get('page', 1))
-    per_page = int(request.args.get('per_page', 20))
+    per_page = min(max(int(request.args.get('per_page', 20)), 1), 100)
+    
+    if cursor:
+        try:
+            cursor_created_at, cursor_id = decode_cursor(cursor)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
     
     db = get_db()
     
@@ -26,48 +85,74 @@ def get_resources():
             LEFT JOIN users u ON r.uploaded_by = u.id
             WHERE 1=1
         '''
+        filters = ''
         params = []
         
         if subject_id:
-            query += ' AND r.subject_id = ?'
+            filters += ' AND r.subject_id = ?'
             params.append(subject_id)
         
         if resource_type:
-            query += ' AND r.resource_type = ?'
+            filters += ' AND r.resource_type = ?'
             params.append(resource_type)
         
         if topic:
-            query += ' AND r.topic = ?'
+            filters += ' AND r.topic = ?'
             params.append(topic)
         
         if difficulty:
-            query += ' AND r.difficulty = ?'
+            filters += ' AND r.difficulty = ?'
             params.append(difficulty)
         
-        # Count total
-        count_query = 'SELECT COUNT(*) as total FROM resources r WHERE 1=1'
-        count_params = params.copy()
+        query += filters
         
-        if subject_id:
-            count_query += ' AND r.subject_id = ?'
-        if resource_type:
-            count_query += ' AND r.resource_type = ?'
-        if topic:
-            count_query += ' AND r.topic = ?'
-        if difficulty:
-            count_query += ' AND r.difficulty = ?'
+        # Totals: maintained counters where they apply, exact COUNT(*) on request
+        total = None
+        if not topic and not difficulty:
+            total = counted_total(db, subject_id, resource_type)
+        elif include_total or cursor is None:
+            count_query = 'SELECT COUNT(*) as total FROM resources r WHERE 1=1' + filters
+            total = db.execute(count_query, params).fetchone()['total']
         
-        total = db.execute(count_query, count_params).fetchone()['total']
+        if cursor is not None:
+            # Keyset pagination
+            keyset_query = query
+            if cursor:
+                keyset_query += ' AND (r.created_at, r.id) < (?, ?)'
+                params.extend([cursor_created_at, cursor_id])
+            
+            keyset_query += ' ORDER BY r.created_at DESC, r.id DESC LIMIT ?'
+            params.append(per_page + 1)
+            
+            resources = db.execute(keyset_query, params).fetchall()
+            has_more = len(resources) > per_page
+            resources = resources[:per_page]
+            
+            next_cursor = None
+            if has_more:
+                last = resources[-1]
+                next_cursor = encode_cursor(last['created_at'], last['id'])
+            
+            return jsonify({
+                'success': True,
+                'resources': [merge_counts(dict(resource)) for resource in resources],
+                'pagination': {
+                    'per_page': per_page,
+                    'total': total,
+                    'next_cursor': next_cursor,
+                    'has_more': has_more
+                }
+            })
         
-        # Add pagination
-        query += ' ORDER BY r.created_at DESC LIMIT ? OFFSET ?'
+        # Offset pagination
+        query += ' ORDER BY r.created_at DESC, r.id DESC LIMIT ? OFFSET ?'
         params.extend([per_page, (page - 1) * per_page])
         
         resources = db.execute(query, params).fetchall()
         
         return jsonify({
             'success': True,
-            'resources': [dict(resource) for resource in resources],
+            'resources': [merge_counts(dict(resource)) for resource in resources],
             'pagination': {
                 'page': page,
                 'per_page': per_page,
@@ -82,6 +167,7 @@ def get_resources():
         db.close()
 
 @resources_bp.route('/api/resources/<int:resource_id>', methods=['GET'])
+@conditional('resources', 'subjects', before=record_view)
 def get_resource(resource_id):
     """Get specific resource details"""
     db = get_db()
@@ -98,13 +184,11 @@ def get_resource(resource_id):
         if not resource:
             return jsonify({'success': False, 'error': 'Resource not found'}), 404
         
-        # Increment view count
-        db.execute('UPDATE resources SET view_count = view_count + 1 WHERE id = ?', (resource_id,))
-        db.commit()
-        
+        # The view itself is counted by the conditional layer, so
+        # revalidated (304) hits are counted too
         return jsonify({
             'success': True,
-            'resource': dict(resource)
+            'resource': merge_counts(dict(resource))
         })
         
     except Exception as e:
@@ -112,9 +196,43 @@ def get_resource(resource_id):
     finally:
         db.close()
 
+def _file_etag(resource, path):
+    """Strong ETag for a file: its content hash, else its inode, size and mtime"""
+    if resource['blob_sha256']:
+        return resource['blob_sha256']
+    stat = os.stat(path)
+    return hashlib.sha1(f'{stat.st_ino}:{stat.st_size}:{stat.st_mtime_ns}'.encode('utf-8')).hexdigest()
+
+def _download_name(resource, path):
+    extension = os.path.splitext(path)[1].lower()
+    return (secure_filename(resource['title'] or '') or f"resource-{resource['id']}") + extension
+
+def _offloaded_response(path, download_name, etag):
+    """Headers-only response telling the front proxy to send the file.
+
+    The proxy then serves ranges itself, so only If-None-Match is checked here.
+    """
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+        response.set_etag(etag)
+        return response
+    
+    response = make_response('')
+    if current_app.config['DOWNLOAD_OFFLOAD'] == 'x-accel-redirect':
+        relative = os.path.relpath(path, os.path.realpath(blob_store.root)).replace(os.sep, '/')
+        prefix = current_app.config['X_ACCEL_PREFIX'].rstrip('/')
+        response.headers['X-Accel-Redirect'] = f'{prefix}/{quote(relative)}'
+    else:
+        response.headers['X-Sendfile'] = path
+    del response.headers['Content-Length']
+    response.mimetype = mimetypes.guess_type(download_name)[0] or 'application/octet-stream'
+    response.headers.set('Content-Disposition', 'attachment', filename=download_name)
+    response.set_etag(etag)
+    return response
+
 @resources_bp.route('/api/resources/<int:resource_id>/download', methods=['GET'])
 def download_resource(resource_id):
-    """Download resource file"""
+    """Download resource file, with Range and If-None-Match support"""
     db = get_db()
     
     try:
@@ -123,16 +241,33 @@ def download_resource(resource_id):
         if not resource or not resource['file_path']:
             return jsonify({'success': False, 'error': 'File not found'}), 404
         
-        file_path = resource['file_path']
+        # Only files under the upload folder are served
+        file_path = blob_store.resolve(resource['file_path'])
         
-        if not os.path.exists(file_path):
+        if file_path is None or not os.path.isfile(file_path):
             return jsonify({'success': False, 'error': 'File not found on server'}), 404
         
-        # Increment download count
-        db.execute('UPDATE resources SET download_count = download_count + 1 WHERE id = ?', (resource_id,))
-        db.commit()
+        etag = _file_etag(resource, file_path)
+        download_name = _download_name(resource, file_path)
+        
+        if current_app.config.get('DOWNLOAD_OFFLOAD') in ('x-accel-redirect', 'x-sendfile'):
+            response = _offloaded_response(file_path, download_name, etag)
+        else:
+            response = send_file(
+                file_path, as_attachment=True, download_name=download_name,
+                etag=etag, conditional=True
+            )
+            response.accept_ranges = 'bytes'
         
-        return send_file(file_path, as_attachment=True)
+        # A video player seeking through a file sends many range requests;
+        # count the one that starts at the beginning. Offloaded responses
+        # are always 200 (the proxy serves the range), so the Range header
+        # decides. Buffered; flushed to the database in batches
+        starts_at_zero = not request.range or request.range.ranges[0][0] == 0
+        if response.status_code in (200, 206) and starts_at_zero:
+            record_download(resource_id)
+        
+        return response
         
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -154,31 +289,70 @@ def create_resource():
     db = get_db()
     
     try:
-        db.execute('''
+        # Files from /api/upload are referenced by hash (or their blob path);
+        # path and size then come from the stored blob
+        file_path, file_size, blob = data.get('file_path'), data.get('file_size'), None
+        sha256 = data.get('sha256')
+        if not sha256 and file_path:
+            name = os.path.splitext(os.path.basename(file_path))[0]
+            sha256 = name if is_sha256(name) else None
+        if sha256:
+            blob = blob_store.find(db, sha256.lower())
+            if blob is None and data.get('sha256'):
+                return jsonify({'success': False, 'error': 'Uploaded file not found'}), 400
+        page_count, duration = data.get('page_count'), data.get('duration')
+        if blob is not None:
+            file_path, file_size = blob['path'], blob['size']
+            # Filled in by the worker if the upload is not inspected yet
+            page_count = page_count or blob['page_count']
+            duration = duration or duration_minutes(blob['duration_seconds'])
+        
+        resource_id = db.execute('''
             INSERT INTO resources (
                 subject_id, title, description, resource_type, file_path, file_size,
-                duration, difficulty, marks, paper_number, year, topic, uploaded_by
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                duration, difficulty, marks, paper_number, year, topic, uploaded_by, blob_sha256,
+                page_count
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         ''', (
             data['subject_id'],
             data['title'],
             data.get('description'),
             data['resource_type'],
-            data.get('file_path'),
-            data.get('file_size'),
-            data.get('duration'),
+            file_path,
+            file_size,
+            duration,
             data.get('difficulty'),
             data.get('marks'),
             data.get('paper_number'),
             data.get('year'),
             data.get('topic'),
-            session.get('user_id')
-        ))
+            session.get('user_id'),
+            blob['sha256'] if blob else None,
+            page_count
+        )).lastrowid
+        
+        # Flag likely duplicates of existing resources (not blocking)
+        matches = index_item(
+            db, 'resources', resource_id, f"{data['title']} {data.get('description') or ''}"
+        )
+        duplicates = []
+        if matches:
+            placeholders = ','.join(['?'] * len(matches))
+            titles = dict(db.execute(f'''
+                SELECT id, title FROM resources WHERE id IN ({placeholders})
+            ''', [item_id for item_id, _ in matches]).fetchall())
+            duplicates = [
+                {'id': item_id, 'title': titles.get(item_id), 'similarity': round(score, 3)}
+                for item_id, score in matches
+            ]
         
         db.commit()
+        subject_catalog.note_resource_created(data['subject_id'], data['resource_type'], data.get('topic'))
         
         return jsonify({
             'success': True,
+            'resource_id': resource_id,
+            'possible_duplicates': duplicates,
             'message': 'Resource created successfully'
         })
         
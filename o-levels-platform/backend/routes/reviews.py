@@ -0,0 +1,107 @@
+from flask import Blueprint, request, jsonify, session
+from database import get_db
+from auth import login_required
+from grading import key_entry, grade
+from review import load_states, save_states, next_state, outcome_quality, utc_now, format_timestamp
+
+reviews_bp = Blueprint('reviews', __name__)
+
+@reviews_bp.route('/api/reviews/due', methods=['GET'])
+@login_required
+def get_due_reviews():
+    """Get the logged in user's next due review questions"""
+    limit = min(max(int(request.args.get('limit', 20)), 1), 100)
+    subject_id = request.args.get('subject_id')
+    now = format_timestamp(utc_now())
+    
+    query = '''
+        SELECT q.id, q.subject_id, q.question_text, q.question_type, q.options,
+               q.marks, q.difficulty, q.topic,
+               rs.repetitions, rs.interval_days, rs.lapses, rs.due_at, rs.last_reviewed_at
+        FROM review_state rs
+        JOIN questions q ON q.id = rs.question_id
+        WHERE rs.user_id = ? AND rs.due_at <= ?
+    '''
+    params = [session.get('user_id'), now]
+    
+    if subject_id:
+        query += ' AND q.subject_id = ?'
+        params.append(subject_id)
+    
+    query += ' ORDER BY rs.due_at LIMIT ?'
+    params.append(limit)
+    
+    db = get_db()
+    
+    try:
+        questions = db.execute(query, params).fetchall()
+        
+        due_count = db.execute('''
+            SELECT COUNT(*) FROM review_state WHERE user_id = ? AND due_at <= ?
+        ''', (session.get('user_id'), now)).fetchone()[0]
+        
+        return jsonify({
+            'success': True,
+            'questions': [dict(q) for q in questions],
+            'due_count': due_count
+        })
+        
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        db.close()
+
+@reviews_bp.route('/api/reviews/<int:question_id>', methods=['POST'])
+@login_required
+def review_question(question_id):
+    """Answer a review question and reschedule it.
+
+    Body: {"answer": ...} to have it graded, or {"quality": 0-5} to self-rate.
+    """
+    data = request.get_json() or {}
+    user_id = session.get('user_id')
+    
+    db = get_db()
+    
+    try:
+        question = db.execute('''
+            SELECT id, question_type, options, correct_answer, marks, explanation
+            FROM questions WHERE id = ?
+        ''', (question_id,)).fetchone()
+        
+        if not question:
+            return jsonify({'success': False, 'error': 'Question not found'}), 404
+        
+        result = {}
+        if data.get('quality') is not None:
+            try:
+                quality = int(data['quality'])
+            except (TypeError, ValueError):
+                quality = -1
+            if not 0 <= quality <= 5:
+                return jsonify({'success': False, 'error': 'quality must be between 0 and 5'}), 400
+        else:
+            _, _, outcomes = grade([key_entry(question)], {str(question_id): data.get('answer')})
+            quality = outcome_quality(outcomes[0])
+            result['correct'] = outcomes[0]['correct']
+        
+        state = next_state(load_states(db, user_id, [question_id]).get(question_id), quality, utc_now())
+        save_states(db, user_id, {question_id: state})
+        db.commit()
+        
+        result.update({
+            'success': True,
+            'question_id': question_id,
+            'quality': quality,
+            'correct_answer': question['correct_answer'],
+            'explanation': question['explanation'],
+            'next_due_at': state['due_at'],
+            'interval_days': state['interval_days']
+        })
+        return jsonify(result)
+        
+    except Exception as e:
+        db.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        db.close()
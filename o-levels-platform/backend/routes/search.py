@@ -0,0 +1,47 @@
+from flask import Blueprint, request, jsonify
+import sqlite3
+from database import get_db
+from fulltext import build_match_query, search_resources, search_questions, search_facets
+
+search_bp = Blueprint('search', __name__)
+
+@search_bp.route('/api/search', methods=['GET'])
+def search():
+    """Full-text search over resources and questions with facets"""
+    text = request.args.get('q', '')
+    kind = request.args.get('kind', 'all')
+    subject_id = request.args.get('subject_id')
+    item_type = request.args.get('type')
+    limit = min(max(int(request.args.get('limit', 20)), 1), 50)
+    with_facets = request.args.get('facets', '1').lower() not in ('0', 'false', 'no')
+    
+    if kind not in ('all', 'resources', 'questions'):
+        return jsonify({'success': False, 'error': 'kind must be all, resources or questions'}), 400
+    
+    match = build_match_query(text)
+    if not match:
+        return jsonify({'success': True, 'query': text, 'resources': [], 'questions': [], 'facets': {}})
+    
+    db = get_db()
+    
+    try:
+        results = {'success': True, 'query': text, 'resources': [], 'questions': [], 'facets': {}}
+        
+        if kind in ('all', 'resources'):
+            results['resources'] = search_resources(db, match, subject_id, item_type, limit)
+            if with_facets:
+                results['facets']['resources'] = search_facets(db, match, 'resources')
+        
+        if kind in ('all', 'questions'):
+            results['questions'] = search_questions(db, match, subject_id, item_type, limit)
+            if with_facets:
+                results['facets']['questions'] = search_facets(db, match, 'questions')
+        
+        return jsonify(results)
+        
+    except sqlite3.OperationalError as e:
+        return jsonify({'success': False, 'error': f'Invalid search query: {e}'}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        db.close()
@@ -1,35 +1,27 @@
 from flask import Blueprint, request, jsonify
 from database import get_db
+from progress import average_score
+from catalog import subject_catalog
+from conditional import conditional
+from routes.resources import encode_cursor, decode_cursor
 
 subjects_bp = Blueprint('subjects', __name__)
 
+# Resource types always present in a subject's detail response
+RESOURCE_TYPES = ['notes', 'video', 'questions', 'past_paper']
+DEFAULT_PER_TYPE = 50
+MAX_PER_TYPE = 100
+
 @subjects_bp.route('/api/subjects', methods=['GET'])
+@conditional('subjects', 'resources')
 def get_all_subjects():
     """Get all subjects with statistics"""
     db = get_db()
     
     try:
-        subjects = db.execute('''
-            SELECT s.*, 
-                   COUNT(DISTINCT r.id) as resource_count,
-                   COUNT(DISTINCT CASE WHEN r.resource_type = 'notes' THEN r.id END) as notes_count,
-                   COUNT(DISTINCT CASE WHEN r.resource_type = 'video' THEN r.id END) as videos_count,
-                   COUNT(DISTINCT CASE WHEN r.resource_type = 'questions' THEN r.id END) as questions_count,
-                   COUNT(DISTINCT CASE WHEN r.resource_type = 'past_paper' THEN r.id END) as past_papers_count
-            FROM subjects s
-            LEFT JOIN resources r ON s.id = r.subject_id
-            GROUP BY s.id
-            ORDER BY s.name
-        ''').fetchall()
-        
-        subjects_list = []
-        for subject in subjects:
-            subject_dict = dict(subject)
-            subjects_list.append(subject_dict)
-        
         return jsonify({
             'success': True,
-            'subjects': subjects_list
+            'subjects': subject_catalog.all(db)
         })
         
     except Exception as e:
@@ -37,54 +29,143 @@ def get_all_subjects():
     finally:
         db.close()
 
+def fetch_resources_by_type(db, subject_id, resource_types, per_type=None):
+    """Fetch a subject's resources grouped by type in one statement.
+
+    With ``per_type`` each type is an index seek on
+    (subject_id, resource_type, created_at) reading at most per_type + 1
+    rows (the extra row only signals that more exist); without it the
+    whole subject is read in a single ordered index scan. Returns
+    ({type: [resource, ...]}, {type: has_more}).
+    """
+    grouped = {resource_type: [] for resource_type in resource_types}
+    has_more = {resource_type: False for resource_type in resource_types}
+    
+    if per_type:
+        arm = '''
+            SELECT * FROM (
+                SELECT r.*, u.username as uploaded_by_username
+                FROM resources r
+                LEFT JOIN users u ON r.uploaded_by = u.id
+                WHERE r.subject_id = ? AND r.resource_type = ?
+                ORDER BY r.created_at DESC, r.id DESC
+                LIMIT ?
+            )
+        '''
+        params = []
+        for resource_type in resource_types:
+            params.extend([subject_id, resource_type, per_type + 1])
+        rows = db.execute(' UNION ALL '.join([arm] * len(resource_types)), params).fetchall() if resource_types else []
+    else:
+        rows = db.execute('''
+            SELECT r.*, u.username as uploaded_by_username
+            FROM resources r
+            LEFT JOIN users u ON r.uploaded_by = u.id
+            WHERE r.subject_id = ?
+            ORDER BY r.resource_type DESC, r.created_at DESC, r.id DESC
+        ''', (subject_id,)).fetchall()
+    
+    for row in rows:
+        bucket = grouped.setdefault(row['resource_type'], [])
+        if per_type and len(bucket) >= per_type:
+            has_more[row['resource_type']] = True
+            continue
+        bucket.append(dict(row))
+    
+    return grouped, has_more
+
 @subjects_bp.route('/api/subjects/<int:subject_id>', methods=['GET'])
+@conditional('subjects', 'resources')
 def get_subject_by_id(subject_id):
-    """Get detailed information about a specific subject"""
+    """Get detailed information about a specific subject.
+
+    Returns up to ``per_type`` (default 50, 0 for all) of the newest
+    resources of each type; the rest are fetched with the per-type
+    resources endpoint using the returned cursor.
+    """
+    per_type = request.args.get('per_type', DEFAULT_PER_TYPE, type=int)
+    per_type = min(max(per_type, 0), MAX_PER_TYPE)
     db = get_db()
     
     try:
-        subject = db.execute('''
-            SELECT s.*, 
-                   COUNT(DISTINCT r.id) as total_resources
-            FROM subjects s
-            LEFT JOIN resources r ON s.id = r.subject_id
-            WHERE s.id = ?
-            GROUP BY s.id
-        ''', (subject_id,)).fetchone()
+        subject = subject_catalog.get(db, subject_id)
         
         if not subject:
             return jsonify({'success': False, 'error': 'Subject not found'}), 404
         
-        # Get resources by type
-        resources_by_type = {}
-        resource_types = ['notes', 'video', 'questions', 'past_paper']
+        subject['total_resources'] = subject['resource_count']
         
-        for resource_type in resource_types:
-            resources = db.execute('''
-                SELECT r.*, u.username as uploaded_by_username
-                FROM resources r
-                LEFT JOIN users u ON r.uploaded_by = u.id
-                WHERE r.subject_id = ? AND r.resource_type = ?
-                ORDER BY r.created_at DESC
-            ''', (subject_id, resource_type)).fetchall()
-            
-            resources_by_type[resource_type] = [dict(resource) for resource in resources]
+        # Only query the types this subject actually has resources of
+        counts = subject_catalog.resource_counts(db, subject_id)
+        resource_types = RESOURCE_TYPES + sorted(set(counts) - set(RESOURCE_TYPES))
+        present = [resource_type for resource_type in resource_types if counts.get(resource_type)]
         
-        # Get topics for this subject
-        topics = db.execute('''
-            SELECT DISTINCT topic 
-            FROM resources 
-            WHERE subject_id = ? AND topic IS NOT NULL 
-            ORDER BY topic
-        ''', (subject_id,)).fetchall()
+        resources_by_type, has_more = fetch_resources_by_type(db, subject_id, present, per_type or None)
         
-        topics_list = [topic['topic'] for topic in topics]
+        pagination = {}
+        for resource_type in resource_types:
+            resources_by_type.setdefault(resource_type, [])
+            resources = resources_by_type[resource_type]
+            more = has_more.get(resource_type, False)
+            pagination[resource_type] = {
+                'total': counts.get(resource_type, 0),
+                'has_more': more,
+                'next_cursor': encode_cursor(resources[-1]['created_at'], resources[-1]['id']) if more else None
+            }
         
         return jsonify({
             'success': True,
-            'subject': dict(subject),
+            'subject': subject,
             'resources': resources_by_type,
-            'topics': topics_list
+            'topics': subject_catalog.resource_topics(db, subject_id),
+            'pagination': pagination
+        })
+        
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        db.close()
+
+@subjects_bp.route('/api/subjects/<int:subject_id>/resources/<resource_type>', methods=['GET'])
+@conditional('resources')
+def get_subject_resources_by_type(subject_id, resource_type):
+    """Load more resources of one type for a subject, newest first"""
+    cursor = request.args.get('cursor')
+    limit = min(max(request.args.get('limit', DEFAULT_PER_TYPE, type=int), 1), MAX_PER_TYPE)
+    
+    query = '''
+        SELECT r.*, u.username as uploaded_by_username
+        FROM resources r
+        LEFT JOIN users u ON r.uploaded_by = u.id
+        WHERE r.subject_id = ? AND r.resource_type = ?
+    '''
+    params = [subject_id, resource_type]
+    
+    if cursor:
+        try:
+            created_at, resource_id = decode_cursor(cursor)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        query += ' AND (r.created_at, r.id) < (?, ?)'
+        params.extend([created_at, resource_id])
+    
+    query += ' ORDER BY r.created_at DESC, r.id DESC LIMIT ?'
+    params.append(limit + 1)
+    
+    db = get_db()
+    
+    try:
+        resources = db.execute(query, params).fetchall()
+        has_more = len(resources) > limit
+        resources = [dict(resource) for resource in resources[:limit]]
+        
+        return jsonify({
+            'success': True,
+            'resources': resources,
+            'pagination': {
+                'has_more': has_more,
+                'next_cursor': encode_cursor(resources[-1]['created_at'], resources[-1]['id']) if has_more else None
+            }
         })
         
     except Exception as e:
@@ -104,35 +185,40 @@ def get_subject_progress(subject_id):
     db = get_db()
     
     try:
-        # Get overall progress
-        progress = db.execute('''
-            SELECT 
-                COUNT(*) as total_resources,
-                COUNT(CASE WHEN up.completed = 1 THEN 1 END) as completed_resources,
-                AVG(CASE WHEN up.score IS NOT NULL THEN up.score END) as average_score,
-                SUM(up.time_spent) as total_time_spent
-            FROM resources r
-            LEFT JOIN user_progress up ON r.id = up.resource_id AND up.user_id = ?
-            WHERE r.subject_id = ?
-        ''', (user_id, subject_id)).fetchone()
-        
-        # Get progress by resource type
+        # Progress by resource type, from the maintained summaries and counters
         progress_by_type = db.execute('''
             SELECT 
-                r.resource_type,
-                COUNT(*) as total,
-                COUNT(CASE WHEN up.completed = 1 THEN 1 END) as completed,
-                ROUND(COUNT(CASE WHEN up.completed = 1 THEN 1 END) * 100.0 / COUNT(*), 2) as completion_rate
-            FROM resources r
-            LEFT JOIN user_progress up ON r.id = up.resource_id AND up.user_id = ?
-            WHERE r.subject_id = ?
-            GROUP BY r.resource_type
+                rc.resource_type,
+                rc.count as total,
+                COALESCE(p.completed_resources, 0) as completed,
+                ROUND(COALESCE(p.completed_resources, 0) * 100.0 / rc.count, 2) as completion_rate,
+                COALESCE(p.scored_count, 0) as scored_count,
+                COALESCE(p.score_total, 0) as score_total,
+                p.time_spent
+            FROM resource_counters rc
+            LEFT JOIN user_subject_progress p
+                ON p.user_id = ? AND p.subject_id = rc.subject_id AND p.resource_type = rc.resource_type
+            WHERE rc.subject_id = ? AND rc.count > 0
         ''', (user_id, subject_id)).fetchall()
         
+        progress_by_type = [dict(p) for p in progress_by_type]
+        
+        # Overall progress
+        score_total = sum(p.pop('score_total') for p in progress_by_type)
+        scored_count = sum(p.pop('scored_count') for p in progress_by_type)
+        time_spent = [p.pop('time_spent') for p in progress_by_type]
+        time_spent = [t for t in time_spent if t is not None]
+        progress = {
+            'total_resources': sum(p['total'] for p in progress_by_type),
+            'completed_resources': sum(p['completed'] for p in progress_by_type),
+            'average_score': average_score(score_total, scored_count),
+            'total_time_spent': sum(time_spent) if time_spent else None
+        }
+        
         return jsonify({
             'success': True,
-            'progress': dict(progress),
-            'progress_by_type': [dict(p) for p in progress_by_type]
+            'progress': progress,
+            'progress_by_type': progress_by_type
         })
         
     except Exception as e:
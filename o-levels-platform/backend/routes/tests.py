@@ -1,10 +1,39 @@
 from flask import Blueprint, request, jsonify
 import json
+import random
 from database import get_db
 from auth import login_required
+from conditional import conditional
+from assembly import assemble, MAX_TOTAL_MARKS
+from question_index import question_index
+from grading import answer_keys, grade, record_submission, results_by_question
+from mastery import ability_model
+from review import schedule_outcomes
 
 tests_bp = Blueprint('tests', __name__)
 
+def fetch_test_questions(db, test_id):
+    """Load a test's questions in test order"""
+    questions = db.execute('''
+        SELECT q.*, tq.position
+        FROM test_questions tq
+        JOIN questions q ON q.id = tq.question_id
+        WHERE tq.test_id = ?
+        ORDER BY tq.position
+    ''', (test_id,)).fetchall()
+    return [dict(q) for q in questions]
+
+def fetch_questions(db, question_ids):
+    """Load full question rows, in the order of question_ids"""
+    if not question_ids:
+        return []
+    placeholders = ','.join(['?'] * len(question_ids))
+    rows = db.execute(f'''
+        SELECT * FROM questions WHERE id IN ({placeholders})
+    ''', question_ids).fetchall()
+    by_id = {row['id']: dict(row) for row in rows}
+    return [by_id[question_id] for question_id in question_ids if question_id in by_id]
+
 @tests_bp.route('/api/tests/generate', methods=['POST'])
 @login_required
 def generate_test():
@@ -17,61 +46,68 @@ def generate_test():
         if not data.get(field):
             return jsonify({'success': False, 'error': f'{field} is required'}), 400
     
+    try:
+        total_marks = int(data.get('total_marks', 100))
+    except (TypeError, ValueError):
+        total_marks = None
+    if total_marks is None or not 0 < total_marks <= MAX_TOTAL_MARKS:
+        return jsonify({'success': False, 'error': f'total_marks must be an integer from 1 to {MAX_TOTAL_MARKS}'}), 400
+    
     db = get_db()
     
     try:
-        # Get questions based on criteria
-        query = '''
-            SELECT * FROM questions 
-            WHERE subject_id = ? AND difficulty = ?
-        '''
-        params = [data['subject_id'], data.get('difficulty', 'medium')]
-        
-        if data.get('topics'):
-            topics = data['topics']
-            placeholders = ','.join(['?'] * len(topics))
-            query += f' AND topic IN ({placeholders})'
-            params.extend(topics)
-        
-        if data.get('question_types'):
-            question_types = data['question_types']
-            placeholders = ','.join(['?'] * len(question_types))
-            query += f' AND question_type IN ({placeholders})'
-            params.extend(question_types)
-        
-        questions = db.execute(query, params).fetchall()
-        
-        # Limit questions based on marks
-        total_marks = data.get('total_marks', 100)
-        selected_questions = []
-        current_marks = 0
-        
-        for question in questions:
-            if current_marks + question['marks'] <= total_marks:
-                selected_questions.append(dict(question))
-                current_marks += question['marks']
-            
-            if current_marks >= total_marks:
-                break
+        seed = data.get('seed')
+        if seed is None:
+            seed = random.randrange(2 ** 31)
+        
+        adaptive = bool(data.get('adaptive'))
+        if adaptive:
+            # Questions most informative at the user's per-topic ability
+            groups = ability_model.candidate_groups(
+                db,
+                session.get('user_id'),
+                data['subject_id'],
+                data.get('topics'),
+                data.get('question_types'),
+                max_marks=total_marks,
+                rng=random.Random(seed)
+            )
+        else:
+            # Candidate questions from the resident index (ids and marks only)
+            groups = question_index.candidate_groups(
+                db,
+                data['subject_id'],
+                data.get('difficulty', 'medium'),
+                data.get('topics'),
+                data.get('question_types'),
+                max_marks=total_marks
+            )
+        
+        # Pick questions adding up to the requested marks
+        chosen, current_marks = assemble(groups, total_marks, seed, ranked=adaptive)
+        selected_questions = fetch_questions(db, [c[0] for c in chosen])
         
         # Create test record
         test_id = db.execute('''
             INSERT INTO tests (
                 user_id, title, subject_id, paper_number, difficulty, 
-                total_marks, time_limit, question_types, custom_questions
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                total_marks, time_limit, question_types
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
         ''', (
             session.get('user_id'),
             data['title'],
             data['subject_id'],
             data.get('paper_number'),
-            data.get('difficulty', 'medium'),
+            'adaptive' if adaptive else data.get('difficulty', 'medium'),
             total_marks,
             data.get('time_limit', 180),
-            json.dumps(data.get('question_types', [])),
-            json.dumps([q['id'] for q in selected_questions])
+            json.dumps(data.get('question_types', []))
         )).lastrowid
         
+        db.executemany('''
+            INSERT INTO test_questions (test_id, position, question_id) VALUES (?, ?, ?)
+        ''', [(test_id, position, q['id']) for position, q in enumerate(selected_questions)])
+        
         db.commit()
         
         return jsonify({
@@ -79,7 +115,10 @@ def generate_test():
             'test_id': test_id,
             'questions': selected_questions,
             'total_questions': len(selected_questions),
-            'total_marks': current_marks
+            'total_marks': current_marks,
+            'target_marks': total_marks,
+            'adaptive': adaptive,
+            'seed': seed
         })
         
     except Exception as e:
@@ -89,6 +128,7 @@ def generate_test():
         db.close()
 
 @tests_bp.route('/api/tests/<int:test_id>', methods=['GET'])
+@conditional('tests', 'questions')
 def get_test(test_id):
     """Get test details and questions"""
     db = get_db()
@@ -105,20 +145,10 @@ def get_test(test_id):
         if not test:
             return jsonify({'success': False, 'error': 'Test not found'}), 404
         
-        # Get questions for this test
-        custom_questions = json.loads(test['custom_questions'] or '[]')
-        questions = []
-        
-        if custom_questions:
-            placeholders = ','.join(['?'] * len(custom_questions))
-            questions = db.execute(f'''
-                SELECT * FROM questions WHERE id IN ({placeholders})
-            ''', custom_questions).fetchall()
-        
         return jsonify({
             'success': True,
             'test': dict(test),
-            'questions': [dict(q) for q in questions]
+            'questions': fetch_test_questions(db, test_id)
         })
         
     except Exception as e:
@@ -138,57 +168,116 @@ def submit_test(test_id):
     db = get_db()
     
     try:
-        # Get test and questions
-        test = db.execute('SELECT * FROM tests WHERE id = ?', (test_id,)).fetchone()
+        # Get test and its cached answer key
+        test = db.execute('SELECT id FROM tests WHERE id = ?', (test_id,)).fetchone()
         if not test:
             return jsonify({'success': False, 'error': 'Test not found'}), 404
         
-        custom_questions = json.loads(test['custom_questions'] or '[]')
-        questions = db.execute(f'''
-            SELECT * FROM questions WHERE id IN ({','.join(['?'] * len(custom_questions))})
-        ''', custom_questions).fetchall()
+        key = answer_keys.get(db, test_id)
+        total_score, max_score, outcomes = grade(key, answers)
         
-        # Calculate score
-        total_score = 0
-        max_score = 0
-        results = {}
-        
-        for question in questions:
-            max_score += question['marks']
-            user_answer = answers.get(str(question['id']))
-            
-            if user_answer and user_answer == question['correct_answer']:
-                total_score += question['marks']
-                results[str(question['id'])] = {
-                    'correct': True,
-                    'score': question['marks'],
-                    'user_answer': user_answer,
-                    'correct_answer': question['correct_answer']
-                }
-            else:
-                results[str(question['id'])] = {
-                    'correct': False,
-                    'score': 0,
-                    'user_answer': user_answer,
-                    'correct_answer': question['correct_answer']
-                }
-        
-        percentage = (total_score / max_score) * 100 if max_score > 0 else 0
-        
-        # Update test record
-        db.execute('''
-            UPDATE tests 
-            SET is_completed = 1, score = ?, time_taken = ?
-            WHERE id = ?
-        ''', (percentage, data.get('time_taken'), test_id))
+        submission_id, percentage = record_submission(
+            db, test_id, session.get('user_id'), total_score, max_score, outcomes, data.get('time_taken')
+        )
+        schedule_outcomes(db, session.get('user_id'), outcomes)
+        ability_model.refresh(db, session.get('user_id'))
         
         db.commit()
         
         return jsonify({
             'success': True,
+            'submission_id': submission_id,
             'score': total_score,
             'max_score': max_score,
             'percentage': percentage,
+            'results': results_by_question(outcomes)
+        })
+        
+    except Exception as e:
+        db.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        db.close()
+
+@tests_bp.route('/api/tests/submit-batch', methods=['POST'])
+@login_required
+def submit_tests_batch():
+    """Grade many submissions in one transaction.
+
+    Body: {"submissions": [{"test_id", "answers", "time_taken"}]}, all
+    recorded for the logged-in user.
+    """
+    from flask import session
+    data = request.get_json()
+    
+    submissions = data.get('submissions') or []
+    if not isinstance(submissions, list):
+        return jsonify({'success': False, 'error': 'submissions must be a list'}), 400
+    
+    # There are no teacher roles, so nobody may submit for another user
+    user_id = session['user_id']
+    if any(isinstance(s, dict) and s.get('user_id') not in (None, user_id) for s in submissions):
+        return jsonify({'success': False, 'error': 'Cannot submit tests for another user'}), 403
+    
+    db = get_db()
+    
+    try:
+        # Entries that are not objects are reported per item, like unknown tests
+        for index, submission in enumerate(submissions):
+            if not isinstance(submission, dict):
+                submissions[index] = None
+                continue
+            try:
+                submission['test_id'] = int(submission.get('test_id'))
+            except (TypeError, ValueError):
+                submission['test_id'] = None
+        
+        test_ids = sorted({s['test_id'] for s in submissions if s and s['test_id']})
+        existing = set()
+        if test_ids:
+            placeholders = ','.join(['?'] * len(test_ids))
+            existing = {row['id'] for row in db.execute(f'''
+                SELECT id FROM tests WHERE id IN ({placeholders})
+            ''', test_ids).fetchall()}
+        
+        version = answer_keys.questions_version(db)
+        results = []
+        for index, submission in enumerate(submissions):
+            if submission is None:
+                results.append({'index': index, 'success': False, 'error': 'submission must be an object'})
+                continue
+            answers = submission.get('answers') or {}
+            if not isinstance(answers, dict):
+                results.append({'index': index, 'success': False, 'error': 'answers must be an object'})
+                continue
+            test_id = submission['test_id']
+            if test_id not in existing:
+                results.append({'index': index, 'success': False, 'error': 'Test not found'})
+                continue
+            
+            key = answer_keys.get(db, test_id, version)
+            total_score, max_score, outcomes = grade(key, answers)
+            submission_id, percentage = record_submission(
+                db, test_id, user_id, total_score, max_score, outcomes, submission.get('time_taken')
+            )
+            schedule_outcomes(db, user_id, outcomes)
+            results.append({
+                'index': index,
+                'success': True,
+                'test_id': test_id,
+                'submission_id': submission_id,
+                'score': total_score,
+                'max_score': max_score,
+                'percentage': percentage
+            })
+        
+        ability_model.refresh(db, user_id)
+        
+        db.commit()
+        
+        return jsonify({
+            'success': True,
+            'graded': sum(1 for r in results if r['success']),
             'results': results
         })
         
@@ -196,4 +285,4 @@ def submit_test(test_id):
         db.rollback()
         return jsonify({'success': False, 'error': str(e)}), 500
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
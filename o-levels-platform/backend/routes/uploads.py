@@ -0,0 +1,184 @@
+from flask import Blueprint, request, jsonify
+import os
+import re
+from database import get_db
+from auth import login_required
+from storage import allowed_file, is_sha256, StorageError
+from worker import queue_inspection
+from jobs import get_job, describe as describe_job
+from resumable import (
+    create_session, get_session, write_chunk, finalize, abort, describe,
+    MAX_UPLOAD_SIZE, RECOMMENDED_CHUNK_SIZE
+)
+
+uploads_bp = Blueprint('uploads', __name__)
+
+_CONTENT_RANGE = re.compile(r'^bytes (\d+)-(\d+)/(\d+|\*)$')
+
+def _owned_session(db, upload_id):
+    """The upload session if it belongs to the logged in user, else None"""
+    from flask import session
+    upload = get_session(db, upload_id)
+    if upload is None or upload['user_id'] != session.get('user_id'):
+        return None
+    return upload
+
+@uploads_bp.route('/api/uploads', methods=['POST'])
+@login_required
+def start_upload():
+    """Open a resumable upload: {"filename", "size", "sha256"?}"""
+    from flask import session
+    data = request.get_json() or {}
+    
+    filename = os.path.basename(data.get('filename') or '')
+    if not filename or not allowed_file(filename):
+        return jsonify({'success': False, 'error': 'File type not allowed'}), 400
+    
+    try:
+        size = int(data.get('size'))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'size is required'}), 400
+    if not 0 < size <= MAX_UPLOAD_SIZE:
+        return jsonify({'success': False, 'error': f'size must be between 1 and {MAX_UPLOAD_SIZE} bytes'}), 400
+    
+    sha256 = (data.get('sha256') or '').lower() or None
+    if sha256 and not is_sha256(sha256):
+        return jsonify({'success': False, 'error': 'Invalid SHA-256'}), 400
+    
+    db = get_db()
+    
+    try:
+        upload = create_session(db, session.get('user_id'), filename, size, sha256)
+        return jsonify({'success': True, 'chunk_size': RECOMMENDED_CHUNK_SIZE, **describe(upload)}), 201
+        
+    except Exception as e:
+        db.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        db.close()
+
+@uploads_bp.route('/api/uploads/<upload_id>', methods=['GET'])
+@login_required
+def upload_status(upload_id):
+    """Get the received and missing byte ranges of an upload"""
+    db = get_db()
+    
+    try:
+        upload = _owned_session(db, upload_id)
+        if upload is None:
+            return jsonify({'success': False, 'error': 'Upload not found'}), 404
+        
+        return jsonify({'success': True, **describe(upload)})
+        
+    finally:
+        db.close()
+
+@uploads_bp.route('/api/uploads/<upload_id>', methods=['PUT'])
+@login_required
+def upload_chunk(upload_id):
+    """Write one chunk, given by ?offset= or a Content-Range header"""
+    length = request.content_length
+    content_range = request.headers.get('Content-Range')
+    if content_range:
+        match = _CONTENT_RANGE.match(content_range.strip())
+        if not match:
+            return jsonify({'success': False, 'error': 'Invalid Content-Range'}), 400
+        offset = int(match.group(1))
+        if length is not None and int(match.group(2)) - offset + 1 != length:
+            return jsonify({'success': False, 'error': 'Content-Range does not match the body'}), 400
+    else:
+        offset = request.args.get('offset', type=int)
+    
+    if offset is None or not length:
+        return jsonify({'success': False, 'error': 'offset and a non-empty body are required'}), 400
+    
+    db = get_db()
+    
+    try:
+        upload = _owned_session(db, upload_id)
+        if upload is None:
+            return jsonify({'success': False, 'error': 'Upload not found'}), 404
+        
+        upload = write_chunk(db, upload, offset, request.stream, length, request.headers.get('X-Chunk-SHA256'))
+        return jsonify({'success': True, **describe(upload)})
+        
+    except StorageError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except OSError as e:
+        return jsonify({'success': False, 'error': f'Chunk could not be written: {e.strerror or e}'}), 500
+    finally:
+        db.close()
+
+@uploads_bp.route('/api/uploads/<upload_id>/finalize', methods=['POST'])
+@login_required
+def finalize_upload(upload_id):
+    """Verify a complete upload against its SHA-256 ({"sha256"} here or at start) and store it"""
+    data = request.get_json(silent=True) or {}
+    
+    db = get_db()
+    
+    try:
+        upload = _owned_session(db, upload_id)
+        if upload is None:
+            return jsonify({'success': False, 'error': 'Upload not found'}), 404
+        
+        sha256 = (data.get('sha256') or '').lower() or None
+        if sha256 and not is_sha256(sha256):
+            return jsonify({'success': False, 'error': 'Invalid SHA-256'}), 400
+        
+        try:
+            blob, created = finalize(db, upload, sha256)
+        except StorageError as e:
+            upload = get_session(db, upload_id) or upload
+            return jsonify({'success': False, 'error': str(e), **describe(upload)}), 400
+        except OSError as e:
+            return jsonify({'success': False, 'error': f'Upload could not be stored: {e.strerror or e}'}), 500
+        
+        job_id = queue_inspection(db, blob)
+        
+        return jsonify({
+            'success': True,
+            'filename': os.path.basename(blob['path']),
+            'file_path': blob['path'],
+            'file_size': blob['size'],
+            'sha256': blob['sha256'],
+            'deduplicated': not created,
+            'job_id': job_id,
+            'message': 'File uploaded successfully'
+        })
+        
+    finally:
+        db.close()
+
+@uploads_bp.route('/api/uploads/<upload_id>', methods=['DELETE'])
+@login_required
+def cancel_upload(upload_id):
+    """Abandon an upload and delete what was received"""
+    db = get_db()
+    
+    try:
+        upload = _owned_session(db, upload_id)
+        if upload is None:
+            return jsonify({'success': False, 'error': 'Upload not found'}), 404
+        
+        abort(db, upload)
+        return jsonify({'success': True, 'message': 'Upload cancelled'})
+        
+    finally:
+        db.close()
+
+@uploads_bp.route('/api/jobs/<int:job_id>', methods=['GET'])
+@login_required
+def job_status(job_id):
+    """Get the status and result of a background job"""
+    db = get_db()
+    
+    try:
+        job = get_job(db, job_id)
+        if job is None:
+            return jsonify({'success': False, 'error': 'Job not found'}), 404
+        
+        return jsonify({'success': True, 'job': describe_job(job)})
+        
+    finally:
+        db.close()
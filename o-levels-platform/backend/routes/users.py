@@ -1,10 +1,17 @@
 from flask import Blueprint, request, jsonify
+import math
 from database import get_db
 from auth import login_required
+from activity import log_activity
+from progress import apply_progress_change, average_score
+from conditional import conditional
+from mastery import ability_model
+from recommendations import recommender, load_resources, DEFAULT_LIMIT
 
 users_bp = Blueprint('users', __name__)
 
 @users_bp.route('/api/users/<int:user_id>/profile', methods=['GET'])
+@conditional('users')
 def get_user_profile(user_id):
     """Get user profile information"""
     db = get_db()
@@ -35,33 +42,49 @@ def get_user_progress(user_id):
     db = get_db()
     
     try:
-        # Overall progress
-        overall = db.execute('''
-            SELECT 
-                COUNT(DISTINCT r.id) as total_resources,
-                COUNT(DISTINCT CASE WHEN up.completed = 1 THEN up.resource_id END) as completed_resources,
-                SUM(up.time_spent) as total_time_spent,
-                AVG(up.score) as average_score
-            FROM resources r
-            LEFT JOIN user_progress up ON r.id = up.resource_id AND up.user_id = ?
-        ''', (user_id,)).fetchone()
-        
-        # Progress by subject
+        # Progress by subject, from the maintained summaries and counters
         by_subject = db.execute('''
             SELECT 
                 s.id, s.name, s.code, s.color, s.icon,
-                COUNT(DISTINCT r.id) as total_resources,
-                COUNT(DISTINCT CASE WHEN up.completed = 1 THEN up.resource_id END) as completed_resources,
-                ROUND(COUNT(DISTINCT CASE WHEN up.completed = 1 THEN up.resource_id END) * 100.0 / COUNT(DISTINCT r.id), 2) as completion_rate,
-                AVG(up.score) as average_score,
-                SUM(up.time_spent) as time_spent
+                COALESCE(rc.total, 0) as total_resources,
+                COALESCE(p.completed, 0) as completed_resources,
+                ROUND(COALESCE(p.completed, 0) * 100.0 / rc.total, 2) as completion_rate,
+                p.score_total * 1.0 / NULLIF(p.scored_count, 0) as average_score,
+                p.time_spent as time_spent,
+                COALESCE(p.score_total, 0) as score_total,
+                COALESCE(p.scored_count, 0) as scored_count
             FROM subjects s
-            LEFT JOIN resources r ON s.id = r.subject_id
-            LEFT JOIN user_progress up ON r.id = up.resource_id AND up.user_id = ?
-            GROUP BY s.id
+            LEFT JOIN (
+                SELECT subject_id, SUM(count) as total
+                FROM resource_counters
+                GROUP BY subject_id
+            ) rc ON rc.subject_id = s.id
+            LEFT JOIN (
+                SELECT subject_id,
+                       SUM(completed_resources) as completed,
+                       SUM(scored_count) as scored_count,
+                       SUM(score_total) as score_total,
+                       SUM(time_spent) as time_spent
+                FROM user_subject_progress
+                WHERE user_id = ?
+                GROUP BY subject_id
+            ) p ON p.subject_id = s.id
             ORDER BY completion_rate DESC
         ''', (user_id,)).fetchall()
         
+        by_subject = [dict(subject) for subject in by_subject]
+        
+        # Overall progress
+        score_total = sum(subject.pop('score_total') for subject in by_subject)
+        scored_count = sum(subject.pop('scored_count') for subject in by_subject)
+        time_spent = [subject['time_spent'] for subject in by_subject if subject['time_spent'] is not None]
+        overall = {
+            'total_resources': sum(subject['total_resources'] for subject in by_subject),
+            'completed_resources': sum(subject['completed_resources'] for subject in by_subject),
+            'total_time_spent': sum(time_spent) if time_spent else None,
+            'average_score': average_score(score_total, scored_count)
+        }
+        
         # Recent activity
         activity = db.execute('''
             SELECT activity_type, activity_details, activity_date
@@ -73,8 +96,8 @@ def get_user_progress(user_id):
         
         return jsonify({
             'success': True,
-            'overall': dict(overall),
-            'by_subject': [dict(subject) for subject in by_subject],
+            'overall': overall,
+            'by_subject': by_subject,
             'recent_activity': [dict(activity) for activity in activity]
         })
         
@@ -95,15 +118,42 @@ def update_user_progress(user_id):
         if not data.get(field):
             return jsonify({'success': False, 'error': f'{field} is required'}), 400
     
+    # The summaries add these up, so they must be numbers
+    try:
+        score = None if data.get('score') in (None, '') else float(data['score'])
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'score must be a number'}), 400
+    try:
+        time_spent = None if data.get('time_spent') in (None, '') else int(data['time_spent'])
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'time_spent must be a whole number'}), 400
+    
     db = get_db()
     
     try:
+        resource = db.execute('''
+            SELECT subject_id, resource_type FROM resources WHERE id = ?
+        ''', (data['resource_id'],)).fetchone()
+        
+        if not resource:
+            return jsonify({'success': False, 'error': 'Resource not found'}), 404
+        
+        # The summary delta is computed from this read, so take the write lock
+        # first; otherwise two concurrent updates apply the same old -> new change
+        db.execute('BEGIN IMMEDIATE')
+        
         # Check if progress record exists
         existing = db.execute('''
-            SELECT id FROM user_progress 
+            SELECT id, completed, score, time_spent FROM user_progress 
             WHERE user_id = ? AND resource_id = ?
         ''', (user_id, data['resource_id'])).fetchone()
         
+        updated = {
+            'completed': 1 if data.get('completed') in (1, True, '1', 'true') else 0,
+            'score': score,
+            'time_spent': time_spent
+        }
+        
         if existing:
             # Update existing record
             db.execute('''
@@ -112,35 +162,39 @@ def update_user_progress(user_id):
                 WHERE id = ?
             ''', (
                 data['progress_type'],
-                data.get('completed', 0),
-                data.get('score'),
-                data.get('time_spent'),
+                updated['completed'],
+                updated['score'],
+                updated['time_spent'],
                 data.get('notes'),
                 existing['id']
             ))
         else:
             # Create new record
             db.execute('''
-                INSERT INTO user_progress (user_id, resource_id, progress_type, completed, score, time_spent, notes)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
+                INSERT INTO user_progress (user_id, subject_id, resource_id, progress_type, completed, score, time_spent, notes)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
             ''', (
                 user_id,
+                resource['subject_id'],
                 data['resource_id'],
                 data['progress_type'],
-                data.get('completed', 0),
-                data.get('score'),
-                data.get('time_spent'),
+                updated['completed'],
+                updated['score'],
+                updated['time_spent'],
                 data.get('notes')
             ))
         
-        # Log activity
-        db.execute('''
-            INSERT INTO user_activity (user_id, activity_type, activity_details)
-            VALUES (?, ?, ?)
-        ''', (user_id, 'progress_update', f'Updated progress for resource {data["resource_id"]}'))
+        # Keep the per-subject summary in step, in the same transaction
+        apply_progress_change(db, user_id, resource['subject_id'], resource['resource_type'], existing, updated)
         
         db.commit()
         
+        if (existing['completed'] if existing else 0) != updated['completed']:
+            recommender.notify(user_id)
+        
+        # Log activity
+        log_activity(user_id, 'progress_update', f'Updated progress for resource {data["resource_id"]}', request.remote_addr)
+        
         return jsonify({
             'success': True,
             'message': 'Progress updated successfully'
@@ -149,5 +203,73 @@ def update_user_progress(user_id):
     except Exception as e:
         db.rollback()
         return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        db.close()
+
+@users_bp.route('/api/users/<int:user_id>/mastery', methods=['GET'])
+@login_required
+def get_user_mastery(user_id):
+    """Get per-topic ability estimates for a subject.
+
+    Read-only: submissions not yet folded in are included in the estimate
+    but saved only by the submit endpoints.
+    """
+    from flask import session
+    
+    if user_id != session['user_id']:
+        return jsonify({'success': False, 'error': 'Cannot view another user\'s mastery'}), 403
+    
+    subject_id = request.args.get('subject_id', type=int)
+    if subject_id is None:
+        return jsonify({'success': False, 'error': 'subject_id is required'}), 400
+    
+    db = get_db()
+    
+    try:
+        topics, prior = ability_model.abilities(db, user_id, subject_id, persist=False)
+        
+        mastery = [
+            {
+                'topic': topic,
+                'ability': round(theta, 3),
+                'standard_error': round(precision ** -0.5, 3),
+                'responses': responses,
+                # Chance of answering a medium question correctly
+                'mastery': round(1 / (1 + math.exp(-theta)), 3)
+            }
+            for topic, (theta, precision, responses) in sorted(topics.items())
+        ]
+        
+        return jsonify({
+            'success': True,
+            'subject_id': subject_id,
+            'prior_ability': round(prior, 3),
+            'topics': mastery
+        })
+        
+    except Exception as e:
+        db.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+    finally:
+        db.close()
+
+@users_bp.route('/api/users/<int:user_id>/recommendations', methods=['GET'])
+def get_user_recommendations(user_id):
+    """Get resources to study next, optionally for one subject"""
+    subject_id = request.args.get('subject_id', type=int)
+    limit = min(request.args.get('limit', DEFAULT_LIMIT, type=int), 50)
+    
+    db = get_db()
+    
+    try:
+        resource_ids = recommender.recommend(db, user_id, subject_id, limit)
+        
+        return jsonify({
+            'success': True,
+            'recommendations': load_resources(db, resource_ids)
+        })
+        
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
     finally:
         db.close()
\ No newline at end of file
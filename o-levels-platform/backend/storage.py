@@ -0,0 +1,176 @@
+"""Content-addressed storage for uploaded files.
+
+Uploads are streamed to a temporary file in CHUNK_SIZE pieces while their
+SHA-256 is computed, then moved to blobs/<aa>/<bb>/<sha256><ext> under the
+upload folder. A file whose hash is already stored is discarded and the
+existing blob returned, so identical uploads share one copy on disk; a
+client that sends the hash up front skips the transfer entirely.
+
+The blobs table records each blob's size and how many resources reference
+it (kept by triggers on resources.blob_sha256). ``python storage.py gc``
+deletes blobs nothing has referenced for GC_GRACE_HOURS since they were
+last uploaded, along with abandoned resumable upload sessions.
+"""
+import hashlib
+import os
+import re
+import sys
+import sqlite3
+import tempfile
+
+UPLOAD_FOLDER = 'uploads'
+ALLOWED_EXTENSIONS = {'pdf', 'doc', 'docx', 'ppt', 'pptx', 'jpg', 'jpeg', 'png', 'mp4', 'avi', 'mov'}
+CHUNK_SIZE = 1024 * 1024
+GC_GRACE_HOURS = 24  # unreferenced uploads kept this long for a resource to claim them
+
+_SHA256 = re.compile(r'^[0-9a-f]{64}$')
+
+class StorageError(Exception):
+    """An upload that cannot be stored"""
+
+def is_sha256(value):
+    return bool(value) and bool(_SHA256.match(value))
+
+def allowed_file(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+
+def file_sha256(path, chunk_size=CHUNK_SIZE):
+    """SHA-256 of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class BlobStore:
+    """Blob files under an upload folder, indexed by the blobs table"""
+
+    def __init__(self, root=UPLOAD_FOLDER, chunk_size=CHUNK_SIZE):
+        self.root = root
+        self.chunk_size = chunk_size
+
+    def blob_path(self, sha256, extension=''):
+        return os.path.join(self.root, 'blobs', sha256[:2], sha256[2:4], sha256 + extension)
+
+    def temp_dir(self):
+        path = os.path.join(self.root, 'tmp')
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def resolve(self, file_path):
+        """Real path of a stored file, or None if it lies outside the upload folder"""
+        if not file_path:
+            return None
+        root = os.path.realpath(self.root)
+        path = os.path.realpath(file_path)
+        if os.path.commonpath([root, path]) != root:
+            return None
+        return path
+
+    def find(self, db, sha256):
+        """Stored blob row for a hash, or None if unknown or missing on disk"""
+        if not is_sha256(sha256):
+            return None
+        blob = db.execute('SELECT * FROM blobs WHERE sha256 = ?', (sha256,)).fetchone()
+        if blob is None or not os.path.exists(blob['path']):
+            return None
+        return dict(blob)
+
+    def touch(self, db, sha256):
+        """Restart the grace period of a blob just uploaded again (commits)"""
+        db.execute('UPDATE blobs SET last_used_at = CURRENT_TIMESTAMP WHERE sha256 = ?', (sha256,))
+        db.commit()
+
+    def write_temp(self, stream, expected_sha256=None):
+        """Copy a stream to a temporary file in chunks; returns (path, sha256, size)"""
+        digest = hashlib.sha256()
+        size = 0
+        handle, temp_path = tempfile.mkstemp(dir=self.temp_dir(), suffix='.part')
+        try:
+            with os.fdopen(handle, 'wb') as out:
+                while True:
+                    chunk = stream.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    out.write(chunk)
+                    size += len(chunk)
+            sha256 = digest.hexdigest()
+            if expected_sha256 and sha256 != expected_sha256.lower():
+                raise StorageError('SHA-256 of the upload does not match')
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        return temp_path, sha256, size
+
+    def adopt(self, db, temp_path, sha256, size, filename=None):
+        """Move a fully written temp file into blob storage (commits).
+
+        Returns (blob row, created); when the content is already stored the
+        temp file is removed and the existing blob returned.
+        """
+        existing = self.find(db, sha256)
+        if existing is not None:
+            os.remove(temp_path)
+            # Unreferenced, it would otherwise be collectable before the
+            # client creates a resource for it
+            self.touch(db, sha256)
+            return existing, False
+        
+        extension = os.path.splitext(filename or '')[1].lower()
+        path = self.blob_path(sha256, extension)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(temp_path, path)
+        
+        # A concurrent upload of the same content may have won the insert
+        db.execute('''
+            INSERT INTO blobs (sha256, size, path) VALUES (?, ?, ?)
+            ON CONFLICT (sha256) DO UPDATE SET path = excluded.path, size = excluded.size
+        ''', (sha256, size, path))
+        db.commit()
+        return self.find(db, sha256), True
+
+    def store_stream(self, db, stream, filename=None, expected_sha256=None):
+        """Stream an upload into storage; returns (blob row, created)"""
+        temp_path, sha256, size = self.write_temp(stream, expected_sha256)
+        return self.adopt(db, temp_path, sha256, size, filename)
+
+    def collect_garbage(self, db, grace_hours=GC_GRACE_HOURS):
+        """Delete blobs no resource has referenced within the grace period"""
+        blobs = db.execute('''
+            SELECT sha256, path FROM blobs
+            WHERE ref_count <= 0 AND COALESCE(last_used_at, created_at) < datetime('now', ?)
+        ''', (f'-{int(grace_hours)} hours',)).fetchall()
+        removed = 0
+        for sha256, path in blobs:
+            # Conditions rechecked: it may have been referenced or uploaded again since
+            deleted = db.execute('''
+                DELETE FROM blobs
+                WHERE sha256 = ? AND ref_count <= 0 AND COALESCE(last_used_at, created_at) < datetime('now', ?)
+            ''', (sha256, f'-{int(grace_hours)} hours')).rowcount
+            if not deleted:
+                continue
+            # Content uploaded again later is inspected afresh
+            db.execute("DELETE FROM jobs WHERE kind = 'inspect_blob' AND job_key = ?", (sha256,))
+            db.commit()
+            removed += 1
+            if os.path.exists(path):
+                os.remove(path)
+        db.commit()
+        return removed
+
+blob_store = BlobStore()
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] != 'gc':
+        print('Usage: python storage.py gc')
+        sys.exit(1)
+
+    from database import get_db_path
+    from resumable import expire_sessions
+    conn = sqlite3.connect(get_db_path())
+    conn.row_factory = sqlite3.Row
+    expired = expire_sessions(conn)
+    removed = blob_store.collect_garbage(conn)
+    conn.close()
+    print(f'Removed {expired} expired upload session(s) and {removed} unreferenced blob(s)')
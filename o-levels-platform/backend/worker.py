@@ -0,0 +1,175 @@
+"""Background worker for the jobs queue.
+
+Run ``python worker.py [--processes N] [--once] [--backfill]`` next to the
+web server. The main process claims batches of due jobs and hands them to
+a pool of worker processes, so parsing large uploads never runs on a
+request thread or holds the GIL of the web process; results come back to
+the main process, which is the only one writing to the database.
+
+--once drains the queue and exits (for cron); --backfill first queues an
+inspection for every stored blob that has not had one.
+"""
+import json
+import os
+import socket
+import sys
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+import jobs
+import media
+
+BATCH_SIZE = 16
+POLL_INTERVAL = 2  # seconds between polls when the queue is empty
+JOB_TIMEOUT = jobs.LEASE_SECONDS // 4  # seconds a job may run before the pool is recycled
+
+def inspect_blob(payload):
+    """Pool task: check a stored file and read its metadata"""
+    return media.inspect(payload['path'])
+
+def apply_inspection(db, payload, result):
+    """Store inspection results on the blob and fill resources that use it"""
+    db.execute('''
+        UPDATE blobs
+        SET media_type = ?, integrity = ?, page_count = ?, duration_seconds = ?,
+            inspected_at = CURRENT_TIMESTAMP
+        WHERE sha256 = ?
+    ''', (
+        result['media_type'], result['integrity'], result['page_count'],
+        result['duration_seconds'], payload['sha256']
+    ))
+    # Values entered by hand are kept
+    db.execute('''
+        UPDATE resources
+        SET page_count = COALESCE(page_count, ?), duration = COALESCE(duration, ?)
+        WHERE blob_sha256 = ? AND (
+            (page_count IS NULL AND ? IS NOT NULL) OR (duration IS NULL AND ? IS NOT NULL)
+        )
+    ''', (
+        result['page_count'], media.duration_minutes(result['duration_seconds']), payload['sha256'],
+        result['page_count'], media.duration_minutes(result['duration_seconds'])
+    ))
+
+# kind -> (task run in a pool process, result handler run in the main process)
+TASKS = {
+    'inspect_blob': (inspect_blob, apply_inspection)
+}
+
+def queue_inspection(db, blob):
+    """Queue the inspection of a stored blob, once per blob (commits); returns the job id.
+
+    A blob that was collected and uploaded again is not inspected yet, so
+    its finished job is run again.
+    """
+    job_id = jobs.enqueue(
+        db, 'inspect_blob', {'sha256': blob['sha256'], 'path': blob['path']}, blob['sha256'],
+        requeue=blob['inspected_at'] is None
+    )
+    db.commit()
+    return job_id
+
+def process_batch(db, pool, worker):
+    """Claim and run one batch of jobs; returns the number processed"""
+    claimed = jobs.claim(db, worker, BATCH_SIZE)
+    futures = []
+    for job in claimed:
+        if job['kind'] not in TASKS:
+            jobs.fail(db, job, f"unknown job kind {job['kind']}")
+            continue
+        payload = json.loads(job['payload'])
+        futures.append((job, payload, pool.submit(TASKS[job['kind']][0], payload)))
+    db.commit()
+
+    broken = stuck = False
+    for job, payload, future in futures:
+        if stuck:
+            # Its process is about to be killed with the stuck one
+            jobs.release(db, job['id'])
+            db.commit()
+            continue
+        try:
+            # Waits begin as earlier jobs finish, so this roughly bounds each job's run
+            result = future.result(JOB_TIMEOUT)
+            TASKS[job['kind']][1](db, payload, result)
+            jobs.complete(db, job['id'], result)
+        except TimeoutError:
+            stuck = True
+            jobs.fail(db, job, f'timed out after {JOB_TIMEOUT} seconds')
+        except BrokenProcessPool as e:
+            broken = True
+            jobs.fail(db, job, f'worker process died: {e}')
+        except Exception as e:
+            jobs.fail(db, job, f'{e.__class__.__name__}: {e}')
+        db.commit()
+    if stuck:
+        raise BrokenProcessPool('a job timed out')
+    if broken:
+        raise BrokenProcessPool('a pool process died')
+    return len(claimed)
+
+def backfill(db):
+    """Queue inspections for blobs never inspected; returns the number queued"""
+    blobs = db.execute('SELECT sha256, path FROM blobs WHERE inspected_at IS NULL').fetchall()
+    for blob in blobs:
+        jobs.enqueue(
+            db, 'inspect_blob', {'sha256': blob['sha256'], 'path': blob['path']}, blob['sha256'], requeue=True
+        )
+    db.commit()
+    return len(blobs)
+
+def stop_pool(pool):
+    """Shut a pool down, killing processes stuck in a task"""
+    # shutdown() alone waits on, or leaves behind, a process that never returns
+    processes = list((pool._processes or {}).values())
+    pool.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        process.terminate()
+
+def run(db, processes=None, once=False):
+    """Process jobs until stopped (or, with once, until the queue is empty)"""
+    worker = f'{socket.gethostname()}:{os.getpid()}'
+    pool = ProcessPoolExecutor(max_workers=processes)
+    total = 0
+    try:
+        while True:
+            try:
+                done = process_batch(db, pool, worker)
+            except BrokenProcessPool:
+                stop_pool(pool)
+                pool = ProcessPoolExecutor(max_workers=processes)
+                continue
+            total += done
+            if not done:
+                if once:
+                    return total
+                time.sleep(POLL_INTERVAL)
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    processes = None
+    if '--processes' in args:
+        index = args.index('--processes')
+        try:
+            processes = int(args[index + 1])
+        except (IndexError, ValueError):
+            processes = 0
+        del args[index:index + 2]
+    if (processes is not None and processes < 1) or not set(args) <= {'--once', '--backfill'}:
+        print('Usage: python worker.py [--processes N] [--once] [--backfill]')
+        sys.exit(1)
+
+    from database import get_db_path
+    conn = sqlite3.connect(get_db_path(), timeout=30)
+    conn.row_factory = sqlite3.Row
+    if '--backfill' in args:
+        print(f'Queued {backfill(conn)} blob inspection(s)')
+    try:
+        processed = run(conn, processes, once='--once' in args)
+        print(f'Processed {processed} job(s)')
+    except KeyboardInterrupt:
+        pass
+    finally:
+        conn.close()